@@ -0,0 +1,147 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+from core.lru import TTLCache
+
+
+# The password hash is left out, the field is loaded from the database
+# if it is ever accessed on a cached user.
+SNAPSHOT_FIELDS = (
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+local_users = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_LOCAL_TTL
+)
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def get_user_snapshot(user_id):
+    """
+    Returns the cached fields of the user, looking in the process cache,
+    then in the shared cache and finally in the database.
+    """
+    key = user_cache_key(user_id)
+    snapshot = local_users.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = (
+            get_user_model()
+            .objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values(*SNAPSHOT_FIELDS)
+            .first()
+        )
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, settings.AUTH_USER_CACHE_TIMEOUT)
+
+    local_users.set(key, snapshot)
+    return snapshot
+
+
+def user_from_snapshot(snapshot):
+    user_model = get_user_model()
+    field_names = [
+        field.attname
+        for field in user_model._meta.concrete_fields
+        if field.attname in snapshot
+    ]
+    return user_model.from_db(
+        router.db_for_read(user_model),
+        field_names,
+        [snapshot[name] for name in field_names],
+    )
+
+
+def invalidate_user(user_id):
+    """
+    Drops the cached user. The shared cache is cleared again after commit,
+    so a snapshot taken while the transaction was open is dropped too.
+    Other processes may keep their copy for AUTH_USER_LOCAL_TTL seconds.
+    """
+    key = user_cache_key(user_id)
+    local_users.delete(key)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication which reads the user from a short-lived snapshot
+    instead of querying the database on every request.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        snapshot = get_user_snapshot(self.get_user_id(validated_token))
+        return self.check_snapshot(snapshot)
+
+    async def aauthenticate(self, request):
+        """
+        `authenticate` for async views; the user is looked up
+        in a thread only if it is not cached in the process.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        user_id = self.get_user_id(validated_token)
+        snapshot = local_users.get(user_cache_key(user_id))
+        if snapshot is None:
+            snapshot = await sync_to_async(get_user_snapshot)(user_id)
+        return self.check_snapshot(snapshot)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            )
+
+    def check_snapshot(self, snapshot):
+        if snapshot is None:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            )
+        if not snapshot["is_active"]:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+
+        return user_from_snapshot(snapshot)
@@ -0,0 +1,61 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuthentication, invalidate_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the authentication overhead per request of the plain "
+        "and the cached JWT authentication for a burst of requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:8]}@example.com",
+            password=uuid.uuid4().hex,
+        )
+        token = str(AccessToken.for_user(user))
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+        try:
+            for name, backend in (
+                ("plain", JWTAuthentication()),
+                ("cached", CachedJWTAuthentication()),
+            ):
+                invalidate_user(user.pk)
+                self.run(name, backend, request, options["requests"])
+        finally:
+            user.delete()
+
+    def run(self, name, backend, request, requests):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                start = time.perf_counter()
+                backend.authenticate(Request(request))
+                timings.append((time.perf_counter() - start) * 1_000_000)
+
+        timings.sort()
+        self.stdout.write(
+            f"{name}: {requests} requests, "
+            f"{len(queries)} queries, "
+            f"mean {statistics.mean(timings):.0f}us, "
+            f"p50 {timings[len(timings) // 2]:.0f}us, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.0f}us"
+        )
@@ -0,0 +1,10 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.authentication import invalidate_user
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def handle_user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
@@ -1,9 +1,16 @@
 from unittest import TestCase
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase as DjangoTestCase
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuthentication, local_users
+from accounts.schema import CachedJWTScheme
 
 
 REGISTER_URL = reverse("user:create")
@@ -132,3 +139,74 @@ class AccountsTests(TestCase):
 
     def tearDown(self):
         get_user_model().objects.all().delete()
+
+
+class CachedJWTAuthenticationTests(DjangoTestCase):
+    def setUp(self):
+        local_users.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="cached@test.com",
+            password="testpassword",
+            first_name="Cached",
+            last_name="User",
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def test_user_is_cached_between_requests(self):
+        self.client.get(MANAGE_URL)
+
+        with self.assertNumQueries(1):
+            # Only ManageUserView's own lookup hits the database.
+            response = self.client.get(MANAGE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], "cached@test.com")
+
+    def test_update_invalidates_cached_user(self):
+        self.client.get(MANAGE_URL)
+
+        response = self.client.patch(
+            MANAGE_URL,
+            {
+                "first_name": "Renamed",
+                "last_name": "User",
+                "password": "newpassword",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Renamed")
+        self.assertTrue(self.user.check_password("newpassword"))
+        self.assertEqual(
+            self.client.get(MANAGE_URL).data["first_name"], "Renamed"
+        )
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(MANAGE_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(MANAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_change_is_applied(self):
+        self.client.get(MANAGE_URL)
+
+        self.user.is_staff = True
+        self.user.save()
+
+        self.assertTrue(self.client.get(MANAGE_URL).data["is_staff"])
+
+    def test_schema_documents_the_authentication(self):
+        scheme = OpenApiAuthenticationExtension.get_match(
+            CachedJWTAuthentication()
+        )
+
+        self.assertIsInstance(scheme, CachedJWTScheme)
+        self.assertEqual(scheme.name, "jwtAuth")
@@ -1,7 +1,8 @@
+from django.contrib.auth import get_user_model
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from accounts.authentication import CachedJWTAuthentication
 from accounts.serializers import UserSerializer
 
 
@@ -12,7 +13,8 @@ class CreateUserView(generics.CreateAPIView):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
 
     def get_object(self):
-        return self.request.user
+        # request.user may be a cached snapshot, updates need the full row.
+        return get_user_model().objects.get(pk=self.request.user.pk)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BooksServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "books_service"
+
+    def ready(self):
+        import books_service.signals
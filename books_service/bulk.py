@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+
+from books_service.cache import invalidate_books
+from books_service.models import Book
+from books_service.serializers import BookImportSerializer
+from core.streaming import Echo
+
+
+FILE_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+
+
+def get_file_format(name, default=None):
+    """
+    Guesses the file format from the file name, e.g. `books.jsonl`.
+    """
+    extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    if extension in ("ndjson", "jsonl"):
+        return "ndjson"
+    if extension == "csv":
+        return "csv"
+    return default
+
+
+def read_rows(stream, file_format):
+    """
+    Yields (row number, data) for every row of a binary stream.
+    Data is None for NDJSON lines that are not JSON objects.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    if file_format == "csv":
+        yield from enumerate(csv.DictReader(text), start=1)
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield number, data if isinstance(data, dict) else None
+
+
+def import_books(rows, chunk_size=None):
+    """
+    Validates the rows like the book API does and upserts valid ones
+    by title in chunks. Returns the number of imported rows
+    and the errors of every rejected row.
+    """
+    chunk_size = chunk_size or settings.BOOK_IMPORT_CHUNK_SIZE
+    report = {"imported": 0, "errors": []}
+    chunk = {}
+
+    for number, data in rows:
+        if data is None:
+            report["errors"].append(
+                {"row": number, "errors": {"non_field_errors": ["Not JSON."]}}
+            )
+            continue
+
+        serializer = BookImportSerializer(data=data)
+        if not serializer.is_valid():
+            report["errors"].append(
+                {"row": number, "errors": serializer.errors}
+            )
+            continue
+
+        book = Book(**serializer.validated_data)
+        # A later row with the same title wins, like a later chunk would.
+        chunk.pop(book.title, None)
+        chunk[book.title] = book
+        if len(chunk) >= chunk_size:
+            report["imported"] += upsert_books(chunk.values())
+            chunk = {}
+
+    if chunk:
+        report["imported"] += upsert_books(chunk.values())
+    if report["imported"]:
+        invalidate_books()
+    return report
+
+
+def upsert_books(books):
+    books = list(books)
+    Book.objects.bulk_create(
+        books,
+        update_conflicts=True,
+        unique_fields=["title"],
+        update_fields=["author", "cover", "inventory", "daily_fee"],
+    )
+    return len(books)
+
+
+def export_books(file_format):
+    """
+    Yields the catalog as CSV or NDJSON lines,
+    reading books with a server-side cursor.
+    """
+    books = (
+        Book.objects.order_by("id")
+        .values_list("id", *FIELDS)
+        .iterator(chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE)
+    )
+
+    if file_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(("id", *FIELDS))
+        for book in books:
+            yield writer.writerow(book)
+        return
+
+    for book in books:
+        data = dict(zip(("id", *FIELDS), book))
+        data["daily_fee"] = str(data["daily_fee"])
+        yield json.dumps(data) + "\n"
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+CATALOG_GENERATION_KEY = "books:generation"
+HITS_KEY = "books:cache:hits"
+MISSES_KEY = "books:cache:misses"
+
+
+def book_generation_key(book_id):
+    return f"books:generation:{book_id}"
+
+
+def get_generations(keys):
+    """
+    Returns the current value of every generation counter.
+    A missing counter starts from the current time,
+    so it never matches a generation used before it was evicted.
+    """
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_books(book_id=None):
+    """
+    Invalidates the cached pages of one book, or of the whole catalog
+    when no book is given. The counter is bumped again after commit,
+    so pages cached while the transaction was open are dropped too.
+    """
+    key = (
+        CATALOG_GENERATION_KEY
+        if book_id is None
+        else book_generation_key(book_id)
+    )
+    bump_generation(key)
+    transaction.on_commit(lambda: bump_generation(key))
+
+
+def increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_cache_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = stats.get(HITS_KEY, 0)
+    misses = stats.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits else 0,
+    }
+
+
+class CachedReadMixin:
+    """
+    Read-through cache for GET requests of book views.
+    Responses carry an ETag, and `If-None-Match` is answered with 304.
+    Views of a single book also depend on the generation of that book,
+    so inventory changes do not invalidate the whole catalog.
+    """
+
+    cache_timeout = settings.BOOKS_CACHE_TIMEOUT
+
+    def get_cache_generation_keys(self):
+        keys = [CATALOG_GENERATION_KEY]
+        if "pk" in self.kwargs:
+            keys.append(book_generation_key(self.kwargs["pk"]))
+        return keys
+
+    def get_cache_key(self, request):
+        generations = get_generations(self.get_cache_generation_keys())
+        digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return (
+            f"books:{self.__class__.__name__}:"
+            f"{':'.join(map(str, generations))}:{digest}"
+        )
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+
+        if cached is None:
+            increment(MISSES_KEY)
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            body = json.dumps(response.data, cls=JSONEncoder)
+            etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+            cache.set(key, (etag, json.loads(body)), self.cache_timeout)
+            cache_status = "MISS"
+        else:
+            increment(HITS_KEY)
+            etag, data = cached
+            response = Response(data)
+            cache_status = "HIT"
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        response["ETag"] = etag
+        response["X-Cache"] = cache_status
+        return response
@@ -0,0 +1,116 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from books_service.models import Book
+from books_service.search import search_books
+
+
+WORDS = (
+    "shadow river garden winter silent empire broken crown ocean storm "
+    "forgotten city glass secret island midnight iron letter summer fire "
+    "hidden road mountain dream stone queen wolf night golden song"
+).split()
+
+SEED_SQL = """
+INSERT INTO {book_table} (title, author, cover, inventory, daily_fee)
+SELECT
+    initcap(words[1 + mod(g * 7, %(size)s)] || ' '
+        || words[1 + mod(g * 13, %(size)s)] || ' '
+        || words[1 + mod(g / %(size)s, %(size)s)]) || ' ' || g,
+    'Author ' || mod(g, 50000),
+    CASE WHEN mod(g, 2) = 0 THEN 'HARD' ELSE 'SOFT' END,
+    10,
+    1
+FROM generate_series(1, %(count)s) AS g, (SELECT %(words)s::text[] AS words) w
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the latency of the book search and fails if p95 is above "
+        "the threshold. Requires PostgreSQL; use --seed only "
+        "on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Insert this many books before searching.",
+        )
+        parser.add_argument("--queries", type=int, default=1000)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--max-p95",
+            type=float,
+            default=20.0,
+            help="Allowed p95 latency in milliseconds.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "The benchmark needs PostgreSQL (DJANGO_ENV=docker)."
+            )
+
+        if options["seed"]:
+            self.seed(options["seed"])
+
+        queries = self.get_queries(options["queries"])
+        search_books(queries[0], options["limit"])
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            search_books(query, options["limit"])
+            latencies.append(time.perf_counter() - started)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        self.stdout.write(
+            f"books={Book.objects.count()} queries={len(queries)} "
+            f"p50={p50:.1f}ms p95={p95:.1f}ms"
+        )
+
+        if p95 > options["max_p95"]:
+            raise CommandError(
+                f"p95 latency {p95:.1f}ms is above {options['max_p95']}ms."
+            )
+        self.stdout.write(
+            self.style.SUCCESS("Search latency is within budget.")
+        )
+
+    def get_queries(self, count):
+        """
+        Mixes exact words, two-word phrases, author names and typos.
+        """
+        rng = random.Random(0)
+        queries = []
+        for index in range(count):
+            word = rng.choice(WORDS)
+            kind = index % 4
+            if kind == 0:
+                queries.append(word)
+            elif kind == 1:
+                queries.append(f"{word} {rng.choice(WORDS)}")
+            elif kind == 2:
+                queries.append(f"Author {rng.randrange(50000)}")
+            else:
+                position = rng.randrange(1, len(word))
+                queries.append(word[:position] + word[position + 1 :])
+        return queries
+
+    def seed(self, count):
+        book_table = Book._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SEED_SQL.format(book_table=book_table),
+                {"size": len(WORDS), "count": count, "words": WORDS},
+            )
+            cursor.execute(f"ANALYZE {book_table}")
+        self.stdout.write(f"Seeded {count} books.")
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books_service.bulk import (
+    FILE_FORMATS,
+    get_file_format,
+    import_books,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Upserts books by title from a CSV or NDJSON file "
+        "and prints the errors of rejected rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--file-format", choices=list(FILE_FORMATS))
+        parser.add_argument("--chunk-size", type=int)
+
+    def handle(self, *args, **options):
+        file_format = options["file_format"] or get_file_format(
+            options["path"]
+        )
+        if file_format is None:
+            raise CommandError("Pass --file-format, it can't be guessed.")
+
+        with open(options["path"], "rb") as stream:
+            report = import_books(
+                read_rows(stream, file_format), options["chunk_size"]
+            )
+
+        for error in report["errors"]:
+            self.stderr.write(
+                f"Row {error['row']}: {json.dumps(error['errors'])}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['imported']} books, "
+                f"rejected {len(report['errors'])} rows."
+            )
+        )
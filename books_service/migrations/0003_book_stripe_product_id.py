@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_service', '0002_alter_book_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='stripe_product_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:40
+
+from django.db import migrations
+
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS book_search_vector_idx
+    ON books_service_book USING gin (
+        (setweight(to_tsvector('simple'::regconfig, title), 'A') ||
+         setweight(to_tsvector('simple'::regconfig, author), 'B'))
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS book_title_trgm_idx
+    ON books_service_book USING gin (title gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS book_author_trgm_idx
+    ON books_service_book USING gin (author gin_trgm_ops)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS book_search_vector_idx",
+    "DROP INDEX IF EXISTS book_title_trgm_idx",
+    "DROP INDEX IF EXISTS book_author_trgm_idx",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_service_book_fts USING fts5(
+        title,
+        author,
+        content='books_service_book',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_service_book_fts_insert
+    AFTER INSERT ON books_service_book BEGIN
+        INSERT INTO books_service_book_fts (rowid, title, author)
+        VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_service_book_fts_delete
+    AFTER DELETE ON books_service_book BEGIN
+        INSERT INTO books_service_book_fts
+            (books_service_book_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_service_book_fts_update
+    AFTER UPDATE OF title, author ON books_service_book BEGIN
+        INSERT INTO books_service_book_fts
+            (books_service_book_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_service_book_fts (rowid, title, author)
+        VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    INSERT INTO books_service_book_fts (books_service_book_fts)
+    VALUES ('rebuild')
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_service_book_fts_insert",
+    "DROP TRIGGER IF EXISTS books_service_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_service_book_fts_update",
+    "DROP TABLE IF EXISTS books_service_book_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books_service", "0003_book_stripe_product_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(
+                {
+                    "postgresql": POSTGRESQL_FORWARD,
+                    "sqlite": SQLITE_FORWARD,
+                }
+            ),
+            run_for_vendor(
+                {
+                    "postgresql": POSTGRESQL_BACKWARD,
+                    "sqlite": SQLITE_BACKWARD,
+                }
+            ),
+        ),
+    ]
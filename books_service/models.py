@@ -1,13 +1,50 @@
 from django.db import models
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from enum import Enum
 
+from books_service.cache import invalidate_books
+
 
 class Cover(Enum):
     HARD = "HARD"
     SOFT = "SOFT"
 
 
+class BookQuerySet(models.QuerySet):
+    def take_copy(self, book_id):
+        """
+        Atomically takes one copy of the book from the inventory.
+        Returns False if the book is out of stock.
+        """
+        taken = self.filter(pk=book_id, inventory__gt=0).update(
+            inventory=F("inventory") - 1
+        )
+        if taken:
+            invalidate_books(book_id)
+        return bool(taken)
+
+    def return_copy(self, book_id):
+        """
+        Atomically puts one copy of the book back to the inventory.
+        """
+        returned = self.filter(pk=book_id).update(inventory=F("inventory") + 1)
+        if returned:
+            invalidate_books(book_id)
+        return bool(returned)
+
+    def return_copies(self, counts):
+        """
+        Puts {book_id: copies} back to the inventory, one UPDATE per book
+        in the order of the ids, so concurrent callers do not deadlock.
+        """
+        for book_id, copies in sorted(counts.items()):
+            if self.filter(pk=book_id).update(
+                inventory=F("inventory") + copies
+            ):
+                invalidate_books(book_id)
+
+
 class Book(models.Model):
     title = models.CharField(max_length=255, unique=True)
     author = models.CharField(max_length=255)
@@ -17,6 +54,9 @@ class Book(models.Model):
     )
     inventory = models.PositiveIntegerField()
     daily_fee = models.DecimalField(max_digits=6, decimal_places=2)
+    stripe_product_id = models.CharField(max_length=255, blank=True, null=True)
+
+    objects = BookQuerySet.as_manager()
 
     def __str__(self):
         return self.title
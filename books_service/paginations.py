@@ -1,7 +1,16 @@
 from rest_framework.pagination import PageNumberPagination
 
+from core.paginations import OptInKeysetPagination
 
-class BooksPagination(PageNumberPagination):
+
+class BooksPagination(OptInKeysetPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    ordering = ("title", "id")
+
+
+class BookSearchPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 50
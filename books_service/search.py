@@ -0,0 +1,93 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from books_service.models import Book
+
+
+# Must match the expression of the GIN index created by the migration.
+SEARCH_VECTOR_SQL = (
+    "(setweight(to_tsvector('simple'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, author), 'B'))"
+)
+FTS_TABLE = "books_service_book_fts"
+
+
+def search_books(query, limit=None):
+    """
+    Returns up to `limit` books matching the query by title or author,
+    best matches first.
+    """
+    query = query.strip()
+    limit = limit or settings.BOOK_SEARCH_LIMIT
+    if not query:
+        return []
+
+    if connection.vendor == "postgresql":
+        return search_books_postgresql(query, limit)
+    if connection.vendor == "sqlite":
+        return search_books_sqlite(query, limit)
+
+    return list(
+        Book.objects.filter(
+            Q(title__icontains=query) | Q(author__icontains=query)
+        ).order_by("title")[:limit]
+    )
+
+
+def search_books_postgresql(query, limit):
+    """
+    Full-text search over title and author combined with `pg_trgm`
+    similarity, so misspelled queries still find the book.
+    """
+    vector = RawSQL(SEARCH_VECTOR_SQL, [], output_field=SearchVectorField())
+    search_query = SearchQuery(query, config="simple", search_type="websearch")
+
+    return list(
+        Book.objects.annotate(search=vector)
+        .filter(
+            Q(search=search_query)
+            | Q(title__trigram_similar=query)
+            | Q(author__trigram_similar=query)
+        )
+        .annotate(
+            rank=SearchRank(vector, search_query)
+            + Greatest(
+                TrigramSimilarity("title", query),
+                TrigramSimilarity("author", query),
+                output_field=FloatField(),
+            )
+        )
+        .order_by("-rank", "id")[:limit]
+    )
+
+
+def search_books_sqlite(query, limit):
+    """
+    FTS5 fallback for local development. Every word is matched as a prefix.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+
+    match = " ".join(f'"{word}"*' for word in words)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 5.0) LIMIT %s",
+            [match, limit],
+        )
+        book_ids = [row[0] for row in cursor.fetchall()]
+
+    books = Book.objects.in_bulk(book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books]
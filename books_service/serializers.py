@@ -40,5 +40,18 @@ class BookDetailSerializer(serializers.ModelSerializer):
 
     def validate_daily_fee(self, value):
         if value <= 0:
-            raise serializers.ValidationError("Daily fee must be greater than 0.")
+            raise serializers.ValidationError(
+                "Daily fee must be greater than 0."
+            )
         return value
+
+
+class BookImportSerializer(BookDetailSerializer):
+    """
+    Validates one row of a bulk import. Existing titles are updated,
+    so the unique validator of the title is left out.
+    """
+
+    class Meta(BookDetailSerializer.Meta):
+        fields = ("title", "author", "cover", "inventory", "daily_fee")
+        extra_kwargs = {"title": {"validators": []}}
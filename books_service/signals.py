@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from books_service.cache import invalidate_books
+from books_service.models import Book
+
+
+@receiver([post_save, post_delete], sender=Book)
+def handle_book_changed(sender, instance, **kwargs):
+    invalidate_books()
@@ -1,9 +1,13 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from books_service.models import Book, Cover
 from django.core.exceptions import ValidationError
 
 from rest_framework.test import APITestCase, APIClient
+from books_service.search import search_books
 from books_service.serializers import BookDetailSerializer
 from rest_framework import status
 from django.urls import reverse
@@ -47,6 +51,30 @@ class BookModelTest(TestCase):
             self.fail("Book model raised ValidationError")
 
 
+class BookInventoryTest(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Book4",
+            author="Author4",
+            cover=Cover.SOFT.name,
+            inventory=1,
+            daily_fee=5.00,
+        )
+
+    def test_take_copy_until_out_of_stock(self):
+        self.assertTrue(Book.objects.take_copy(self.book.id))
+        self.assertFalse(Book.objects.take_copy(self.book.id))
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_return_copy(self):
+        self.assertTrue(Book.objects.return_copy(self.book.id))
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 2)
+
+
 class BookSerializerTest(APITestCase):
     def test_daily_fee_must_be_positive(self):
         data = {
@@ -190,6 +218,43 @@ class BookListViewTest(APITestCase):
         self.assertEqual(response.data["results"][0]["title"], self.book.title)
 
 
+class BookKeysetPaginationTest(APITestCase):
+    def setUp(self):
+        self.url = reverse("book:book-list")
+        Book.objects.bulk_create(
+            Book(
+                title=f"Book {letter}",
+                author="Test Author",
+                cover=Cover.SOFT.name,
+                inventory=10,
+                daily_fee=5.00,
+            )
+            for letter in "DBECA"
+        )
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(self.url, {"page_size": 2})
+        self.assertEqual(response.data["count"], 5)
+
+    def test_cursor_pagination_walks_titles_in_order(self):
+        response = self.client.get(
+            self.url, {"pagination": "cursor", "page_size": 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+
+        titles = []
+        while True:
+            titles += [book["title"] for book in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(
+            titles, ["Book A", "Book B", "Book C", "Book D", "Book E"]
+        )
+
+
 class BookDetailViewTest(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -320,4 +385,244 @@ class BookPermissionTest(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 1)
-        self.assertEqual(response.data["results"][0]["title"], self.book.title)
\ No newline at end of file
+        self.assertEqual(response.data["results"][0]["title"], self.book.title)
+
+
+class BookCacheTest(APITestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Cached Book",
+            author="Test Author",
+            cover=Cover.SOFT.name,
+            inventory=10,
+            daily_fee=5.00,
+        )
+        self.list_url = reverse("book:book-list")
+        self.detail_url = reverse("book:book-detail", args=[self.book.pk])
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.detail_url)
+
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.list_url)["ETag"]
+
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_book_update_invalidates_catalog(self):
+        self.client.get(self.list_url)
+        admin = get_user_model().objects.create_user(
+            email="admin@example.com", password="testpassword", is_staff=True
+        )
+        self.client.force_authenticate(admin)
+
+        self.client.patch(
+            reverse("book:book-update", args=[self.book.pk]),
+            {"title": "Renamed Book"},
+            format="json",
+        )
+        response = self.client.get(self.list_url)
+
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["title"], "Renamed Book")
+
+    def test_inventory_change_invalidates_only_the_book(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        Book.objects.take_copy(self.book.pk)
+
+        self.assertEqual(self.client.get(self.list_url)["X-Cache"], "HIT")
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["inventory"], 9)
+
+    def test_cache_stats_are_admin_only(self):
+        url = reverse("book:book-cache-stats")
+        self.client.get(self.detail_url)
+        self.client.get(self.detail_url)
+
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="admin@example.com",
+                password="testpassword",
+                is_staff=True,
+            )
+        )
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data["hits"], 1)
+        self.assertGreaterEqual(response.data["misses"], 1)
+
+
+
+class BookSearchTest(APITestCase):
+    def setUp(self):
+        self.url = reverse("book:book-search")
+        for title, author in (
+            ("Dune", "Frank Herbert"),
+            ("Dune Messiah", "Frank Herbert"),
+            ("The Hobbit", "John Tolkien"),
+            ("Children of Dune", "Frank Herbert"),
+        ):
+            Book.objects.create(
+                title=title,
+                author=author,
+                cover=Cover.SOFT.name,
+                inventory=10,
+                daily_fee=5.00,
+            )
+
+    def test_search_by_title_and_author(self):
+        response = self.client.get(self.url, {"q": "dune"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(response.data["results"][0]["title"], "Dune")
+
+        response = self.client.get(self.url, {"q": "tolk"})
+
+        self.assertEqual(
+            [book["title"] for book in response.data["results"]],
+            ["The Hobbit"],
+        )
+
+    def test_search_limit(self):
+        response = self.client.get(self.url, {"q": "herbert", "limit": 2})
+        self.assertEqual(response.data["count"], 2)
+
+    def test_search_follows_book_changes(self):
+        Book.objects.filter(title="The Hobbit").delete()
+        book = Book.objects.get(title="Dune")
+        book.title = "Arrakis"
+        book.save()
+
+        response = self.client.get(self.url, {"q": "hobbit"})
+        self.assertEqual(response.data["count"], 0)
+
+        response = self.client.get(self.url, {"q": "arrakis"})
+        self.assertEqual(response.data["results"][0]["id"], book.id)
+
+    def test_empty_query(self):
+        response = self.client.get(self.url, {"q": "  "})
+        self.assertEqual(response.data["count"], 0)
+
+
+class BookBulkTest(APITestCase):
+    def setUp(self):
+        self.import_url = reverse("book:book-import")
+        self.export_url = reverse("book:book-export")
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@test.com", password="adminpass"
+        )
+        self.client.force_authenticate(self.admin)
+        Book.objects.create(
+            title="Dune",
+            author="Frank Herbert",
+            cover=Cover.SOFT.name,
+            inventory=1,
+            daily_fee=1.00,
+        )
+
+    def upload(self, name, content, **data):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post(
+            self.import_url, {"file": file, **data}, format="multipart"
+        )
+
+    def test_csv_import_upserts_and_reports_errors(self):
+        response = self.upload(
+            "books.csv",
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Frank Herbert,HARD,7,2.50\n"
+            "Solaris,Stanislaw Lem,SOFT,3,1.20\n"
+            "Broken,R2D2,SOFT,-1,0\n"
+            "Solaris,Stanislaw Lem,SOFT,4,1.20\n",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["imported"], 2)
+        [error] = response.data["errors"]
+        self.assertEqual(error["row"], 3)
+        self.assertEqual(
+            set(error["errors"]), {"author", "inventory", "daily_fee"}
+        )
+        dune = Book.objects.get(title="Dune")
+        self.assertEqual((dune.cover, dune.inventory), ("HARD", 7))
+        self.assertEqual(Book.objects.get(title="Solaris").inventory, 4)
+
+    def test_ndjson_import(self):
+        response = self.upload(
+            "books.data",
+            '{"title": "Solaris", "author": "Stanislaw Lem", '
+            '"cover": "SOFT", "inventory": 3, "daily_fee": "1.20"}\n'
+            "not json\n",
+            file_format="ndjson",
+        )
+
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual(response.data["errors"][0]["row"], 2)
+        self.assertEqual(
+            [book.title for book in search_books("solaris")], ["Solaris"]
+        )
+
+    def test_import_invalidates_cached_catalog(self):
+        self.client.get(reverse("book:book-list"))
+
+        self.upload(
+            "books.jsonl",
+            '{"title": "Solaris", "author": "Stanislaw Lem", '
+            '"cover": "SOFT", "inventory": 3, "daily_fee": "1.20"}\n',
+        )
+        response = self.client.get(reverse("book:book-list"))
+
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["count"], 2)
+
+    def test_export_streams_catalog(self):
+        response = self.client.get(self.export_url)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            [
+                "id,title,author,cover,inventory,daily_fee",
+                f"{Book.objects.get().id},Dune,Frank Herbert,SOFT,1,1.00",
+            ],
+        )
+
+        response = self.client.get(self.export_url, {"file_format": "ndjson"})
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(json.loads(lines[0])["daily_fee"], "1.00")
+
+    def test_bulk_endpoints_are_admin_only(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="user@test.com", password="userpass"
+            )
+        )
+
+        self.assertEqual(
+            self.upload("books.csv", "title\n").status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        self.assertEqual(
+            self.client.get(self.export_url).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
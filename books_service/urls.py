@@ -2,17 +2,27 @@ from django.urls import path
 from books_service.views import (
     BookCreateView,
     BookListView,
+    BookSearchView,
     BookDetailView,
     BookUpdateView,
     BookDeleteView,
+    BookCacheStatsView,
+    BookImportView,
+    BookExportView,
 )
 
 app_name = "book"
 
 urlpatterns = [
     path("", BookListView.as_view(), name="book-list"),
+    path("search/", BookSearchView.as_view(), name="book-search"),
     path("<int:pk>/", BookDetailView.as_view(), name="book-detail"),
     path("create/", BookCreateView.as_view(), name="book-create"),
     path("<int:pk>/update/", BookUpdateView.as_view(), name="book-update"),
     path("<int:pk>/delete/", BookDeleteView.as_view(), name="book-delete"),
+    path("import/", BookImportView.as_view(), name="book-import"),
+    path("export/", BookExportView.as_view(), name="book-export"),
+    path(
+        "cache-stats/", BookCacheStatsView.as_view(), name="book-cache-stats"
+    ),
 ]
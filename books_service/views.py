@@ -1,8 +1,27 @@
-from rest_framework import generics
+from django.conf import settings
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from books_service.bulk import (
+    FILE_FORMATS,
+    export_books,
+    get_file_format,
+    import_books,
+    read_rows,
+)
+from books_service.cache import CachedReadMixin, get_cache_stats
 from books_service.models import Book
-from books_service.paginations import BooksPagination
+from books_service.paginations import BookSearchPagination, BooksPagination
 from books_service.serializers import BookListSerializer, BookDetailSerializer
 from books_service.permissions import IsAdminOrReadOnly
+from books_service.search import search_books
+from core.streaming import streaming_response
+
 
 class BookCreateView(generics.CreateAPIView):
     queryset = Book.objects.all()
@@ -10,14 +29,44 @@ class BookCreateView(generics.CreateAPIView):
     permission_classes = (IsAdminOrReadOnly,)
 
 
-class BookListView(generics.ListAPIView):
+class BookListView(CachedReadMixin, generics.ListAPIView):
     queryset = Book.objects.all()
     serializer_class = BookListSerializer
     pagination_class = BooksPagination
     permission_classes = (IsAdminOrReadOnly,)
 
 
-class BookDetailView(generics.RetrieveAPIView):
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="q", description="Words of the title or the author"
+        ),
+        OpenApiParameter(
+            name="limit",
+            type=int,
+            description=(
+                "Number of best matches to paginate, "
+                f"at most {settings.BOOK_SEARCH_LIMIT}"
+            ),
+        ),
+    ]
+)
+class BookSearchView(CachedReadMixin, generics.ListAPIView):
+    serializer_class = BookListSerializer
+    pagination_class = BookSearchPagination
+    permission_classes = (IsAdminOrReadOnly,)
+
+    def get_queryset(self):
+        limit = self.request.query_params.get("limit", "")
+        return search_books(
+            self.request.query_params.get("q", ""),
+            min(int(limit), settings.BOOK_SEARCH_LIMIT)
+            if limit.isdigit()
+            else None,
+        )
+
+
+class BookDetailView(CachedReadMixin, generics.RetrieveAPIView):
     queryset = Book.objects.all()
     serializer_class = BookDetailSerializer
     permission_classes = (IsAdminOrReadOnly,)
@@ -29,8 +78,86 @@ class BookUpdateView(generics.UpdateAPIView):
     permission_classes = (IsAdminOrReadOnly,)
 
 
-
 class BookDeleteView(generics.DestroyAPIView):
     queryset = Book.objects.all()
     serializer_class = BookDetailSerializer
     permission_classes = (IsAdminOrReadOnly,)
+
+
+class BookCacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_cache_stats())
+
+
+@extend_schema(
+    request={
+        "multipart/form-data": {
+            "type": "object",
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "file_format": {"type": "string", "enum": list(FILE_FORMATS)},
+            },
+        }
+    },
+    responses=OpenApiTypes.OBJECT,
+)
+class BookImportView(APIView):
+    """
+    Upserts books by title from an uploaded CSV or NDJSON file
+    and reports the errors of rejected rows.
+    """
+
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"file": "This field is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        file_format = request.data.get("file_format") or get_file_format(
+            upload.name
+        )
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {"file_format": f"Use one of: {', '.join(FILE_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(import_books(read_rows(upload, file_format)))
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="file_format", enum=list(FILE_FORMATS), default="csv"
+        )
+    ],
+    responses=OpenApiTypes.BINARY,
+)
+class BookExportView(APIView):
+    """
+    Streams the whole catalog as CSV or NDJSON.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {"file_format": f"Use one of: {', '.join(FILE_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return streaming_response(
+            request,
+            export_books(file_format),
+            content_type=FILE_FORMATS[file_format],
+            filename=f"books.{file_format}",
+        )
@@ -6,4 +6,5 @@ class BorrowingConfig(AppConfig):
     name = "borrowing_service"
 
     def ready(self):
+        import borrowing_service.checks
         import borrowing_service.signals
@@ -0,0 +1,62 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+
+from borrowing_service.idempotency import (
+    REPLAYED_HEADER,
+    IdempotentRequest,
+)
+from borrowing_service.models import Borrowing
+from borrowing_service.serializers import BorrowingCreateSerializer
+from core.async_views import async_api_view, parse_json
+
+
+def save_borrowing(data, user):
+    """
+    Validates and creates the borrowing. The inventory, the borrowing
+    and its payment are written in one transaction, which the async ORM
+    cannot open, so this runs in a thread as a whole.
+    """
+    serializer = BorrowingCreateSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save(user=user)
+    return serializer.data
+
+
+@async_api_view(["POST"])
+async def create_borrowing(request):
+    data = parse_json(request)
+    idempotent = IdempotentRequest.from_request(request, data)
+    if idempotent is None:
+        borrowing = await sync_to_async(save_borrowing)(data, request.user)
+        return JsonResponse(borrowing, status=status.HTTP_201_CREATED)
+
+    stored, replayed = await idempotent.arun(
+        lambda: (status.HTTP_201_CREATED, save_borrowing(data, request.user))
+    )
+    response = JsonResponse(stored["response"], status=stored["status_code"])
+    if replayed:
+        response[REPLAYED_HEADER] = "true"
+    return response
+
+
+@async_api_view(["POST"])
+async def return_borrowing(request, pk):
+    borrowings = Borrowing.objects.select_related("book").only(
+        "id", "book__title"
+    )
+    if not request.user.is_superuser:
+        borrowings = borrowings.filter(user=request.user)
+
+    try:
+        borrowing = await borrowings.aget(pk=pk)
+    except Borrowing.DoesNotExist:
+        raise exceptions.NotFound()
+
+    if not await sync_to_async(borrowing.return_book)():
+        raise exceptions.ValidationError(
+            {borrowing.book.title: "This book is already returned"}
+        )
+    return JsonResponse(
+        {"detail": f"{borrowing.book.title} successfully returned!"}
+    )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core import checks
+
+from payments_service.models import MIN_SESSION_LIFETIME
+
+
+@checks.register(checks.Tags.compatibility)
+def check_hold_ttl(app_configs, **kwargs):
+    """
+    Checkout sessions cannot expire sooner than Stripe allows, so a
+    shorter hold would release copies whose session can still be paid.
+    """
+    if settings.BORROWING_HOLD_TTL >= MIN_SESSION_LIFETIME:
+        return []
+    return [
+        checks.Error(
+            "BORROWING_HOLD_TTL is shorter than the lifetime of a Stripe "
+            "checkout session.",
+            hint=(
+                "Set BORROWING_HOLD_MINUTES to at least "
+                f"{MIN_SESSION_LIFETIME.seconds // 60}."
+            ),
+            id="borrowing_service.E001",
+        )
+    ]
@@ -0,0 +1,79 @@
+import csv
+import json
+from itertools import groupby
+
+from django.conf import settings
+
+from core.streaming import Echo
+
+
+FILE_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+BORROWING_COLUMNS = {
+    "id": "id",
+    "borrow_date": "borrow_date",
+    "expected_return_date": "expected_return_date",
+    "actual_return_date": "actual_return_date",
+    "book_id": "book_id",
+    "book_title": "book__title",
+    "book_author": "book__author",
+    "book_daily_fee": "book__daily_fee",
+    "user_id": "user_id",
+    "user_email": "user__email",
+}
+PAYMENT_COLUMNS = {
+    "payment_id": "payments__id",
+    "payment_type": "payments__type",
+    "payment_status": "payments__status",
+    "payment_money_to_pay": "payments__money_to_pay",
+}
+
+
+def get_rows(queryset):
+    """
+    Yields one dict per payment of every borrowing, or one dict with empty
+    payment columns for borrowings without payments, reading the joined
+    rows with a server-side cursor.
+    """
+    columns = {**BORROWING_COLUMNS, **PAYMENT_COLUMNS}
+    rows = (
+        queryset.order_by("id", "payments__id")
+        .values_list(*columns.values())
+        .iterator(chunk_size=settings.BORROWING_EXPORT_CHUNK_SIZE)
+    )
+    for row in rows:
+        yield dict(zip(columns, row))
+
+
+def export_csv(queryset):
+    writer = csv.writer(Echo())
+    columns = (*BORROWING_COLUMNS, *PAYMENT_COLUMNS)
+    yield writer.writerow(columns)
+    for row in get_rows(queryset):
+        yield writer.writerow(row[column] for column in columns)
+
+
+def export_ndjson(queryset):
+    """
+    Yields one JSON object per borrowing with its payments nested.
+    """
+    for _, rows in groupby(get_rows(queryset), key=lambda row: row["id"]):
+        rows = list(rows)
+        borrowing = {column: rows[0][column] for column in BORROWING_COLUMNS}
+        borrowing["payments"] = [
+            {
+                column.removeprefix("payment_"): row[column]
+                for column in PAYMENT_COLUMNS
+            }
+            for row in rows
+            if row["payment_id"] is not None
+        ]
+        yield json.dumps(borrowing, default=str) + "\n"
+
+
+def export_borrowings(queryset, file_format):
+    if file_format == "csv":
+        return export_csv(queryset)
+    return export_ndjson(queryset)
@@ -1,23 +1,41 @@
+from django.db.models import DateField, Q
+from django.db.models.functions import Cast, Now
 from django_filters import rest_framework
 
 from borrowing_service.models import Borrowing
 
 
+def overdue_condition():
+    """
+    Active borrowings whose expected return date has passed,
+    compared against the current date of the database.
+    """
+    return Q(
+        actual_return_date__isnull=True,
+        expected_return_date__lt=Cast(Now(), output_field=DateField()),
+    )
+
+
 class BorrowingFilter(rest_framework.FilterSet):
     is_active = rest_framework.BooleanFilter(
-        method="filter_is_active", label="Returned"
+        method="filter_is_active", label="Active"
+    )
+    overdue = rest_framework.BooleanFilter(
+        method="filter_overdue", label="Overdue"
     )
     user_id = rest_framework.NumberFilter(field_name="user__id")
+    borrow_date = rest_framework.DateFromToRangeFilter(
+        label="Borrow date range"
+    )
 
     class Meta:
         model = Borrowing
-        fields = ("is_active", "user_id")
+        fields = ("is_active", "overdue", "user_id", "borrow_date")
 
     def filter_is_active(self, queryset, name, value):
+        return queryset.filter(actual_return_date__isnull=value)
+
+    def filter_overdue(self, queryset, name, value):
         if value:
-            return queryset.filter(
-                borrow_date__isnull=False, actual_return_date__isnull=True
-            ).distinct()
-        return queryset.extend(
-            borrow_date__isnull=False, actual_return_date__isnull=True
-        ).distinct()
+            return queryset.filter(overdue_condition())
+        return queryset.exclude(overdue_condition())
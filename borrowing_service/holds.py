@@ -0,0 +1,166 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from books_service.models import Book
+from borrowing_service.models import Borrowing
+from core.async_clients import get_redis
+from payments_service.models import Payment, StatusChoices, TypeChoices
+from telegram_bot.redis_client import redis_client
+
+
+# Sorted set of the borrowings waiting for their payment,
+# scored by the timestamp their hold expires at.
+HOLDS_KEY = "borrowings:holds"
+
+# Pops up to ARGV[2] holds that expired at ARGV[1].
+POP_EXPIRED_SCRIPT = """
+local ids = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2]
+)
+if #ids > 0 then
+    redis.call("ZREM", KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+pop_expired_script = redis_client.register_script(POP_EXPIRED_SCRIPT)
+
+
+def hold_deadline():
+    return timezone.now() + settings.BORROWING_HOLD_TTL
+
+
+def add_hold(borrowing):
+    """
+    Schedules the release of the copy once the transaction
+    that took it has committed.
+    """
+    transaction.on_commit(
+        lambda: redis_client.zadd(
+            HOLDS_KEY, {borrowing.id: borrowing.hold_expires_at.timestamp()}
+        )
+    )
+
+
+def extend_hold(borrowing, expires_at):
+    """
+    Keeps the copy until `expires_at`, e.g. while the checkout session
+    made for the hold can still be paid.
+    """
+    borrowing.hold_expires_at = expires_at
+    borrowing.save(update_fields=("hold_expires_at",))
+    add_hold(borrowing)
+
+
+def remove_holds(borrowing_ids):
+    """
+    Drops the holds from the sorted set once the transaction
+    that ended them has committed.
+    """
+    transaction.on_commit(lambda: redis_client.zrem(HOLDS_KEY, *borrowing_ids))
+
+
+def confirm_holds(borrowing_ids):
+    """
+    Turns the holds of paid borrowings into confirmed borrowings.
+    """
+    if not borrowing_ids:
+        return
+    Borrowing.objects.filter(
+        pk__in=borrowing_ids, hold_expires_at__isnull=False
+    ).update(hold_expires_at=None)
+    remove_holds(borrowing_ids)
+
+
+async def aconfirm_hold(borrowing_id):
+    await Borrowing.objects.filter(
+        pk=borrowing_id, hold_expires_at__isnull=False
+    ).aupdate(hold_expires_at=None)
+    await get_redis().zrem(HOLDS_KEY, borrowing_id)
+
+
+def pop_expired(limit, now=None):
+    now = now or timezone.now()
+    return [
+        int(borrowing_id)
+        for borrowing_id in pop_expired_script(
+            keys=(HOLDS_KEY,), args=(now.timestamp(), limit)
+        )
+    ]
+
+
+def release_holds(borrowing_ids, now=None):
+    """
+    Puts back the copies of the expired holds that were not paid:
+    the borrowing is closed on the day it was made and its payment
+    expires, together with the inventory in one transaction.
+    Returns the number of holds released.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        holds = list(
+            Borrowing.objects.select_for_update(skip_locked=True)
+            .filter(
+                pk__in=borrowing_ids,
+                hold_expires_at__lte=now,
+                actual_return_date__isnull=True,
+            )
+            .values_list("id", "book_id")
+        )
+        # Payments confirmed just before the hold expired keep the copy.
+        paid = set(
+            Payment.objects.filter(
+                borrowing_id__in=[borrowing_id for borrowing_id, _ in holds],
+                status=StatusChoices.PAID.value,
+            ).values_list("borrowing_id", flat=True)
+        )
+        if paid:
+            confirm_holds(paid)
+        holds = [hold for hold in holds if hold[0] not in paid]
+        if not holds:
+            return 0
+
+        released = [borrowing_id for borrowing_id, _ in holds]
+        Borrowing.objects.filter(pk__in=released).update(
+            hold_expires_at=None, actual_return_date=F("borrow_date")
+        )
+        Payment.objects.filter(
+            borrowing_id__in=released,
+            type=TypeChoices.PAYMENT.value,
+            status__in=(
+                StatusChoices.PENDING_SESSION.value,
+                StatusChoices.PENDING.value,
+            ),
+        ).update(status=StatusChoices.EXPIRED.value)
+        Book.objects.return_copies(Counter(book_id for _, book_id in holds))
+    return len(released)
+
+
+def release_expired_holds(batch_size=None):
+    """
+    Releases the expired holds popped from the sorted set in batches.
+    Holds that missed it, e.g. because Redis was down when they were
+    made, are found through the index on `hold_expires_at` once they
+    are BORROWING_HOLD_GRACE late. Returns the number of holds released.
+    """
+    batch_size = batch_size or settings.BORROWING_HOLD_BATCH_SIZE
+    released = 0
+    while borrowing_ids := pop_expired(batch_size):
+        released += release_holds(borrowing_ids)
+
+    late = timezone.now() - settings.BORROWING_HOLD_GRACE
+    while borrowing_ids := list(
+        Borrowing.objects.filter(hold_expires_at__lte=late)
+        .order_by("hold_expires_at")
+        .values_list("id", flat=True)[:batch_size]
+    ):
+        count = release_holds(borrowing_ids)
+        if not count:
+            # Locked by another worker or paid; the next run goes on.
+            break
+        released += count
+    return released
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from rest_framework import exceptions, status
+
+from borrowing_service.models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+POLL_INTERVAL = 0.05
+
+
+class RequestInProgress(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        "A request with this Idempotency-Key is still in progress."
+    )
+    default_code = "idempotency_key_in_progress"
+
+
+class KeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was used with a different request."
+    default_code = "idempotency_key_reused"
+
+
+class IdempotentRequest:
+    """
+    A request of the user sent with an `Idempotency-Key`.
+
+    The first successful response is stored in the cache and,
+    in the same transaction as the work, in the database. Duplicates
+    sent meanwhile wait on a short cache lock and replay it. Failed
+    requests are not stored: they changed nothing and may be retried.
+    """
+
+    def __init__(self, user, key, payload):
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise exceptions.ValidationError(
+                {IDEMPOTENCY_HEADER: "Ensure this value is shorter."}
+            )
+        self.user_id = user.id
+        self.key = key
+        self.fingerprint = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        self.cache_key = f"idempotency:{self.user_id}:{digest}"
+        self.lock_key = f"{self.cache_key}:lock"
+
+    @classmethod
+    def from_request(cls, request, payload):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return None
+        return cls(request.user, key, payload)
+
+    def records(self):
+        return IdempotencyKey.objects.filter(
+            user_id=self.user_id, key=self.key
+        ).values("fingerprint", "status_code", "response")
+
+    def check(self, stored):
+        if stored is not None and stored["fingerprint"] != self.fingerprint:
+            raise KeyReused()
+        return stored
+
+    def lookup(self):
+        stored = cache.get(self.cache_key)
+        if stored is None:
+            stored = self.records().first()
+            if stored is not None:
+                cache.set(self.cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+        return self.check(stored)
+
+    async def alookup(self):
+        stored = await cache.aget(self.cache_key)
+        if stored is None:
+            stored = await self.records().afirst()
+            if stored is not None:
+                await cache.aset(
+                    self.cache_key, stored, settings.IDEMPOTENCY_KEY_TTL
+                )
+        return self.check(stored)
+
+    def acquire(self):
+        return cache.add(self.lock_key, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT)
+
+    async def aacquire(self):
+        return await cache.aadd(
+            self.lock_key, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT
+        )
+
+    def release(self):
+        cache.delete(self.lock_key)
+
+    def wait_for_duplicate(self):
+        """
+        Returns the response of the duplicate holding the lock,
+        or None if it failed and the request may run.
+        """
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            stored = self.lookup()
+            if stored is not None or not cache.get(self.lock_key):
+                return stored
+        raise RequestInProgress()
+
+    async def await_duplicate(self):
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            stored = await self.alookup()
+            if stored is not None or not await cache.aget(self.lock_key):
+                return stored
+        raise RequestInProgress()
+
+    def execute(self, work):
+        """
+        Runs `work()`, which returns (status_code, data), in a transaction
+        that also stores a successful result. Returns (stored, replayed).
+        """
+        try:
+            with transaction.atomic():
+                status_code, data = work()
+                stored = {
+                    "fingerprint": self.fingerprint,
+                    "status_code": status_code,
+                    "response": data,
+                }
+                if status.is_success(status_code):
+                    IdempotencyKey.objects.create(
+                        user_id=self.user_id, key=self.key, **stored
+                    )
+                    transaction.on_commit(
+                        lambda: cache.set(
+                            self.cache_key,
+                            stored,
+                            settings.IDEMPOTENCY_KEY_TTL,
+                        )
+                    )
+            return stored, False
+        except IntegrityError:
+            # A duplicate whose lock expired committed first.
+            stored = self.check(self.records().first())
+            if stored is None:
+                raise
+            return stored, True
+
+    def run(self, work):
+        """
+        Runs the request once, or returns the stored response.
+        Returns (stored, replayed).
+        """
+        stored = self.lookup()
+        while stored is None:
+            if self.acquire():
+                try:
+                    stored = self.lookup()
+                    if stored is None:
+                        return self.execute(work)
+                finally:
+                    self.release()
+            else:
+                stored = self.wait_for_duplicate()
+        return stored, True
+
+    async def arun(self, work):
+        stored = await self.alookup()
+        while stored is None:
+            if await self.aacquire():
+                try:
+                    stored = await self.alookup()
+                    if stored is None:
+                        return await sync_to_async(self.execute)(work)
+                finally:
+                    await cache.adelete(self.lock_key)
+            else:
+                stored = await self.await_duplicate()
+        return stored, True
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+import httpx
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books_service.models import Book
+from borrowing_service.models import Borrowing
+from core.asgi import application
+from core.async_clients import close_clients
+from core.clients import get_stripe
+from notifications_service import fake_telegram
+from payments_service import fake_stripe
+from payments_service.models import Payment, StatusChoices
+from telegram_bot.redis_client import delete_telegram_id, save_telegram_id
+
+
+SCENARIOS = {
+    "create": (
+        "POST",
+        "/api/borrowings/",
+        "/api/borrowings/borrowings/async/",
+    ),
+    "success": (
+        "GET",
+        "/api/payments/{id}/success/",
+        "/api/payments/{id}/success/async/",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the sync and async borrowing create and payment success "
+        "endpoints against local stand-ins for Stripe and Telegram and "
+        "reports throughput and latency of both. Requires the Docker "
+        "setup (PostgreSQL and Redis)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.1,
+            help="Response time of the fake Stripe and Telegram APIs.",
+        )
+        parser.add_argument(
+            "--base-url",
+            help=(
+                "Load-test a running server, e.g. uvicorn with several "
+                "workers, instead of the ASGI app in this process. The "
+                "server must use the fake APIs started here through "
+                "STRIPE_API_BASE and TELEGRAM_API_URL."
+            ),
+        )
+        parser.add_argument("--stripe-port", type=int, default=12111)
+        parser.add_argument("--telegram-port", type=int, default=12112)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "The benchmark needs PostgreSQL (DJANGO_ENV=docker)."
+            )
+
+        stripe_server = fake_stripe.make_server(
+            port=options["stripe_port"], latency=options["latency"]
+        )
+        telegram_server = fake_telegram.make_server(
+            port=options["telegram_port"],
+            latency=options["latency"],
+            global_limit=None,
+            chat_interval=0,
+        )
+        for server in (stripe_server, telegram_server):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        requests = options["requests"]
+        user, book, borrowing_ids = self.seed(requests, stripe_server)
+        get_stripe().api_base = f"http://127.0.0.1:{options['stripe_port']}"
+        token = str(AccessToken.for_user(user))
+
+        try:
+            with override_settings(
+                TELEGRAM_API_URL=(
+                    f"http://127.0.0.1:{options['telegram_port']}"
+                ),
+                TELEGRAM_GLOBAL_RATE_LIMIT=1_000_000,
+                TELEGRAM_CHAT_INTERVAL=0,
+            ):
+                for name, (method, *paths) in SCENARIOS.items():
+                    for kind, path in zip(("sync", "async"), paths):
+                        Payment.objects.filter(
+                            borrowing_id__in=borrowing_ids
+                        ).update(status=StatusChoices.PENDING.value)
+                        report = asyncio.run(
+                            self.run(
+                                method,
+                                path,
+                                book,
+                                borrowing_ids,
+                                token,
+                                options,
+                            )
+                        )
+                        self.write_report(f"{name} {kind}", report)
+        finally:
+            delete_telegram_id(user.email)
+            user.delete()
+            book.delete()
+            stripe_server.shutdown()
+            telegram_server.shutdown()
+
+    def seed(self, requests, stripe_server):
+        user = get_user_model().objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:8]}@example.com",
+            password=uuid.uuid4().hex,
+        )
+        save_telegram_id(user.email, "1")
+        book = Book.objects.create(
+            title=f"Bench {uuid.uuid4().hex[:8]}",
+            author="Bench",
+            cover="SOFT",
+            inventory=requests * 2,
+            daily_fee=1,
+        )
+
+        # Bulk inserts skip the signals, so nothing is sent while seeding.
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=user,
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for _ in range(requests)
+        )
+        payments = []
+        for borrowing in borrowings:
+            session_id = f"cs_bench_{uuid.uuid4().hex}"
+            stripe_server.objects[session_id] = {
+                "id": session_id,
+                "object": "checkout.session",
+                "status": "complete",
+                "payment_status": "paid",
+            }
+            payments.append(
+                Payment(
+                    borrowing=borrowing,
+                    money_to_pay=7,
+                    session_id=session_id,
+                    session_url=f"https://example.com/{session_id}",
+                )
+            )
+        Payment.objects.bulk_create(payments)
+        return user, book, [borrowing.id for borrowing in borrowings]
+
+    async def run(self, method, path, book, borrowing_ids, token, options):
+        if options["base_url"]:
+            transport, base_url = None, options["base_url"]
+        else:
+            transport = httpx.ASGITransport(app=application)
+            base_url = "http://localhost"
+
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        payload = {
+            "book": book.id,
+            "expected_return_date": str(date.today() + timedelta(days=7)),
+        }
+        latencies = []
+        errors = 0
+
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=60,
+            limits=httpx.Limits(max_connections=options["concurrency"]),
+        ) as client:
+
+            async def call(borrowing_id):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.request(
+                        method,
+                        path.format(id=borrowing_id),
+                        json=payload if method == "POST" else None,
+                    )
+                    latencies.append(time.perf_counter() - started)
+                    if response.is_error:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(call(pk) for pk in borrowing_ids))
+            elapsed = time.perf_counter() - started
+
+        await close_clients()
+        return latencies, errors, elapsed
+
+    def write_report(self, name, report):
+        latencies, errors, elapsed = report
+        latencies.sort()
+        self.stdout.write(
+            f"{name}: {len(latencies)} requests in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.0f}/s), "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f}ms, "
+            f"{errors} errors"
+        )
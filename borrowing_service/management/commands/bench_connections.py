@@ -0,0 +1,144 @@
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+
+from core.pools import redis_pool
+from telegram_bot.redis_client import redis_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-request cost of opening a new database connection "
+        "with persistent and pooled connections, and of a new Redis "
+        "connection with the shared Redis pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            help="Size of the database pool, defaults to --threads.",
+        )
+        parser.add_argument("--skip-redis", action="store_true")
+
+    def handle(self, *args, **options):
+        self.requests = options["requests"]
+        self.threads = options["threads"]
+        base = connections.settings[DEFAULT_DB_ALIAS]
+        options_without_pool = {
+            key: value
+            for key, value in base.get("OPTIONS", {}).items()
+            if key != "pool"
+        }
+
+        modes = {
+            "new connection": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+            "persistent": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": True},
+        }
+        if base["ENGINE"] == "django.db.backends.postgresql":
+            pool_size = options["pool_size"] or self.threads
+            modes["pool"] = {
+                "CONN_MAX_AGE": 0,
+                "CONN_HEALTH_CHECKS": True,
+                "OPTIONS": {
+                    **options_without_pool,
+                    "pool": {"min_size": pool_size, "max_size": pool_size},
+                },
+            }
+        else:
+            self.stdout.write("Skipping the pool, it needs PostgreSQL.")
+
+        for name, overrides in modes.items():
+            settings_dict = {
+                **base,
+                "OPTIONS": options_without_pool,
+                **overrides,
+            }
+            self.bench_database(name, settings_dict)
+
+        if not options["skip_redis"]:
+            self.bench_redis()
+
+    def bench_database(self, name, settings_dict):
+        backend = load_backend(settings_dict["ENGINE"])
+        alias = f"bench_{name.replace(' ', '_')}"
+        local = threading.local()
+        wrappers = []
+
+        def request():
+            if not hasattr(local, "wrapper"):
+                local.wrapper = backend.DatabaseWrapper(settings_dict, alias)
+                wrappers.append(local.wrapper)
+            wrapper = local.wrapper
+            # What the request_started and request_finished signals do.
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            wrapper.close_if_unusable_or_obsolete()
+
+        def finish():
+            if hasattr(local, "wrapper"):
+                local.wrapper.close()
+
+        self.report(f"database {name}", self.run(request, finish))
+
+        pool = getattr(wrappers[0], "pool", None)
+        if pool is not None:
+            stats = pool.get_stats()
+            self.stdout.write(
+                f"  pool: {stats['connections_num']} connections opened, "
+                f"{stats.get('requests_queued', 0)} requests queued"
+            )
+            wrappers[0].close_pool()
+
+    def bench_redis(self):
+        url = os.getenv("REDIS_URL")
+
+        def new_connection():
+            client = redis.Redis.from_url(url)
+            client.ping()
+            client.close()
+
+        self.report("redis new connection", self.run(new_connection))
+        self.report("redis pool", self.run(redis_client.ping))
+        stats = redis_pool.get_stats()
+        self.stdout.write(
+            f"  pool: {stats['created']} connections opened, "
+            f"peak {stats['peak_in_use']} in use, {stats['waits']} waits"
+        )
+
+    def run(self, request, finish=None):
+        per_thread = self.requests // self.threads
+
+        def worker():
+            timings = []
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - started) * 1_000_000)
+            if finish:
+                finish()
+            return timings
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [executor.submit(worker) for _ in range(self.threads)]
+            return sorted(
+                timing for future in futures for timing in future.result()
+            )
+
+    def report(self, name, timings):
+        self.stdout.write(
+            f"{name}: {len(timings)} requests, "
+            f"mean {statistics.mean(timings):.0f}us, "
+            f"p50 {timings[len(timings) // 2]:.0f}us, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.0f}us"
+        )
@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from books_service.models import Book
+
+
+def take_copy_atomic(book_id):
+    with transaction.atomic():
+        return Book.objects.take_copy(book_id)
+
+
+def take_copy_naive(book_id):
+    """
+    The read-modify-write path used before the conditional UPDATE.
+    """
+    with transaction.atomic():
+        book = Book.objects.get(pk=book_id)
+        if book.inventory == 0:
+            return False
+        book.inventory -= 1
+        book.save()
+        return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Lets many threads borrow the same book at once and checks "
+        "that no more copies are handed out than the inventory holds. "
+        "Requires PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrowers", type=int, default=500)
+        parser.add_argument("--inventory", type=int, default=100)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=50,
+            help="Threads, each one holds its own database connection.",
+        )
+        parser.add_argument(
+            "--mode", choices=("atomic", "naive"), default="atomic"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "The benchmark needs PostgreSQL (DJANGO_ENV=docker)."
+            )
+
+        borrowers = options["borrowers"]
+        inventory = options["inventory"]
+        workers = options["workers"]
+        take_copy = (
+            take_copy_atomic
+            if options["mode"] == "atomic"
+            else take_copy_naive
+        )
+
+        book = Book.objects.create(
+            title=f"Benchmark hot title {uuid.uuid4().hex}",
+            author="Benchmark Author",
+            cover="HARD",
+            inventory=inventory,
+            daily_fee=1,
+        )
+        requests = queue.Queue()
+        for _ in range(borrowers):
+            requests.put(book.id)
+
+        granted = []
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(workers + 1)
+
+        def worker():
+            from django.db import connection as thread_connection
+
+            thread_connection.ensure_connection()
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        book_id = requests.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    result = take_copy(book_id)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        granted.append(result)
+                        latencies.append(elapsed)
+            finally:
+                thread_connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        book.refresh_from_db()
+        handed_out = sum(granted)
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+
+        self.stdout.write(
+            f"mode={options['mode']} borrowers={borrowers} "
+            f"inventory={inventory} workers={workers}\n"
+            f"granted={handed_out} rejected={borrowers - handed_out} "
+            f"final_inventory={book.inventory}\n"
+            f"elapsed={elapsed:.3f}s "
+            f"throughput={borrowers / elapsed:.0f} req/s "
+            f"p95={p95 * 1000:.1f}ms"
+        )
+
+        oversold = handed_out - (inventory - book.inventory)
+        book.delete()
+
+        if handed_out > inventory or oversold:
+            raise CommandError(
+                f"Inventory is inconsistent: {handed_out} copies granted, "
+                f"{inventory - book.inventory} taken from the inventory."
+            )
+        self.stdout.write(self.style.SUCCESS("No copies were oversold."))
@@ -0,0 +1,218 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from books_service.models import Book
+from borrowing_service.filters import BorrowingFilter
+from borrowing_service.models import Borrowing
+
+
+def get_plans(user_id, book_id, today):
+    """
+    Returns (description, queryset, expected index) for every query
+    the borrowing indexes are meant to serve.
+    """
+    return (
+        (
+            "active borrowings of a user",
+            Borrowing.objects.filter(
+                user_id=user_id, actual_return_date__isnull=True
+            ),
+            "borrowing_active_user_due_idx",
+        ),
+        (
+            "overdue borrowings",
+            Borrowing.objects.filter(
+                actual_return_date__isnull=True,
+                expected_return_date__lt=today,
+            ).order_by("expected_return_date", "id")[:1000],
+            "borrowing_active_due_idx",
+        ),
+        (
+            "copies of a book on loan",
+            Borrowing.objects.filter(
+                book_id=book_id, actual_return_date__isnull=True
+            ).values("id"),
+            "borrowing_book_returned_idx",
+        ),
+    )
+
+
+def get_filter_comparisons(user_id):
+    """
+    Returns (description, previous queryset, BorrowingFilter queryset)
+    pairs for the first page of the borrowings list.
+    """
+    queryset = Borrowing.objects.order_by("id")
+
+    def filtered(**params):
+        return BorrowingFilter(params, queryset=queryset).qs[:10]
+
+    return (
+        (
+            "active borrowings, all users",
+            queryset.filter(
+                borrow_date__isnull=False, actual_return_date__isnull=True
+            ).distinct()[:10],
+            filtered(is_active="true"),
+        ),
+        (
+            "active borrowings of a user",
+            queryset.filter(
+                user__id=user_id,
+                borrow_date__isnull=False,
+                actual_return_date__isnull=True,
+            ).distinct()[:10],
+            filtered(is_active="true", user_id=user_id),
+        ),
+        (
+            "overdue borrowings, all users",
+            queryset.filter(
+                borrow_date__isnull=False,
+                actual_return_date__isnull=True,
+                expected_return_date__lt=date.today(),
+            ).distinct()[:10],
+            filtered(overdue="true"),
+        ),
+    )
+
+
+SEED_SQL = """
+WITH book_ids AS (SELECT array_agg(id) AS ids FROM {book_table}),
+     user_ids AS (SELECT array_agg(id) AS ids FROM {user_table})
+INSERT INTO {borrowing_table}
+    (book_id, user_id, borrow_date, expected_return_date, actual_return_date)
+SELECT
+    book_ids.ids[1 + floor(random() * array_length(book_ids.ids, 1))::int],
+    user_ids.ids[1 + floor(random() * array_length(user_ids.ids, 1))::int],
+    CURRENT_DATE - mod(g, 365),
+    CURRENT_DATE - mod(g, 365) + 14,
+    CASE
+        WHEN random() < %s THEN NULL
+        ELSE CURRENT_DATE - mod(g, 365) + 7
+    END
+FROM generate_series(1, %s) AS g, book_ids, user_ids
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN for the borrowing filters and checks that the planner "
+        "uses the borrowing indexes. Requires PostgreSQL; use --seed only "
+        "on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Insert this many borrowings before explaining.",
+        )
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--books", type=int, default=10_000)
+        parser.add_argument(
+            "--active-ratio",
+            type=float,
+            default=0.1,
+            help="Share of seeded borrowings that are not returned yet.",
+        )
+        parser.add_argument(
+            "--compare-filters",
+            action="store_true",
+            help="Also compare plans of the previous and current filters.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "The harness needs PostgreSQL (DJANGO_ENV=docker)."
+            )
+
+        if options["seed"]:
+            self.seed(options)
+
+        borrowing = (
+            Borrowing.objects.filter(actual_return_date__isnull=True)
+            .order_by("id")
+            .first()
+        )
+        if borrowing is None:
+            raise CommandError("No borrowings found, run with --seed.")
+
+        failures = []
+        for description, queryset, index in get_plans(
+            borrowing.user_id, borrowing.book_id, date.today()
+        ):
+            plan = queryset.explain(analyze=True)
+            used = index in plan
+            self.stdout.write(
+                f"== {description}: "
+                f"{'uses' if used else 'DOES NOT use'} {index}\n{plan}\n"
+            )
+            if not used:
+                failures.append(description)
+
+        if options["compare_filters"]:
+            self.compare_filters(borrowing.user_id)
+
+        if failures:
+            raise CommandError(
+                f"Indexes are not used for: {', '.join(failures)}"
+            )
+        self.stdout.write(self.style.SUCCESS("All indexes are used."))
+
+    def compare_filters(self, user_id):
+        for description, previous, current in get_filter_comparisons(user_id):
+            self.stdout.write(
+                f"== {description}, previous filter:\n"
+                f"{previous.explain(analyze=True)}\n"
+                f"== {description}, current filter:\n"
+                f"{current.explain(analyze=True)}\n"
+            )
+
+    def seed(self, options):
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            (
+                user_model(
+                    email=f"bench_user_{index}@example.com",
+                    first_name="Bench",
+                    last_name="User",
+                    password="!",
+                )
+                for index in range(options["users"])
+            ),
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        Book.objects.bulk_create(
+            (
+                Book(
+                    title=f"Benchmark book {index}",
+                    author="Benchmark Author",
+                    cover="SOFT",
+                    inventory=10,
+                    daily_fee=1,
+                )
+                for index in range(options["books"])
+            ),
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+
+        borrowing_table = Borrowing._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SEED_SQL.format(
+                    book_table=Book._meta.db_table,
+                    user_table=user_model._meta.db_table,
+                    borrowing_table=borrowing_table,
+                ),
+                [options["active_ratio"], options["seed"]],
+            )
+            cursor.execute(f"ANALYZE {borrowing_table}")
+
+        self.stdout.write(f"Seeded {options['seed']} borrowings.")
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_service', '0003_book_stripe_product_id'),
+        ('borrowing_service', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('actual_return_date__isnull', True)), fields=['user', 'expected_return_date'], name='borrowing_active_user_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('actual_return_date__isnull', True)), fields=['expected_return_date', 'id'], name='borrowing_active_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['book', 'actual_return_date'], name='borrowing_book_returned_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_service', '0004_book_search'),
+        ('borrowing_service', '0003_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowing',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('hold_expires_at__isnull', False)), fields=['hold_expires_at'], name='borrowing_hold_expires_idx'),
+        ),
+    ]
@@ -1,10 +1,13 @@
 import datetime
 
 from django.conf import settings
-from django.db import models
-from django.db.models import CASCADE
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import CASCADE, Q
 from rest_framework.exceptions import ValidationError
 
+from books_service.models import Book
+
 
 class Borrowing(models.Model):
     book = models.ForeignKey(
@@ -16,6 +19,32 @@ class Borrowing(models.Model):
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(blank=True, null=True)
+    # Set while the borrowing waits for its payment; the copy is put back
+    # if it is not paid by then.
+    hold_expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_user_due_idx",
+            ),
+            models.Index(
+                fields=["expected_return_date", "id"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_due_idx",
+            ),
+            models.Index(
+                fields=["book", "actual_return_date"],
+                name="borrowing_book_returned_idx",
+            ),
+            models.Index(
+                fields=["hold_expires_at"],
+                condition=Q(hold_expires_at__isnull=False),
+                name="borrowing_hold_expires_idx",
+            ),
+        ]
 
     @staticmethod
     def validate_borrowing(borrow_date, expected_date):
@@ -29,6 +58,25 @@ class Borrowing(models.Model):
             datetime.date.today(), self.expected_return_date
         )
 
+    def return_book(self):
+        """
+        Marks the borrowing returned and puts the copy back,
+        ending its hold if it was not paid yet.
+        Returns False if it was returned already.
+        """
+        from borrowing_service.holds import remove_holds
+
+        with transaction.atomic():
+            returned = Borrowing.objects.filter(
+                pk=self.pk, actual_return_date__isnull=True
+            ).update(
+                actual_return_date=datetime.date.today(), hold_expires_at=None
+            )
+            if returned:
+                Book.objects.return_copy(self.book_id)
+                remove_holds([self.pk])
+        return bool(returned)
+
     def save(self, *args, **kwargs):
         self.full_clean()
         return super().save(*args, **kwargs)
@@ -45,3 +93,30 @@ class Borrowing(models.Model):
             f"borrowed {self.borrow_date} and "
             f"expected to return {self.expected_return_date}"
         )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response to a request sent with an `Idempotency-Key` header,
+    committed together with the effects of the request
+    so retries replay it instead of running again.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotency_key_unique_user_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of user {self.user_id}"
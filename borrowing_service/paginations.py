@@ -1,7 +1,8 @@
-from rest_framework.pagination import PageNumberPagination
+from core.paginations import OptInKeysetPagination
 
 
-class BorrowingPagination(PageNumberPagination):
+class BorrowingPagination(OptInKeysetPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+    ordering = ("id",)
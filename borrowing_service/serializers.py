@@ -4,9 +4,11 @@ from django.db import transaction
 from rest_framework import serializers
 
 from accounts.serializers import UserSerializer
+from books_service.models import Book
 from books_service.serializers import BookDetailSerializer, BookSerializer
+from borrowing_service.holds import add_hold, hold_deadline
 from borrowing_service.models import Borrowing
-from payments_service.models import Payment
+from payments_service.models import Payment, calculate_sum
 from payments_service.serializers import PaymentSerializer
 
 
@@ -29,6 +31,7 @@ class BorrowingListSerializer(serializers.ModelSerializer):
 class BorrowingDetailSerializer(serializers.ModelSerializer):
     book = BookDetailSerializer(read_only=True)
     user = UserSerializer(read_only=True)
+    payments = PaymentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Borrowing
@@ -39,6 +42,7 @@ class BorrowingDetailSerializer(serializers.ModelSerializer):
             "borrow_date",
             "expected_return_date",
             "actual_return_date",
+            "payments",
         )
 
 
@@ -57,16 +61,28 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
         fields = ("id", "book", "payments", "expected_return_date")
 
     def create(self, validated_data):
+        """
+        Holds a copy of the book until the payment is confirmed,
+        or until the hold expires and the copy is put back.
+        """
         with transaction.atomic():
             book = validated_data.get("book")
-            if book.inventory == 0:
+            if not Book.objects.take_copy(book.id):
                 raise serializers.ValidationError(
                     {f"{book.title}": "This book is out of stock now"}
                 )
-            book.inventory -= 1
-            book.save()
-            borrowing = Borrowing.objects.create(**validated_data)
-            Payment.objects.create(borrowing=borrowing)
+            borrowing = Borrowing.objects.create(
+                **validated_data, hold_expires_at=hold_deadline()
+            )
+            add_hold(borrowing)
+            Payment.objects.create(
+                borrowing=borrowing,
+                money_to_pay=calculate_sum(
+                    book.daily_fee,
+                    borrowing.expected_return_date,
+                    borrowing.borrow_date,
+                ),
+            )
 
         return borrowing
 
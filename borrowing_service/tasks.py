@@ -0,0 +1,230 @@
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from borrowing_service import holds
+from borrowing_service.models import Borrowing, IdempotencyKey
+from notifications_service.engine import queue_notifications
+from payments_service.models import (
+    Payment,
+    PaymentOutbox,
+    StatusChoices,
+    TypeChoices,
+    close_session,
+)
+from payments_service.pricing import fine_expression
+from payments_service.tasks import create_checkout_session
+from telegram_bot.redis_client import get_telegram_ids
+
+
+SWEEP_CHECKPOINT_KEY = "borrowings:overdue_sweep:checkpoint"
+SWEEP_LOCK_KEY = "borrowings:overdue_sweep:lock"
+
+UNPAID_STATUSES = (
+    StatusChoices.PENDING_SESSION.value,
+    StatusChoices.PENDING.value,
+    StatusChoices.EXPIRED.value,
+)
+
+
+def get_overdue_chunk(today, after, chunk_size):
+    """
+    Returns the next overdue borrowings after the (expected_return_date, id)
+    key, in the order of the `borrowing_active_due_idx` index.
+    """
+    queryset = Borrowing.objects.filter(
+        actual_return_date__isnull=True, expected_return_date__lt=today
+    )
+    if after:
+        due, borrowing_id = date.fromisoformat(after[0]), after[1]
+        queryset = queryset.filter(
+            Q(expected_return_date__gt=due)
+            | Q(expected_return_date=due, id__gt=borrowing_id)
+        )
+    return list(
+        queryset.annotate(fine=fine_expression(today))
+        .order_by("expected_return_date", "id")
+        .values(
+            "id",
+            "expected_return_date",
+            "book__title",
+            "user__email",
+            "fine",
+        )[:chunk_size]
+    )
+
+
+def reprice_fines(rows):
+    """
+    Raises the unpaid fines of the borrowings to the amount of the sweep.
+    The old checkout session is expired in Stripe first; fines whose
+    session was completed meanwhile keep it, so the payment still
+    matches. The outbox entries of the raised fines are reset and
+    dispatched after the commit. Returns the number of fines raised.
+    """
+    fines = {row["id"]: row["fine"] for row in rows}
+    closed = {
+        payment.id: payment.session_id
+        for payment in Payment.objects.filter(
+            borrowing_id__in=fines,
+            type=TypeChoices.FINE.value,
+            status__in=UNPAID_STATUSES,
+        ).only("id", "borrowing_id", "money_to_pay", "session_id")
+        if payment.money_to_pay != fines[payment.borrowing_id]
+        and (payment.session_id is None or close_session(payment.session_id))
+    }
+    if not closed:
+        return 0
+
+    with transaction.atomic():
+        # A session created since it was read has not been expired.
+        payments = [
+            payment
+            for payment in Payment.objects.select_for_update()
+            .filter(pk__in=closed, status__in=UNPAID_STATUSES)
+            .only("id", "borrowing_id", "session_id")
+            if payment.session_id == closed[payment.id]
+        ]
+        for payment in payments:
+            payment.money_to_pay = fines[payment.borrowing_id]
+            payment.status = StatusChoices.PENDING_SESSION.value
+            payment.session_id = payment.session_url = None
+        Payment.objects.bulk_update(
+            payments, ("money_to_pay", "status", "session_id", "session_url")
+        )
+        outbox = PaymentOutbox.objects.filter(payment__in=payments)
+        outbox.update(processed_at=None, attempts=0, last_error="")
+        outbox_ids = list(outbox.values_list("id", flat=True))
+
+        transaction.on_commit(
+            lambda: [create_checkout_session.delay(pk) for pk in outbox_ids]
+        )
+    return len(payments)
+
+
+def create_fines(rows):
+    """
+    Creates one fine per borrowing together with its outbox entry.
+    Unpaid fines of earlier sweeps are raised to today's amount instead,
+    so a chunk processed again after a crash changes nothing.
+    Returns the number of fines created or raised.
+    """
+    repriced = reprice_fines(rows)
+    with transaction.atomic():
+        Payment.objects.bulk_create(
+            (
+                Payment(
+                    borrowing_id=row["id"],
+                    type=TypeChoices.FINE.value,
+                    status=StatusChoices.PENDING_SESSION.value,
+                    money_to_pay=row["fine"],
+                )
+                for row in rows
+            ),
+            ignore_conflicts=True,
+        )
+        payment_ids = Payment.objects.filter(
+            borrowing_id__in=[row["id"] for row in rows],
+            type=TypeChoices.FINE.value,
+            outbox__isnull=True,
+        ).values_list("id", flat=True)
+        outbox = PaymentOutbox.objects.bulk_create(
+            PaymentOutbox(payment_id=payment_id) for payment_id in payment_ids
+        )
+
+    transaction.on_commit(
+        lambda: [create_checkout_session.delay(entry.id) for entry in outbox]
+    )
+    return len(outbox) + repriced
+
+
+def notify_overdue(rows):
+    telegram_ids = get_telegram_ids({row["user__email"] for row in rows})
+    queue_notifications(
+        (
+            telegram_ids[row["user__email"]],
+            f"⏰ The book {row['book__title']} was due on "
+            f"{row['expected_return_date']}. Please return it.",
+        )
+        for row in rows
+        if row["user__email"] in telegram_ids
+    )
+
+
+@shared_task(bind=True)
+def sweep_overdue_borrowings(self, chunk_size=None, max_chunks=None):
+    """
+    Fines overdue borrowings and notifies their users.
+    Progress is checkpointed after every chunk; after `max_chunks`
+    the task re-enqueues itself, and an interrupted sweep is resumed
+    by the next run on the same day.
+    """
+    chunk_size = chunk_size or settings.OVERDUE_SWEEP_CHUNK_SIZE
+    max_chunks = max_chunks or settings.OVERDUE_SWEEP_MAX_CHUNKS
+    if not cache.add(
+        SWEEP_LOCK_KEY, True, settings.OVERDUE_SWEEP_LOCK_TIMEOUT
+    ):
+        return None
+
+    today = date.today()
+    try:
+        checkpoint = cache.get(SWEEP_CHECKPOINT_KEY)
+        if checkpoint is None or checkpoint["date"] != today.isoformat():
+            checkpoint = {
+                "date": today.isoformat(),
+                "after": None,
+                "processed": 0,
+                "fined": 0,
+                "done": False,
+            }
+
+        for _ in range(max_chunks):
+            if checkpoint["done"]:
+                break
+            rows = get_overdue_chunk(today, checkpoint["after"], chunk_size)
+            if not rows:
+                checkpoint["done"] = True
+            else:
+                checkpoint["fined"] += create_fines(rows)
+                notify_overdue(rows)
+                checkpoint["processed"] += len(rows)
+                checkpoint["after"] = (
+                    rows[-1]["expected_return_date"].isoformat(),
+                    rows[-1]["id"],
+                )
+            cache.set(
+                SWEEP_CHECKPOINT_KEY,
+                checkpoint,
+                settings.OVERDUE_SWEEP_CHECKPOINT_TIMEOUT,
+            )
+    finally:
+        cache.delete(SWEEP_LOCK_KEY)
+
+    if not checkpoint["done"]:
+        self.apply_async(
+            kwargs={"chunk_size": chunk_size, "max_chunks": max_chunks}
+        )
+    return checkpoint
+
+
+@shared_task
+def purge_idempotency_keys():
+    """
+    Deletes stored responses older than IDEMPOTENCY_KEY_TTL.
+    """
+    expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expired).delete()
+    return deleted
+
+
+@shared_task
+def release_expired_holds(batch_size=None):
+    """
+    Puts back the copies of borrowings that were not paid in time.
+    """
+    return holds.release_expired_holds(batch_size)
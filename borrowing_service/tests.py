@@ -1,23 +1,60 @@
-from datetime import date
+import gzip
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from redis import RedisError
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from books_service.models import Book
-from borrowing_service.models import Borrowing
+from borrowing_service.checks import check_hold_ttl
+from borrowing_service.filters import BorrowingFilter
+from borrowing_service.holds import HOLDS_KEY, release_expired_holds
+from borrowing_service.idempotency import IdempotentRequest
+from borrowing_service.models import Borrowing, IdempotencyKey
 from borrowing_service.serializers import (
     BorrowingListSerializer,
     BorrowingDetailSerializer,
 )
+from borrowing_service.tasks import (
+    SWEEP_CHECKPOINT_KEY,
+    purge_idempotency_keys,
+    sweep_overdue_borrowings,
+)
+from payments_service.models import (
+    Payment,
+    PaymentOutbox,
+    StatusChoices,
+    TypeChoices,
+)
+from payments_service.tasks import create_checkout_session, update_sessions
+from telegram_bot.redis_client import redis_client
 
 
 BORROWING_URL = reverse("borrowing:borrowing-list")
 
 
+def redis_available():
+    try:
+        return redis_client.ping()
+    except (RedisError, ValueError):
+        return False
+
+
 class BorrowingModelTests(TestCase):
     def setUp(self):
         self.book = Book.objects.create(
@@ -69,7 +106,7 @@ class BorrowingModelTests(TestCase):
                 book=self.book,
                 user=self.user,
                 borrow_date="2025-01-05",
-                expected_return_date="2025-01-01"
+                expected_return_date="2025-01-01",
             )
 
     def tearDown(self):
@@ -109,10 +146,14 @@ class AuthenticatedBorrowingApiTests(TestCase):
             daily_fee=0.5,
         )
         self.borrowing_1 = Borrowing.objects.create(
-            book=self.book_1, user=self.user, expected_return_date="2025-02-10"
+            book=self.book_1,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=5),
         )
         self.borrowing_2 = Borrowing.objects.create(
-            book=self.book_2, user=self.user, expected_return_date="2025-02-15"
+            book=self.book_2,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=10),
         )
 
     def test_auth_required(self):
@@ -144,7 +185,7 @@ class AuthenticatedBorrowingApiTests(TestCase):
         data = {
             "book": self.book_1.id,
             "user": self.user.id,
-            "expected_return_date": "2025-03-01",
+            "expected_return_date": date.today() + timedelta(days=7),
         }
         initial_inventory = self.book_1.inventory
         response = self.client.post(BORROWING_URL, data)
@@ -157,6 +198,25 @@ class AuthenticatedBorrowingApiTests(TestCase):
 
         self.assertEqual(self.book_1.inventory, initial_inventory - 1)
 
+    def test_create_borrowing_out_of_stock(self):
+        book = Book.objects.create(
+            title="test_book_3",
+            author="test_author_3",
+            inventory=0,
+            daily_fee=0.5,
+        )
+        data = {
+            "book": book.id,
+            "expected_return_date": date.today() + timedelta(days=7),
+        }
+        response = self.client.post(BORROWING_URL, data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data[book.title], "This book is out of stock now"
+        )
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+
     def test_return_book_success(self):
         return_url = reverse(
             "borrowing:borrowing-return", args=[self.borrowing_1.id]
@@ -185,8 +245,796 @@ class AuthenticatedBorrowingApiTests(TestCase):
             response.data["results"][0]["id"], self.borrowing_1.id
         )
 
+    def test_filter_is_active_false(self):
+        Borrowing.objects.filter(pk=self.borrowing_2.pk).update(
+            actual_return_date=date.today()
+        )
+        response = self.client.get(BORROWING_URL, {"is_active": False})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [self.borrowing_2.id],
+        )
+
+    def test_filter_overdue(self):
+        Borrowing.objects.filter(pk=self.borrowing_1.pk).update(
+            expected_return_date=date.today() - timedelta(days=1)
+        )
+        Borrowing.objects.filter(pk=self.borrowing_2.pk).update(
+            expected_return_date=date.today() + timedelta(days=3650)
+        )
+
+        response = self.client.get(BORROWING_URL, {"overdue": True})
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [self.borrowing_1.id],
+        )
+
+        response = self.client.get(BORROWING_URL, {"overdue": False})
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            [self.borrowing_2.id],
+        )
+
+    def test_filters_do_not_use_distinct(self):
+        queryset = BorrowingFilter(
+            {"is_active": "false", "overdue": "true", "user_id": self.user.id},
+            queryset=Borrowing.objects.all(),
+        ).qs
+
+        self.assertNotIn("DISTINCT", str(queryset.query))
+
     def test_filter_user_id(self):
         response = self.client.get(BORROWING_URL, {"user_id": self.user.id})
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 2)
+
+
+class BorrowingQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            first_name="testfirstname",
+            last_name="testlastname",
+            email="testemail@test.com",
+            password="testpassword",
+        )
+        self.client.force_authenticate(self.user)
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"test_book_{index}",
+                author="test_author",
+                inventory=10,
+                daily_fee=0.5,
+            )
+            for index in range(100)
+        )
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=self.user,
+                expected_return_date=date.today(),
+            )
+            for book in books
+        )
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for page_size in (1, 10, 100):
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    BORROWING_URL, {"page_size": page_size}
+                )
+
+            self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_cursor_pagination_skips_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                BORROWING_URL, {"pagination": "cursor", "page_size": 60}
+            )
+
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 60)
+
+        response = self.client.get(response.data["next"])
+
+        self.assertEqual(len(response.data["results"]), 40)
+        self.assertIsNone(response.data["next"])
+
+    def test_retrieve_query_count(self):
+        borrowing = Borrowing.objects.first()
+        url = reverse("borrowing:borrowing-detail", args=[borrowing.id])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data["book"]["id"], borrowing.book_id)
+        self.assertEqual(response.data["user"]["email"], self.user.email)
+
+
+@patch(
+    "borrowing_service.tasks.get_telegram_ids",
+    side_effect=lambda emails: {email: "42" for email in emails},
+)
+@patch("borrowing_service.tasks.queue_notifications")
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        cache.delete(SWEEP_CHECKPOINT_KEY)
+        self.book = Book.objects.create(
+            title="Overdue book",
+            author="Author",
+            inventory=10,
+            daily_fee=Decimal("1.50"),
+        )
+        self.user = get_user_model().objects.create_user(
+            email="late@test.com", password="testpassword"
+        )
+        today = date.today()
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=self.user,
+                expected_return_date=today - timedelta(days=days),
+                actual_return_date=returned,
+            )
+            for days, returned in (
+                (3, None),
+                (5, None),
+                (1, None),
+                (4, today),
+                (-2, None),
+                (0, None),
+            )
+        )
+        Borrowing.objects.update(borrow_date=today - timedelta(days=20))
+
+    def test_fines_active_overdue_borrowings(
+        self, mock_queue, mock_telegram_ids
+    ):
+        result = sweep_overdue_borrowings.apply().get()
+
+        self.assertEqual(result["processed"], 3)
+        self.assertEqual(result["fined"], 3)
+        self.assertTrue(result["done"])
+        fines = sorted(
+            Payment.objects.filter(type=TypeChoices.FINE.value).values_list(
+                "money_to_pay", flat=True
+            )
+        )
+        self.assertEqual(
+            fines, [Decimal("3.00"), Decimal("9.00"), Decimal("15.00")]
+        )
+        self.assertEqual(PaymentOutbox.objects.count(), 3)
+        messages = [
+            message
+            for call in mock_queue.call_args_list
+            for message in call.args[0]
+        ]
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0][0], "42")
+
+    def test_sweep_resumes_from_checkpoint(
+        self, mock_queue, mock_telegram_ids
+    ):
+        with patch.object(sweep_overdue_borrowings, "apply_async") as resume:
+            result = sweep_overdue_borrowings.apply(
+                kwargs={"chunk_size": 2, "max_chunks": 1}
+            ).get()
+
+        resume.assert_called_once()
+        self.assertFalse(result["done"])
+        self.assertEqual(result["processed"], 2)
+        self.assertEqual(cache.get(SWEEP_CHECKPOINT_KEY), result)
+
+        result = sweep_overdue_borrowings.apply(kwargs={"chunk_size": 2}).get()
+
+        self.assertTrue(result["done"])
+        self.assertEqual(result["processed"], 3)
+        self.assertEqual(
+            Payment.objects.filter(type=TypeChoices.FINE.value).count(), 3
+        )
+
+    def test_borrowings_are_fined_once(self, mock_queue, mock_telegram_ids):
+        sweep_overdue_borrowings.apply()
+        cache.delete(SWEEP_CHECKPOINT_KEY)
+
+        result = sweep_overdue_borrowings.apply().get()
+
+        self.assertEqual(result["processed"], 3)
+        self.assertEqual(result["fined"], 0)
+        self.assertEqual(
+            Payment.objects.filter(type=TypeChoices.FINE.value).count(), 3
+        )
+
+    def sweep_next_day(self):
+        """
+        Sweeps, marks the smallest fine pending on session cs_old and the
+        next one paid, then sweeps again as if a day had passed.
+        """
+        sweep_overdue_borrowings.apply()
+        fines = Payment.objects.filter(type=TypeChoices.FINE.value)
+        pending, paid, _ = fines.order_by("money_to_pay")
+        Payment.objects.filter(pk=pending.pk).update(
+            status=StatusChoices.PENDING.value, session_id="cs_old"
+        )
+        Payment.objects.filter(pk=paid.pk).update(
+            status=StatusChoices.PAID.value
+        )
+        PaymentOutbox.objects.update(processed_at=timezone.now())
+        # The next day every borrowing is one more day overdue.
+        cache.delete(SWEEP_CHECKPOINT_KEY)
+        Borrowing.objects.update(
+            expected_return_date=F("expected_return_date") - timedelta(days=1)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = sweep_overdue_borrowings.apply().get()
+        pending.refresh_from_db()
+        return result, fines, pending
+
+    @patch("borrowing_service.tasks.create_checkout_session.delay")
+    @patch("borrowing_service.tasks.close_session", return_value=True)
+    def test_unpaid_fines_grow_on_the_next_day(
+        self, mock_close, mock_create_session, mock_queue, mock_telegram_ids
+    ):
+        result, fines, pending = self.sweep_next_day()
+
+        # Two unpaid fines are raised and the borrowing due yesterday
+        # is fined for the first time; the paid fine stays.
+        self.assertEqual(result["fined"], 3)
+        self.assertEqual(
+            sorted(fines.values_list("money_to_pay", flat=True)),
+            [
+                Decimal("3.00"),
+                Decimal("6.00"),
+                Decimal("9.00"),
+                Decimal("18.00"),
+            ],
+        )
+        self.assertEqual(pending.status, StatusChoices.PENDING_SESSION.value)
+        self.assertIsNone(pending.session_id)
+        self.assertEqual(
+            PaymentOutbox.objects.filter(processed_at__isnull=True).count(), 3
+        )
+        mock_close.assert_called_once_with("cs_old")
+        self.assertEqual(mock_create_session.call_count, 3)
+
+    @patch("borrowing_service.tasks.create_checkout_session.delay")
+    @patch("borrowing_service.tasks.close_session", return_value=False)
+    def test_fine_paid_on_the_old_session_is_not_raised(
+        self, mock_close, mock_create_session, mock_queue, mock_telegram_ids
+    ):
+        result, fines, pending = self.sweep_next_day()
+
+        self.assertEqual(result["fined"], 2)
+        self.assertEqual(pending.money_to_pay, Decimal("3.00"))
+        self.assertEqual(pending.status, StatusChoices.PENDING.value)
+        self.assertEqual(pending.session_id, "cs_old")
+
+
+class BorrowingExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@test.com", password="testpassword"
+        )
+        self.client.force_authenticate(self.admin)
+        self.url = reverse("borrowing:borrowing-export")
+        self.book = Book.objects.create(
+            title="Export book", author="Author", inventory=10, daily_fee=2
+        )
+        today = date.today()
+        self.returned, self.active = Borrowing.objects.bulk_create(
+            Borrowing(
+                book=self.book,
+                user=self.admin,
+                expected_return_date=today,
+                actual_return_date=returned,
+            )
+            for returned in (today, None)
+        )
+        Borrowing.objects.filter(pk=self.returned.pk).update(
+            borrow_date=date(2024, 1, 10)
+        )
+        Borrowing.objects.filter(pk=self.active.pk).update(
+            borrow_date=date(2024, 3, 10)
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                borrowing=self.returned,
+                type=type_.value,
+                status=StatusChoices.PAID.value,
+                money_to_pay=money,
+            )
+            for type_, money in (
+                (TypeChoices.PAYMENT, 10),
+                (TypeChoices.FINE, 4),
+            )
+        )
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_has_one_row_per_payment(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("id,borrow_date,"))
+        self.assertIn("admin@test.com", lines[1])
+        self.assertTrue(lines[2].endswith("FINE,PAID,4.00"))
+        self.assertTrue(lines[3].endswith(",,,"))
+
+    def test_ndjson_nests_payments(self):
+        response = self.client.get(self.url, {"file_format": "ndjson"})
+
+        borrowings = [
+            json.loads(line) for line in self.read(response).splitlines()
+        ]
+        self.assertEqual(
+            [len(borrowing["payments"]) for borrowing in borrowings], [2, 0]
+        )
+        self.assertEqual(borrowings[0]["book_title"], "Export book")
+        self.assertEqual(borrowings[0]["payments"][0]["type"], "PAYMENT")
+
+    def test_filters_and_date_range(self):
+        response = self.client.get(
+            self.url, {"file_format": "ndjson", "is_active": "true"}
+        )
+        self.assertEqual(
+            [
+                json.loads(line)["id"]
+                for line in self.read(response).splitlines()
+            ],
+            [self.active.id],
+        )
+
+        response = self.client.get(
+            self.url,
+            {
+                "file_format": "ndjson",
+                "borrow_date_after": "2024-01-01",
+                "borrow_date_before": "2024-01-31",
+            },
+        )
+        self.assertEqual(
+            [
+                json.loads(line)["id"]
+                for line in self.read(response).splitlines()
+            ],
+            [self.returned.id],
+        )
+
+    def test_gzip_encoding(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(content.decode().splitlines()), 4)
+
+    def test_export_is_for_superusers_only(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="staff@test.com", password="testpassword", is_staff=True
+            )
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AsyncBorrowingApiTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="async@test.com", password="testpassword"
+        )
+        self.headers = {
+            "HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+        self.book = Book.objects.create(
+            title="Async book", author="Author", inventory=1, daily_fee=2
+        )
+        self.create_url = reverse("borrowing:borrowing-create-async")
+        self.days = 5
+        self.return_date = date.today() + timedelta(days=self.days)
+
+    def post(self, url, data=None, **headers):
+        return self.client.post(
+            url,
+            json.dumps(data or {}),
+            content_type="application/json",
+            **{**self.headers, **headers},
+        )
+
+    def test_create_borrowing(self):
+        response = self.post(
+            self.create_url,
+            {
+                "book": self.book.id,
+                "expected_return_date": str(self.return_date),
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        borrowing = Borrowing.objects.get(pk=response.json()["id"])
+        self.assertEqual(borrowing.user, self.user)
+        self.assertEqual(
+            borrowing.payments.get().money_to_pay,
+            self.book.daily_fee * self.days,
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_create_borrowing_out_of_stock(self):
+        data = {
+            "book": self.book.id,
+            "expected_return_date": str(self.return_date),
+        }
+        self.post(self.create_url, data)
+
+        response = self.post(self.create_url, data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"Async book": "This book is out of stock now"}
+        )
+
+    def test_authentication_required(self):
+        response = self.client.post(self.create_url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+    def test_return_book(self):
+        borrowing = Borrowing.objects.create(
+            book=self.book,
+            user=self.user,
+            expected_return_date=self.return_date,
+        )
+        url = reverse("borrowing:borrowing-return-async", args=[borrowing.id])
+
+        response = self.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        borrowing.refresh_from_db()
+        self.assertEqual(borrowing.actual_return_date, date.today())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 2)
+
+        response = self.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cannot_return_other_users_borrowing(self):
+        other = get_user_model().objects.create_user(
+            email="other@test.com", password="testpassword"
+        )
+        borrowing = Borrowing.objects.create(
+            book=self.book,
+            user=other,
+            expected_return_date=self.return_date,
+        )
+
+        response = self.post(
+            reverse("borrowing:borrowing-return-async", args=[borrowing.id])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IdempotentBorrowingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="retry@test.com", password="testpassword"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(
+            title="Retried book", author="Author", inventory=5, daily_fee=1
+        )
+        self.data = {
+            "book": self.book.id,
+            "expected_return_date": str(date.today() + timedelta(days=5)),
+        }
+
+    def post(self, key, data=None, client=None):
+        return (client or self.client).post(
+            BORROWING_URL,
+            data or self.data,
+            format="json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_replays_first_response(self):
+        first = self.post("key-1")
+        retry = self.post("key-1")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", first)
+        self.assertEqual(Borrowing.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 4)
+
+    def test_new_key_creates_another_borrowing(self):
+        self.post("key-1")
+        self.post("key-2")
+        self.client.post(BORROWING_URL, self.data, format="json")
+
+        self.assertEqual(Borrowing.objects.count(), 3)
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = APIClient()
+        other.force_authenticate(
+            get_user_model().objects.create_user(
+                email="other@test.com", password="testpassword"
+            )
+        )
+
+        self.post("key-1")
+        response = self.post("key-1", client=other)
+
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Borrowing.objects.count(), 2)
+
+    def test_key_reused_with_another_request(self):
+        self.post("key-1")
+
+        response = self.post(
+            "key-1",
+            {
+                **self.data,
+                "expected_return_date": str(date.today() + timedelta(days=9)),
+            },
+        )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Borrowing.objects.count(), 1)
+
+    def test_failed_request_may_be_retried(self):
+        Book.objects.filter(pk=self.book.pk).update(inventory=0)
+        self.assertEqual(
+            self.post("key-1").status_code, status.HTTP_400_BAD_REQUEST
+        )
+
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+        response = self.post("key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.1)
+    def test_duplicate_in_progress_is_not_executed(self):
+        request = IdempotentRequest(self.user, "key-1", self.data)
+        self.assertTrue(request.acquire())
+
+        response = self.post("key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Borrowing.objects.exists())
+
+    def test_async_retry_replays_first_response(self):
+        url = reverse("borrowing:borrowing-create-async")
+        headers = {
+            "Authorization": f"Bearer {AccessToken.for_user(self.user)}",
+            "Idempotency-Key": "key-1",
+        }
+
+        first, retry = (
+            self.client.generic(
+                "POST",
+                url,
+                json.dumps(self.data),
+                content_type="application/json",
+                headers=headers,
+            )
+            for _ in range(2)
+        )
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Borrowing.objects.count(), 1)
+
+    def test_purge_deletes_expired_keys(self):
+        self.post("key-1")
+        self.post("key-2")
+        IdempotencyKey.objects.filter(key="key-1").update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)),
+            ["key-2"],
+        )
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+@patch("borrowing_service.signals.send_booking_created")
+@patch("payments_service.tasks.create_checkout_session.delay")
+class InventoryHoldTests(TestCase):
+    def setUp(self):
+        redis_client.delete(HOLDS_KEY)
+        self.addCleanup(redis_client.delete, HOLDS_KEY)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="hold@test.com", password="testpassword"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(
+            title="Held book", author="Author", inventory=2, daily_fee=1
+        )
+        self.return_date = date.today() + timedelta(days=5)
+
+    def borrow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                BORROWING_URL,
+                {
+                    "book": self.book.id,
+                    "expected_return_date": str(self.return_date),
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Borrowing.objects.get(pk=response.data["id"])
+
+    def inventory(self):
+        self.book.refresh_from_db()
+        return self.book.inventory
+
+    def test_borrowing_holds_copy_until_deadline(self, *mocks):
+        borrowing = self.borrow()
+
+        self.assertEqual(self.inventory(), 1)
+        self.assertAlmostEqual(
+            borrowing.hold_expires_at.timestamp(),
+            (timezone.now() + timedelta(hours=1)).timestamp(),
+            delta=60,
+        )
+        self.assertEqual(
+            redis_client.zscore(HOLDS_KEY, borrowing.id),
+            borrowing.hold_expires_at.timestamp(),
+        )
+        self.assertEqual(release_expired_holds(), 0)
+        self.assertEqual(self.inventory(), 1)
+
+    @override_settings(BORROWING_HOLD_TTL=timedelta(seconds=-1))
+    def test_expired_hold_is_released(self, *mocks):
+        borrowing = self.borrow()
+        self.borrow()
+
+        self.assertEqual(release_expired_holds(batch_size=1), 2)
+
+        self.assertEqual(self.inventory(), 2)
+        self.assertEqual(redis_client.zcard(HOLDS_KEY), 0)
+        borrowing.refresh_from_db()
+        self.assertIsNone(borrowing.hold_expires_at)
+        self.assertEqual(borrowing.actual_return_date, borrowing.borrow_date)
+        self.assertEqual(
+            borrowing.payments.get().status, StatusChoices.EXPIRED.value
+        )
+
+    @override_settings(BORROWING_HOLD_TTL=timedelta(seconds=-1))
+    def test_returned_hold_is_not_released(self, *mocks):
+        borrowing = self.borrow()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("borrowing:borrowing-return", args=[borrowing.id])
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(redis_client.zcard(HOLDS_KEY), 0)
+        borrowing.refresh_from_db()
+        self.assertIsNone(borrowing.hold_expires_at)
+        self.assertEqual(release_expired_holds(), 0)
+
+        # A hold left behind, e.g. by a return made before it was ended.
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            hold_expires_at=timezone.now() - timedelta(hours=1)
+        )
+        redis_client.zadd(HOLDS_KEY, {borrowing.id: 0})
+
+        self.assertEqual(release_expired_holds(), 0)
+        self.assertEqual(self.inventory(), 2)
+        borrowing.refresh_from_db()
+        self.assertEqual(borrowing.actual_return_date, date.today())
+        self.assertNotEqual(
+            borrowing.payments.get().status, StatusChoices.EXPIRED.value
+        )
+
+    @override_settings(BORROWING_HOLD_TTL=timedelta(seconds=-1))
+    @patch("payments_service.tasks.get_stripe_data")
+    def test_no_session_is_created_after_release(self, mock_stripe, *mocks):
+        borrowing = self.borrow()
+        release_expired_holds()
+
+        create_checkout_session.apply(
+            args=(PaymentOutbox.objects.get(payment__borrowing=borrowing).id,)
+        )
+
+        mock_stripe.assert_not_called()
+        self.assertFalse(
+            PaymentOutbox.objects.filter(processed_at__isnull=True).exists()
+        )
+
+    @override_settings(BORROWING_HOLD_TTL=timedelta(seconds=-1))
+    @patch("payments_service.tasks.notify_paid")
+    def test_paid_hold_becomes_borrowing(self, mock_notify, *mocks):
+        borrowing = self.borrow()
+        borrowing.payments.update(
+            status=StatusChoices.PENDING.value, session_id="cs_hold"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_sessions({"cs_hold"}, set())
+
+        self.assertEqual(redis_client.zcard(HOLDS_KEY), 0)
+        self.assertEqual(release_expired_holds(), 0)
+        borrowing.refresh_from_db()
+        self.assertIsNone(borrowing.hold_expires_at)
+        self.assertIsNone(borrowing.actual_return_date)
+        self.assertEqual(self.inventory(), 1)
+
+    @override_settings(BORROWING_HOLD_TTL=timedelta(seconds=-1))
+    def test_hold_paid_before_release_keeps_copy(self, *mocks):
+        borrowing = self.borrow()
+        borrowing.payments.update(status=StatusChoices.PAID.value)
+
+        self.assertEqual(release_expired_holds(), 0)
+
+        borrowing.refresh_from_db()
+        self.assertIsNone(borrowing.hold_expires_at)
+        self.assertEqual(self.inventory(), 1)
+
+    def test_holds_missing_from_redis_are_released_late(self, *mocks):
+        Book.objects.take_copy(self.book.id)
+        borrowing = Borrowing.objects.create(
+            book=self.book,
+            user=self.user,
+            expected_return_date=self.return_date,
+            hold_expires_at=timezone.now() - timedelta(minutes=1),
+        )
+
+        self.assertEqual(release_expired_holds(), 0)
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            hold_expires_at=timezone.now() - timedelta(minutes=10)
+        )
+        self.assertEqual(release_expired_holds(), 1)
+
+        self.assertEqual(self.inventory(), 2)
+
+    def test_hold_shorter_than_a_checkout_session_is_rejected(self, *mocks):
+        self.assertEqual(check_hold_ttl(None), [])
+
+        with override_settings(BORROWING_HOLD_TTL=timedelta(minutes=20)):
+            errors = check_hold_ttl(None)
+
+        self.assertEqual(
+            [error.id for error in errors], ["borrowing_service.E001"]
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN plans of PostgreSQL")
+class BorrowingIndexTests(TestCase):
+    def test_planner_uses_borrowing_indexes(self):
+        call_command(
+            "explain_borrowing_indexes",
+            seed=50_000,
+            users=500,
+            books=500,
+            stdout=StringIO(),
+        )
@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework import routers
 
+from borrowing_service import async_views
 from borrowing_service.views import BorrowingViewSet
 
 
@@ -9,6 +10,21 @@ router = routers.DefaultRouter()
 router.register("", BorrowingViewSet, "borrowing")
 
 urlpatterns = [
+    path(
+        "borrowings/async/",
+        async_views.create_borrowing,
+        name="borrowing-create-async",
+    ),
+    path(
+        "borrowings/<int:pk>/return/async/",
+        async_views.return_borrowing,
+        name="borrowing-return-async",
+    ),
+    path(
+        "borrowings/export/",
+        BorrowingViewSet.as_view({"get": "export"}),
+        name="borrowing-export",
+    ),
     path(
         "borrowings/<int:pk>/return/",
         BorrowingViewSet.as_view({"post": "return_book"}),
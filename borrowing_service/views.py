@@ -1,15 +1,20 @@
-from datetime import date
-
 from rest_framework import mixins, status
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from django_filters import rest_framework as filters
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
+from borrowing_service.export import FILE_FORMATS, export_borrowings
 from borrowing_service.filters import BorrowingFilter
+from borrowing_service.idempotency import (
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    IdempotentRequest,
+)
 from borrowing_service.paginations import BorrowingPagination
 from borrowing_service.serializers import (
     BorrowingDetailSerializer,
@@ -18,6 +23,7 @@ from borrowing_service.serializers import (
     BorrowingReturnSerializer,
 )
 from borrowing_service.models import Borrowing
+from core.streaming import streaming_response
 
 
 class BorrowingViewSet(
@@ -50,23 +56,88 @@ class BorrowingViewSet(
     @action(methods=["POST"], detail=True, url_path="return")
     def return_book(self, request, pk=None):
         borrowing = self.get_object()
-        if borrowing.actual_return_date:
+        if not borrowing.return_book():
             raise ValidationError(
-                {f"{borrowing.book.title}": "This book is already returned"}
+                {borrowing.book.title: "This book is already returned"}
             )
-        borrowing.book.inventory += 1
-        borrowing.book.save()
-        borrowing.actual_return_date = date.today()
-        borrowing.save()
         return Response(
             {"detail": f"{borrowing.book.title} successfully returned!"},
             status=status.HTTP_200_OK,
         )
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="file_format", enum=list(FILE_FORMATS), default="csv"
+            ),
+        ],
+        description=(
+            "Stream the borrowings history with book, user and payment "
+            "columns. Superusers only; gzipped if the client accepts it."
+        ),
+        responses=OpenApiTypes.BINARY,
+        tags=["borrowings"],
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="export",
+        url_name="export-history",
+        pagination_class=None,
+    )
+    def export(self, request):
+        if not request.user.is_superuser:
+            raise PermissionDenied()
+
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in FILE_FORMATS:
+            raise ValidationError(
+                {"file_format": f"Use one of: {', '.join(FILE_FORMATS)}."}
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(
+            request,
+            export_borrowings(queryset, file_format),
+            content_type=FILE_FORMATS[file_format],
+            filename=f"borrowings.{file_format}",
+        )
+
     def get_queryset(self):
+        queryset = self.queryset.select_related("book", "user")
+
+        if self.action == "list":
+            queryset = queryset.only(
+                "id",
+                "borrow_date",
+                "expected_return_date",
+                "actual_return_date",
+                "book__title",
+                "user__email",
+            )
+
+        if self.action == "retrieve":
+            queryset = queryset.only(
+                "id",
+                "borrow_date",
+                "expected_return_date",
+                "actual_return_date",
+                "book__id",
+                "book__title",
+                "book__author",
+                "book__cover",
+                "book__inventory",
+                "book__daily_fee",
+                "user__id",
+                "user__email",
+                "user__first_name",
+                "user__last_name",
+                "user__is_staff",
+            ).prefetch_related("payments")
+
         if self.request.user.is_superuser:
-            return self.queryset
-        return self.queryset.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -80,5 +151,34 @@ class BorrowingViewSet(
 
         return BorrowingCreateSerializer
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name=IDEMPOTENCY_HEADER,
+                location=OpenApiParameter.HEADER,
+                description=(
+                    "Retries with the same key replay the first response "
+                    "instead of borrowing the book again."
+                ),
+            )
+        ],
+    )
+    def create(self, request, *args, **kwargs):
+        idempotent = IdempotentRequest.from_request(request, request.data)
+        if idempotent is None:
+            return super().create(request, *args, **kwargs)
+
+        def work():
+            response = super(BorrowingViewSet, self).create(
+                request, *args, **kwargs
+            )
+            return response.status_code, response.data
+
+        stored, replayed = idempotent.run(work)
+        response = Response(stored["response"], status=stored["status_code"])
+        if replayed:
+            response[REPLAYED_HEADER] = "true"
+        return response
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import weakref
+
+import httpx
+import redis.asyncio
+from django.conf import settings
+
+
+# Async clients are bound to the event loop that created them,
+# so every loop (one per uvicorn worker) gets its own pool.
+_clients = weakref.WeakKeyDictionary()
+
+
+def _loop_clients():
+    return _clients.setdefault(asyncio.get_running_loop(), {})
+
+
+def get_redis():
+    clients = _loop_clients()
+    if "redis" not in clients:
+        clients["redis"] = redis.asyncio.Redis(
+            connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+                os.getenv("REDIS_URL"),
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            )
+        )
+    return clients["redis"]
+
+
+def get_http_client():
+    """
+    Returns the pooled HTTP client used for Stripe and Telegram.
+    """
+    clients = _loop_clients()
+    if "http" not in clients:
+        clients["http"] = httpx.AsyncClient(
+            timeout=settings.ASYNC_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return clients["http"]
+
+
+async def close_clients():
+    """
+    Closes the clients of the running event loop.
+    """
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    if "redis" in clients:
+        await clients["redis"].aclose()
+        await clients["redis"].connection_pool.disconnect()
+    if "http" in clients:
+        await clients["http"].aclose()
@@ -0,0 +1,62 @@
+import functools
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions
+
+from accounts.authentication import CachedJWTAuthentication
+
+
+def async_api_view(methods):
+    """
+    Async counterpart of DRF's `api_view` for the hot paths:
+    requires a user authenticated by JWT and renders API exceptions
+    the way DRF does.
+    """
+
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            authenticator = CachedJWTAuthentication()
+            try:
+                result = await authenticator.aauthenticate(request)
+                if result is None:
+                    raise exceptions.NotAuthenticated()
+                request.user, request.auth = result
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as error:
+                return error_response(request, error, authenticator)
+
+        return wrapper
+
+    return decorator
+
+
+def error_response(request, error, authenticator):
+    if isinstance(error.detail, (list, dict)):
+        data = error.detail
+    else:
+        data = {"detail": error.detail}
+
+    response = JsonResponse(data, status=error.status_code, safe=False)
+    if isinstance(
+        error, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+    ):
+        response["WWW-Authenticate"] = authenticator.authenticate_header(
+            request
+        )
+    return response
+
+
+def parse_json(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError as error:
+        raise exceptions.ParseError(f"JSON parse error - {error}")
+    if not isinstance(data, dict):
+        raise exceptions.ParseError("Expected a JSON object.")
+    return data
@@ -0,0 +1,31 @@
+import functools
+
+import httpx
+from django.conf import settings
+
+
+# Clients of external services are built on first use, so web and
+# Celery processes that never call the service do not pay for them.
+
+
+@functools.cache
+def get_stripe():
+    """
+    Returns the `stripe` module configured with the project keys.
+    The SDK takes most of the cold start, so it is imported here.
+    """
+    import stripe
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    if settings.STRIPE_API_BASE:
+        stripe.api_base = settings.STRIPE_API_BASE
+    return stripe
+
+
+@functools.cache
+def get_telegram_client():
+    """
+    Returns the HTTP client of the Bot API shared by the process,
+    keeping connections to Telegram open between messages.
+    """
+    return httpx.Client(timeout=settings.TELEGRAM_TIMEOUT)
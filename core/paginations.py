@@ -0,0 +1,106 @@
+import json
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner's row estimate for the queryset instead of
+    running `COUNT(*)`. Only PostgreSQL is supported, otherwise None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class OptInKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination which switches to keyset (cursor) pagination
+    when the client asks for it with `?pagination=cursor`
+    or sends a `cursor`. Keyset pages skip `COUNT(*)` and `OFFSET`;
+    `?estimate_count=true` adds the planner's estimate as a header.
+    """
+
+    pagination_query_param = "pagination"
+    cursor_query_param = "cursor"
+    estimate_count_query_param = "estimate_count"
+    estimated_count_header = "X-Estimated-Count"
+    ordering = ("id",)
+
+    keyset_paginator = None
+    estimated_count = None
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.pagination_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def get_keyset_paginator(self):
+        paginator = CursorPagination()
+        paginator.ordering = self.ordering
+        paginator.page_size = self.page_size
+        paginator.max_page_size = self.max_page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.cursor_query_param = self.cursor_query_param
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_keyset(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.estimate_count_query_param) in (
+            "true",
+            "1",
+        ):
+            self.estimated_count = estimate_count(queryset)
+
+        self.keyset_paginator = self.get_keyset_paginator()
+        return self.keyset_paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is None:
+            return super().get_paginated_response(data)
+
+        response = self.keyset_paginator.get_paginated_response(data)
+        if self.estimated_count is not None:
+            response[self.estimated_count_header] = str(self.estimated_count)
+        return response
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.pagination_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to `cursor` for keyset pagination.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.estimate_count_query_param,
+                "required": False,
+                "in": "query",
+                "description": (
+                    "Return the estimated number of rows "
+                    f"in the {self.estimated_count_header} header."
+                ),
+                "schema": {"type": "boolean"},
+            },
+        ]
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.db import connections
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """
+    Redis pool that blocks when all connections are in use
+    and counts how often and how long callers had to wait.
+    """
+
+    def reset(self):
+        super().reset()
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "waits": 0,
+            "wait_ms": 0.0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+        }
+
+    def get_connection(self, command_name=None, *keys, **options):
+        exhausted = self.pool.empty()
+        started = time.monotonic()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except redis.ConnectionError:
+            if exhausted:
+                with self.stats_lock:
+                    self.stats["timeouts"] += 1
+            raise
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            if exhausted:
+                self.stats["waits"] += 1
+                self.stats["wait_ms"] += (time.monotonic() - started) * 1000
+            self.stats["peak_in_use"] = max(
+                self.stats["peak_in_use"], self.in_use()
+            )
+        return connection
+
+    def in_use(self):
+        return self.max_connections - self.pool.qsize()
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats.update(
+            max_connections=self.max_connections,
+            created=len(self._connections),
+            in_use=self.in_use(),
+        )
+        stats["saturation"] = round(stats["in_use"] / self.max_connections, 3)
+        return stats
+
+
+# One pool per process, shared by the web app, the bot and Celery workers.
+redis_pool = MeteredConnectionPool.from_url(
+    os.getenv("REDIS_URL"),
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    socket_keepalive=True,
+)
+
+
+def get_database_pool_stats(alias="default"):
+    """
+    Usage of the psycopg pool of the database,
+    or the persistent connection settings when it is not pooled.
+    """
+    connection = connections[alias]
+    pool = getattr(connection, "pool", None)
+    if pool is None:
+        return {
+            "pooled": False,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        }
+
+    stats = pool.get_stats()
+    in_use = stats["pool_size"] - stats["pool_available"]
+    return {
+        "pooled": True,
+        **stats,
+        "in_use": in_use,
+        "saturation": round(in_use / stats["pool_max"], 3),
+    }
+
+
+def get_pool_stats():
+    return {
+        "database": get_database_pool_stats(),
+        "redis": redis_pool.get_stats(),
+    }
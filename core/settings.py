@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from datetime import timedelta
+from decimal import Decimal
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -42,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # 3rd party applications
     "django_filters",
     "rest_framework",
@@ -102,8 +105,26 @@ if DJANGO_ENV == "docker":
             "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
             "HOST": os.getenv("POSTGRES_HOST"),
             "PORT": os.getenv("POSTGRES_PORT"),
+            "CONN_HEALTH_CHECKS": True,
         }
     }
+    # DB_POOL_MAX_SIZE > 0 uses a psycopg pool per process, otherwise
+    # connections are kept open for DB_CONN_MAX_AGE seconds. Either way
+    # a connection is checked before it is reused.
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE") or 0)
+    if DB_POOL_MAX_SIZE:
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+                "max_size": DB_POOL_MAX_SIZE,
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+                "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 600)),
+            }
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(
+            os.getenv("DB_CONN_MAX_AGE") or 60
+        )
 else:
     DATABASES = {
         "default": {
@@ -112,10 +133,60 @@ else:
         }
     }
 
+# Size of the Redis connection pools of every process. Callers wait up to
+# REDIS_POOL_TIMEOUT seconds for a free connection when all are in use.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS") or 50)
+REDIS_POOL_TIMEOUT = int(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
+if DJANGO_ENV == "docker":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+            "KEY_PREFIX": "library",
+            "OPTIONS": {
+                "pool_class": "redis.BlockingConnectionPool",
+                "max_connections": REDIS_MAX_CONNECTIONS,
+                "timeout": REDIS_POOL_TIMEOUT,
+                "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+            },
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+BOOKS_CACHE_TIMEOUT = int(os.getenv("BOOKS_CACHE_TIMEOUT", 5 * 60))
+BOOK_IMPORT_CHUNK_SIZE = 2000
+BOOK_EXPORT_CHUNK_SIZE = 2000
+BOOK_SEARCH_LIMIT = 100
+BORROWING_EXPORT_CHUNK_SIZE = 2000
+# A new borrowing holds its copy until it is paid, or for
+# BORROWING_HOLD_TTL. Expired holds are released in batches; holds missing
+# from Redis are found in the database once BORROWING_HOLD_GRACE late.
+# Once its checkout session exists, the hold lasts until the session
+# expires plus BORROWING_HOLD_PAYMENT_GRACE for the payment to arrive.
+# Stripe sessions live at least 30 minutes, so shorter holds are rejected.
+BORROWING_HOLD_TTL = timedelta(
+    minutes=int(os.getenv("BORROWING_HOLD_MINUTES", 60))
+)
+BORROWING_HOLD_BATCH_SIZE = 500
+BORROWING_HOLD_GRACE = timedelta(minutes=5)
+BORROWING_HOLD_PAYMENT_GRACE = timedelta(minutes=10)
+# Responses to requests with an Idempotency-Key are replayed for a day.
+# Duplicates wait up to IDEMPOTENCY_WAIT seconds for the first request.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT = 5
+
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend"
@@ -132,6 +203,12 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": False,
 }
 
+# Authenticated users are cached per process for AUTH_USER_LOCAL_TTL
+# seconds and in the shared cache until the user is changed.
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", 10_000))
+AUTH_USER_LOCAL_TTL = int(os.getenv("AUTH_USER_LOCAL_TTL", 5))
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", 5 * 60))
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Library API",
     "DESCRIPTION": "API for managing books borrowing",
@@ -141,8 +218,54 @@ SPECTACULAR_SETTINGS = {
 CELERY_BROKER_URL = os.getenv("CELERY_REDIS_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_REDIS_URL")
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+CELERY_BROKER_POOL_LIMIT = int(os.getenv("CELERY_BROKER_POOL_LIMIT", 10))
+CELERY_REDIS_MAX_CONNECTIONS = REDIS_MAX_CONNECTIONS
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+}
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-payment-outbox": {
+        "task": "payments_service.tasks.dispatch_payment_outbox",
+        "schedule": 60.0,
+    },
+    "sweep-overdue-borrowings": {
+        "task": "borrowing_service.tasks.sweep_overdue_borrowings",
+        # Later runs resume an interrupted sweep or do nothing.
+        "schedule": crontab(minute=0, hour="1-5"),
+    },
+    "flush-notifications": {
+        "task": "notifications_service.tasks.flush_notifications",
+        "schedule": 5.0,
+    },
+    # Applies events whose run was lost, e.g. while the broker was down.
+    "process-stripe-events": {
+        "task": "payments_service.tasks.process_stripe_events",
+        "schedule": 60.0,
+    },
+    "reconcile-payments": {
+        "task": "payments_service.tasks.reconcile_payments",
+        "schedule": crontab(minute="*/15"),
+    },
+    "purge-stripe-events": {
+        "task": "payments_service.tasks.purge_stripe_events",
+        "schedule": crontab(minute=45, hour=0),
+    },
+    "release-expired-holds": {
+        "task": "borrowing_service.tasks.release_expired_holds",
+        "schedule": 30.0,
+    },
+    "purge-idempotency-keys": {
+        "task": "borrowing_service.tasks.purge_idempotency_keys",
+        "schedule": crontab(minute=30, hour=0),
+    },
+}
+# Telegram notifications are sent by a dedicated worker:
+# celery -A core worker -Q notifications
+CELERY_TASK_ROUTES = {
+    "notifications_service.tasks.*": {"queue": "notifications"},
+}
 
 
 # Password validation
@@ -190,5 +313,67 @@ AUTH_USER_MODEL = "accounts.User"
 
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
+# Point it to `python manage.py fake_stripe` to work without Stripe.
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+
+# Checkout session events are signed with STRIPE_WEBHOOK_SECRET and
+# acknowledged right away; a worker applies them in batches of
+# STRIPE_EVENT_BATCH_SIZE, STRIPE_EVENT_BATCH_DELAY seconds after the first
+# event of a burst. Stripe redelivers events for up to three days.
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_WEBHOOK_TOLERANCE = 300
+STRIPE_EVENT_BATCH_SIZE = 500
+STRIPE_EVENT_BATCH_DELAY = 1
+STRIPE_EVENT_TTL = timedelta(days=7)
+
+# Sessions whose events were lost are reconciled by listing them, up to
+# PAYMENT_RECONCILE_PAGE_SIZE per Stripe request (at most 100). The first
+# run looks back PAYMENT_RECONCILE_LOOKBACK.
+PAYMENT_RECONCILE_PAGE_SIZE = 100
+PAYMENT_RECONCILE_LOOKBACK = timedelta(days=2)
+PAYMENT_RECONCILE_LOCK_TIMEOUT = 30 * 60
+
+# Outbox entries older than this are considered lost and re-dispatched.
+PAYMENT_OUTBOX_STALE_AFTER = timedelta(minutes=1)
+PAYMENT_OUTBOX_MAX_ATTEMPTS = 5
+
+# The overdue sweep reads borrowings in chunks of this size.
+OVERDUE_SWEEP_CHUNK_SIZE = 1000
+OVERDUE_SWEEP_MAX_CHUNKS = 100
+OVERDUE_SWEEP_LOCK_TIMEOUT = 30 * 60
+OVERDUE_SWEEP_CHECKPOINT_TIMEOUT = 2 * 24 * 3600
+
+# Overdue borrowings are fined daily_fee * FINE_MULTIPLIER per day.
+FINE_MULTIPLIER = Decimal(os.getenv("FINE_MULTIPLIER", "2"))
+
+# Stripe prices are reused per (book, amount) within a process.
+STRIPE_PRICE_CACHE_SIZE = int(os.getenv("STRIPE_PRICE_CACHE_SIZE", 10_000))
+STRIPE_PRICE_CACHE_TTL = int(os.getenv("STRIPE_PRICE_CACHE_TTL", 24 * 3600))
+
+# Pool of the async HTTP client shared by the async views
+# for Stripe and Telegram, per event loop.
+ASYNC_HTTP_TIMEOUT = 10
+ASYNC_HTTP_MAX_CONNECTIONS = 100
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_TIMEOUT = 10
+# Telegram allows 30 messages per second and one message per second per chat.
+TELEGRAM_GLOBAL_RATE_LIMIT = 30
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_SEND_MAX_RETRIES = 5
+
+# The bot handles up to TELEGRAM_BOT_CONCURRENCY updates at once and calls
+# the library API at LIBRARY_API_URL. Conversation steps expire after
+# TELEGRAM_STATE_TTL seconds. Webhook requests must carry the secret.
+LIBRARY_API_URL = os.getenv("LIBRARY_API_URL", "http://library:8000/api")
+TELEGRAM_BOT_CONCURRENCY = int(os.getenv("TELEGRAM_BOT_CONCURRENCY") or 32)
+TELEGRAM_POLL_TIMEOUT = 30
+TELEGRAM_STATE_TTL = 15 * 60
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+
+# Bulk notifications to the same chat within the window become one digest.
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", 60))
+NOTIFICATION_FLUSH_BATCH = 5000
+NOTIFICATION_FLUSH_LOCK_TIMEOUT = 10 * 60
+NOTIFICATION_CONCURRENCY = 50
@@ -0,0 +1,60 @@
+import zlib
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it,
+    so `csv.writer` can produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def buffered(chunks, size=64 * 1024):
+    """
+    Joins small chunks, e.g. CSV lines, into blocks of about `size` bytes.
+    """
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def streaming_response(request, chunks, content_type, filename):
+    """
+    Streams the chunks as a file download,
+    gzipped when the client accepts it.
+    """
+    chunks = buffered(chunks)
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    if accepts_gzip:
+        chunks = gzipped(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if accepts_gzip:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+
+import redis
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from core.pools import MeteredConnectionPool
+
+
+# Cold start budgets of a web and a Celery worker process, in ms.
+# Importing the Stripe SDK alone used to take more than 600ms.
+WSGI_IMPORT_BUDGET_MS = int(os.getenv("WSGI_IMPORT_BUDGET_MS", 1000))
+CELERY_IMPORT_BUDGET_MS = int(os.getenv("CELERY_IMPORT_BUDGET_MS", 1000))
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    def connect(self):
+        pass
+
+    def can_read(self):
+        return False
+
+    def disconnect(self):
+        pass
+
+
+class MeteredConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = MeteredConnectionPool(
+            max_connections=2, timeout=0.01, connection_class=FakeConnection
+        )
+
+    def test_counts_connections_in_use(self):
+        first = self.pool.get_connection("PING")
+        self.pool.get_connection("PING")
+        self.pool.release(first)
+
+        stats = self.pool.get_stats()
+
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["in_use"], 1)
+        self.assertEqual(stats["peak_in_use"], 2)
+        self.assertEqual(stats["saturation"], 0.5)
+
+    def test_counts_waits_for_exhausted_pool(self):
+        self.pool.get_connection("PING")
+        self.pool.get_connection("PING")
+
+        with self.assertRaises(redis.ConnectionError):
+            self.pool.get_connection("PING")
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["saturation"], 1)
+
+
+class PoolStatsViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("pool-stats")
+
+    def test_stats_are_for_staff_only(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="user@test.com", password="testpassword"
+            )
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stats(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="admin@test.com", password="testpassword", is_staff=True
+            )
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["database"]["pooled"])
+        self.assertEqual(response.data["redis"]["max_connections"], 50)
+
+
+def measure_imports(statement):
+    """
+    Runs the statement in a new interpreter with `-X importtime` and
+    returns the total import time in ms and the loaded modules.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"{statement}; import sys; print(*sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = sum(
+        int(line.removeprefix("import time:").split("|")[0])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "[us]" not in line
+    )
+    return total_us / 1000, set(result.stdout.split())
+
+
+class ImportTimeTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The fastest of two runs, to leave out a cold disk cache.
+        cls.wsgi = min(measure_imports("import core.wsgi") for _ in range(2))
+        cls.celery = min(
+            measure_imports(
+                "from core.celery import app; "
+                "app.loader.import_default_modules()"
+            )
+            for _ in range(2)
+        )
+
+    def test_wsgi_cold_start_within_budget(self):
+        self.assertLess(self.wsgi[0], WSGI_IMPORT_BUDGET_MS)
+
+    def test_celery_cold_start_within_budget(self):
+        self.assertLess(self.celery[0], CELERY_IMPORT_BUDGET_MS)
+
+    def test_sdks_are_imported_on_first_use(self):
+        for _, modules in (self.wsgi, self.celery):
+            self.assertIn("payments_service.models", modules)
+            self.assertNotIn("stripe", modules)
@@ -22,6 +22,8 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from core.views import PoolStatsView
+
 
 api = [
     path("users/", include("accounts.urls", namespace="user")),
@@ -30,6 +32,8 @@ api = [
         "borrowings/", include("borrowing_service.urls", namespace="borrowing")
     ),
     path("payments/", include("payments_service.urls", namespace="payment")),
+    path("telegram/", include("telegram_bot.urls", namespace="telegram")),
+    path("pool-stats/", PoolStatsView.as_view(), name="pool-stats"),
 ]
 
 urlpatterns = [
@@ -0,0 +1,16 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.pools import get_pool_stats
+
+
+class PoolStatsView(APIView):
+    """
+    Usage of the database and Redis connection pools of this process.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_pool_stats())
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+import httpx
+from django.conf import settings
+
+from core.async_clients import close_clients, get_redis
+from notifications_service.utils import AsyncTelegramRateLimiter
+from telegram_bot.redis_client import redis_client
+
+
+logger = logging.getLogger(__name__)
+
+DUE_KEY = "notifications:due"
+PENDING_KEY_PREFIX = "notifications:pending:"
+# Messages that failed to send, kept as they were rendered.
+READY_KEY_PREFIX = "notifications:ready:"
+FLUSH_LOCK_KEY = "notifications:flush:lock"
+MAX_MESSAGE_LENGTH = 4096
+
+# Pops the pending and the ready messages of up to ARGV[2] chats
+# that are due at ARGV[1].
+POP_DUE_SCRIPT = """
+local chats = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2]
+)
+local result = {}
+for _, chat in ipairs(chats) do
+    table.insert(result, chat)
+    for _, prefix in ipairs({ARGV[3], ARGV[4]}) do
+        local key = prefix .. chat
+        table.insert(result, redis.call("LRANGE", key, 0, -1))
+        redis.call("DEL", key)
+    end
+    redis.call("ZREM", KEYS[1], chat)
+end
+return result
+"""
+
+pop_due_script = redis_client.register_script(POP_DUE_SCRIPT)
+
+
+def queue_notifications(notifications, window=None):
+    """
+    Queues (telegram_id, text) pairs. Messages to the same chat
+    are coalesced until `window` seconds after the first one.
+    """
+    if window is None:
+        window = settings.NOTIFICATION_DIGEST_WINDOW
+    due_at = time.time() + window
+
+    pipeline = redis_client.pipeline(transaction=False)
+    for telegram_id, text in notifications:
+        pipeline.rpush(f"{PENDING_KEY_PREFIX}{telegram_id}", text)
+        pipeline.zadd(DUE_KEY, {telegram_id: due_at}, nx=True)
+    pipeline.execute()
+
+
+def queue_notification(telegram_id, text, window=None):
+    queue_notifications([(telegram_id, text)], window=window)
+
+
+def requeue_messages(messages):
+    """
+    Queues (telegram_id, text, retry_after) messages that failed to send
+    as they are, so a digest is not wrapped in another digest.
+    """
+    now = time.time()
+    pipeline = redis_client.pipeline(transaction=False)
+    for telegram_id, text, retry_after in messages:
+        pipeline.rpush(f"{READY_KEY_PREFIX}{telegram_id}", text)
+        pipeline.zadd(DUE_KEY, {telegram_id: now + retry_after}, gt=True)
+    pipeline.execute()
+
+
+def pop_due(limit, now=None):
+    """
+    Returns {telegram_id: (texts, ready)} for chats whose window has
+    passed: the messages to render and the messages to send as they are.
+    """
+    result = pop_due_script(
+        keys=(DUE_KEY,),
+        args=(
+            now or time.time(),
+            limit,
+            PENDING_KEY_PREFIX,
+            READY_KEY_PREFIX,
+        ),
+    )
+    return {
+        chat.decode(): (
+            [text.decode() for text in texts],
+            [text.decode() for text in ready],
+        )
+        for chat, texts, ready in zip(result[::3], result[1::3], result[2::3])
+    }
+
+
+def build_digest(texts, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Joins the messages of one chat into as few Telegram messages
+    as the length limit allows.
+    """
+    if len(texts) == 1:
+        return [texts[0][:max_length]]
+
+    header = f"🔔 You have {len(texts)} new notifications:"
+    digests = []
+    current = header
+    for text in texts:
+        text = text[: max_length - len(header) - 2]
+        if len(current) + len(text) + 2 > max_length:
+            digests.append(current)
+            current = header
+        current = f"{current}\n\n{text}"
+    digests.append(current)
+    return digests
+
+
+@dataclass
+class SendReport:
+    sent: int = 0
+    failed: int = 0
+    latencies: list = field(default_factory=list)
+    retry: list = field(default_factory=list)
+
+
+class AsyncTelegramSender:
+    """
+    Sends messages concurrently over one pooled HTTP client.
+    Messages to the same chat are sent one by one, each after the
+    Redis rate limiter shared with the notification workers allows it.
+    """
+
+    def __init__(
+        self,
+        api_url=None,
+        token=None,
+        rate=None,
+        chat_interval=None,
+        concurrency=None,
+    ):
+        self.url = (
+            f"{api_url or settings.TELEGRAM_API_URL}"
+            f"/bot{token or settings.TELEGRAM_TOKEN}/sendMessage"
+        )
+        self.rate = rate or settings.TELEGRAM_GLOBAL_RATE_LIMIT
+        self.chat_interval = (
+            settings.TELEGRAM_CHAT_INTERVAL
+            if chat_interval is None
+            else chat_interval
+        )
+        self.concurrency = concurrency or settings.NOTIFICATION_CONCURRENCY
+
+    async def send_digests(self, digests):
+        """
+        Sends {telegram_id: [text, ...]} and returns a SendReport.
+        Messages worth retrying are listed in `report.retry`.
+        """
+        report = SendReport()
+        rate_limiter = AsyncTelegramRateLimiter(
+            get_redis(),
+            global_limit=self.rate,
+            chat_interval=self.chat_interval,
+        )
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+        )
+
+        async with httpx.AsyncClient(
+            limits=limits, timeout=settings.TELEGRAM_TIMEOUT
+        ) as client:
+
+            async def send_chat(telegram_id, texts):
+                for text in texts:
+                    while wait := await rate_limiter.acquire(telegram_id):
+                        await asyncio.sleep(wait)
+                    async with semaphore:
+                        await self.send(client, telegram_id, text, report)
+
+            await asyncio.gather(
+                *(
+                    send_chat(telegram_id, texts)
+                    for telegram_id, texts in digests.items()
+                )
+            )
+        return report
+
+    async def send(self, client, telegram_id, text, report):
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                self.url, json={"chat_id": telegram_id, "text": text}
+            )
+        except httpx.HTTPError as error:
+            logger.warning("Sending to %s failed: %s", telegram_id, error)
+            report.failed += 1
+            report.retry.append((telegram_id, text, 0))
+            return
+        report.latencies.append(time.perf_counter() - started)
+
+        if response.is_success:
+            report.sent += 1
+            return
+
+        report.failed += 1
+        if response.status_code == 429:
+            retry_after = (
+                response.json().get("parameters", {}).get("retry_after", 1)
+            )
+            report.retry.append((telegram_id, text, retry_after))
+        elif response.status_code >= 500:
+            report.retry.append((telegram_id, text, 0))
+        else:
+            logger.warning(
+                "Telegram rejected a message to %s: %s",
+                telegram_id,
+                response.text,
+            )
+
+
+def flush_notifications(limit=None, sender=None):
+    """
+    Sends the digests of all due chats and queues failed messages again.
+    """
+    pending = pop_due(limit or settings.NOTIFICATION_FLUSH_BATCH)
+    if not pending:
+        return SendReport()
+
+    digests = {
+        telegram_id: ready + (build_digest(texts) if texts else [])
+        for telegram_id, (texts, ready) in pending.items()
+    }
+    report = asyncio.run(
+        send_digests(sender or AsyncTelegramSender(), digests)
+    )
+
+    requeue_messages(report.retry)
+    return report
+
+
+async def send_digests(sender, digests):
+    """
+    Sends the digests on a new event loop and closes its clients.
+    """
+    try:
+        return await sender.send_digests(digests)
+    finally:
+        await close_clients()
@@ -0,0 +1,134 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+SEND_MESSAGE_PATH = re.compile(r"^/bot[^/]+/sendMessage$")
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """
+    Answers `sendMessage` like the Bot API does, including 429 responses
+    when the global or per-chat limits are exceeded.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if not SEND_MESSAGE_PATH.match(urlparse(self.path).path):
+            return self._respond(
+                404,
+                {"ok": False, "error_code": 404, "description": "Not Found"},
+            )
+
+        time.sleep(self.server.latency)
+        retry_after = self.server.take_slot(str(payload.get("chat_id")))
+        if retry_after:
+            return self._respond(
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: "
+                    f"retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+            )
+
+        message = self.server.record(payload)
+        return self._respond(200, {"ok": True, "result": message})
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        address,
+        latency=0.0,
+        global_limit=30,
+        chat_interval=1.0,
+        verbose=False,
+    ):
+        super().__init__(address, FakeTelegramHandler)
+        self.latency = latency
+        self.global_limit = global_limit
+        self.chat_interval = chat_interval
+        self.verbose = verbose
+        self.messages = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.last_sent = {}
+
+    def take_slot(self, chat_id):
+        """
+        Returns 0 when the message is accepted,
+        otherwise the number of seconds to wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= 1:
+                self.recent.popleft()
+
+            chat_wait = self.last_sent.get(chat_id, 0) + self.chat_interval
+            if chat_wait > now + 0.05:
+                self.rejected += 1
+                return max(1, round(chat_wait - now))
+            if self.global_limit and len(self.recent) >= self.global_limit:
+                self.rejected += 1
+                return 1
+
+            self.recent.append(now)
+            self.last_sent[chat_id] = now
+            return 0
+
+    def record(self, payload):
+        with self.lock:
+            message = {
+                "message_id": len(self.messages) + 1,
+                "chat": {"id": payload.get("chat_id")},
+                "date": int(time.time()),
+                "text": payload.get("text", ""),
+            }
+            self.messages.append(message)
+            return message
+
+
+def make_server(
+    host="127.0.0.1",
+    port=12112,
+    latency=0.0,
+    global_limit=30,
+    chat_interval=1.0,
+    verbose=False,
+):
+    return FakeTelegramServer(
+        (host, port),
+        latency=latency,
+        global_limit=global_limit,
+        chat_interval=chat_interval,
+        verbose=verbose,
+    )
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications_service.engine import (
+    AsyncTelegramSender,
+    build_digest,
+    send_digests,
+)
+from notifications_service.fake_telegram import make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends a burst of notifications to the fake Telegram API and reports "
+        "throughput and latency of the batch engine, or of one request per "
+        "event with --mode sequential. The batch engine needs Redis for "
+        "the shared rate limiter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000)
+        parser.add_argument("--chats", type=int, default=1000)
+        parser.add_argument(
+            "--mode", choices=("batch", "sequential"), default="batch"
+        )
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=30,
+            help="Messages per second allowed by the API and the sender.",
+        )
+        parser.add_argument("--chat-interval", type=float, default=1.0)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Response time of the fake API in seconds.",
+        )
+        parser.add_argument("--port", type=int, default=12112)
+
+    def handle(self, *args, **options):
+        server = make_server(
+            port=options["port"],
+            latency=options["latency"],
+            global_limit=options["rate"],
+            chat_interval=options["chat_interval"],
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_url = f"http://127.0.0.1:{options['port']}"
+
+        rng = random.Random(0)
+        events = [
+            (str(rng.randrange(options["chats"])), f"Event {index}")
+            for index in range(options["events"])
+        ]
+
+        try:
+            started = time.perf_counter()
+            if options["mode"] == "batch":
+                sent, failed, latencies = self.run_batch(
+                    events, api_url, options
+                )
+            else:
+                sent, failed, latencies = self.run_sequential(events, api_url)
+            elapsed = time.perf_counter() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p95 = (
+            latencies[int(len(latencies) * 0.95) - 1] * 1000
+            if latencies
+            else 0
+        )
+        self.stdout.write(
+            f"mode={options['mode']} events={len(events)} "
+            f"chats={options['chats']}\n"
+            f"messages_sent={sent} failed={failed} "
+            f"rejected_by_api={server.rejected}\n"
+            f"elapsed={elapsed:.2f}s "
+            f"events/s={len(events) / elapsed:.0f} "
+            f"messages/s={sent / elapsed:.1f} "
+            f"p50={p50:.1f}ms p95={p95:.1f}ms"
+        )
+        if server.rejected:
+            raise CommandError("The API rejected messages over its limits.")
+
+    def run_batch(self, events, api_url, options):
+        pending = {}
+        for telegram_id, text in events:
+            pending.setdefault(telegram_id, []).append(text)
+        digests = {
+            telegram_id: build_digest(texts)
+            for telegram_id, texts in pending.items()
+        }
+
+        sender = AsyncTelegramSender(
+            api_url=api_url,
+            token="bench",
+            rate=options["rate"],
+            chat_interval=options["chat_interval"],
+            concurrency=options["concurrency"],
+        )
+        report = asyncio.run(send_digests(sender, digests))
+        return report.sent, report.failed, report.latencies
+
+    def run_sequential(self, events, api_url):
+        """
+        One blocking request per event, as before the batch engine.
+        """
+        sent = failed = 0
+        latencies = []
+        with requests.Session() as session:
+            for telegram_id, text in events:
+                started = time.perf_counter()
+                response = session.post(
+                    f"{api_url}/botbench/sendMessage",
+                    json={"chat_id": telegram_id, "text": text},
+                )
+                latencies.append(time.perf_counter() - started)
+                if response.ok:
+                    sent += 1
+                else:
+                    failed += 1
+        return sent, failed, latencies
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from notifications_service.fake_telegram import make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Telegram Bot API. "
+        "Set TELEGRAM_API_URL to its address to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12112)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds to wait before answering each request.",
+        )
+        parser.add_argument(
+            "--global-limit",
+            type=int,
+            default=30,
+            help="Messages per second before answering 429, 0 disables.",
+        )
+        parser.add_argument(
+            "--chat-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between two messages to the same chat.",
+        )
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        server = make_server(
+            host=options["host"],
+            port=options["port"],
+            latency=options["latency"],
+            global_limit=options["global_limit"],
+            chat_interval=options["chat_interval"],
+            verbose=options["verbose"],
+        )
+        self.stdout.write(
+            f"Fake Telegram API listening on "
+            f"http://{options['host']}:{options['port']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(
+                f"Accepted {len(server.messages)} messages, "
+                f"rejected {server.rejected}."
+            )
+            server.server_close()
@@ -1,18 +1,39 @@
+import logging
+
 from borrowing_service.models import Borrowing
 from payments_service.models import Payment
 from telegram_bot.redis_client import get_telegram_id
 
 
+logger = logging.getLogger(__name__)
+
+
+def get_success_message(borrowing):
+    return (
+        f"📚 You have successfully booked the book: {borrowing.book.title}\n"
+        f"Booking date: {borrowing.borrow_date}\n"
+        f"Expected return date: {borrowing.expected_return_date}.\n"
+        f"Thank you for your payment! Enjoy reading! 😊"
+    )
+
+
+def get_fine_paid_message(borrowing):
+    return (
+        f"✅ Your fine for the book {borrowing.book.title} is paid.\n"
+        "Thank you!"
+    )
+
+
 def notify_booking_created(instance: Borrowing):
     """
-    Notification of successful booking
+    Notification of successful booking.
+    Returns None when the user has not linked Telegram.
     """
     telegram_id = get_telegram_id(instance.user.email)
 
     if not telegram_id:
-        raise ValueError(f"Telegram ID for user {instance.user.email} not found in Redis.")
-        return
-
+        logger.info("Telegram ID of %s not found.", instance.user.email)
+        return None
 
     message = (
         f"📚 You have successfully booked the book: {instance.book.title}\n"
@@ -20,20 +41,21 @@ def notify_booking_created(instance: Borrowing):
         f"Expected return date: {instance.expected_return_date}.\n"
         "Enjoy reading!"
     )
-    print(f"Telegram id in notifications: {telegram_id}")
-
     return telegram_id, message
 
 
 def notify_payment_needed(instance: Payment):
     """
     Notification of payment required.
+    Returns None when the user has not linked Telegram.
     """
     telegram_id = get_telegram_id(instance.borrowing.user.email)
 
     if not telegram_id:
-        raise ValueError(f"Telegram ID for user {instance.borrowing.user.email} not found in Redis.")
-        return
+        logger.info(
+            "Telegram ID of %s not found.", instance.borrowing.user.email
+        )
+        return None
 
     message = (
         f"💳 Pay for the book reservation: {instance.borrowing.book.title}.\n"
@@ -0,0 +1,101 @@
+import logging
+
+import httpx
+from celery import shared_task
+from django.conf import settings
+
+from borrowing_service.models import Borrowing
+from notifications_service import engine
+from notifications_service.notifications import (
+    notify_booking_created,
+    notify_payment_needed,
+)
+from notifications_service.utils import (
+    TelegramError,
+    rate_limiter,
+    send_message,
+)
+from payments_service.models import Payment
+from telegram_bot.redis_client import redis_client
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=settings.TELEGRAM_SEND_MAX_RETRIES)
+def send_telegram_message(self, telegram_id, text):
+    """
+    Sends a message once the rate limiter allows it.
+    Failed sends are retried with exponential backoff,
+    or after the delay requested by Telegram.
+    """
+    if wait := rate_limiter.acquire(telegram_id):
+        # Comes back when the limiter allows it instead of holding the
+        # worker; the retries of the message are kept as they were.
+        self.signature_from_request(countdown=wait).apply_async()
+        return
+
+    try:
+        send_message(telegram_id, text)
+    except TelegramError as error:
+        if error.retry_after is None:
+            logger.warning(
+                "Telegram rejected a message to %s: %s", telegram_id, error
+            )
+            return
+        countdown = max(error.retry_after, 2**self.request.retries)
+        raise self.retry(exc=error, countdown=countdown)
+    except httpx.HTTPError as error:
+        raise self.retry(exc=error, countdown=2**self.request.retries)
+
+
+@shared_task
+def send_booking_created(borrowing_id):
+    borrowing = (
+        Borrowing.objects.select_related("book", "user")
+        .filter(pk=borrowing_id)
+        .first()
+    )
+    if borrowing is None:
+        return
+
+    notification = notify_booking_created(borrowing)
+    if notification:
+        send_telegram_message.delay(*notification)
+
+
+@shared_task
+def send_payment_needed(payment_id):
+    payment = (
+        Payment.objects.select_related("borrowing__book", "borrowing__user")
+        .filter(pk=payment_id)
+        .first()
+    )
+    if payment is None:
+        return
+
+    notification = notify_payment_needed(payment)
+    if notification:
+        send_telegram_message.delay(*notification)
+
+
+@shared_task
+def flush_notifications():
+    """
+    Sends the coalesced notifications that are due.
+    Only one flush runs at a time, so the rate limits hold.
+    """
+    locked = redis_client.set(
+        engine.FLUSH_LOCK_KEY,
+        1,
+        nx=True,
+        ex=settings.NOTIFICATION_FLUSH_LOCK_TIMEOUT,
+    )
+    if not locked:
+        return None
+
+    try:
+        report = engine.flush_notifications()
+    finally:
+        redis_client.delete(engine.FLUSH_LOCK_KEY)
+    return {"sent": report.sent, "failed": report.failed}
@@ -0,0 +1,310 @@
+import asyncio
+import threading
+import time
+from datetime import date, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
+import httpx
+import redis
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from books_service.models import Book
+from borrowing_service.models import Borrowing
+from notifications_service.engine import (
+    DUE_KEY,
+    PENDING_KEY_PREFIX,
+    READY_KEY_PREFIX,
+    AsyncTelegramSender,
+    build_digest,
+    flush_notifications,
+    pop_due,
+    queue_notifications,
+    requeue_messages,
+    send_digests,
+)
+from notifications_service.fake_telegram import make_server
+from notifications_service.tasks import (
+    send_booking_created,
+    send_telegram_message,
+)
+from notifications_service.utils import TelegramError, TelegramRateLimiter
+from telegram_bot.redis_client import redis_client
+
+
+def redis_available():
+    try:
+        return redis_client.ping()
+    except (redis.RedisError, ValueError):
+        return False
+
+
+class NotificationDispatchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="reader@test.com", password="testpassword"
+        )
+        self.book = Book.objects.create(
+            title="Notification book",
+            author="Test Author",
+            inventory=10,
+            daily_fee=1,
+        )
+
+    def create_borrowing(self):
+        return Borrowing.objects.create(
+            book=self.book,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=7),
+        )
+
+    @patch("borrowing_service.signals.send_booking_created")
+    def test_notification_is_queued_after_commit(self, mock_task):
+        with self.captureOnCommitCallbacks() as callbacks:
+            borrowing = self.create_borrowing()
+
+        mock_task.delay.assert_not_called()
+        for callback in callbacks:
+            callback()
+        mock_task.delay.assert_called_once_with(borrowing.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            borrowing.save()
+        self.assertEqual(callbacks, [])
+
+    @patch("notifications_service.tasks.send_telegram_message")
+    @patch(
+        "notifications_service.notifications.get_telegram_id",
+        return_value=None,
+    )
+    def test_user_without_telegram_is_skipped(self, mock_get_id, mock_send):
+        borrowing = self.create_borrowing()
+
+        send_booking_created.apply(args=(borrowing.id,))
+
+        mock_send.delay.assert_not_called()
+
+    @patch("notifications_service.tasks.send_telegram_message")
+    @patch(
+        "notifications_service.notifications.get_telegram_id",
+        return_value="42",
+    )
+    def test_booking_message_is_sent_to_user(self, mock_get_id, mock_send):
+        borrowing = self.create_borrowing()
+
+        send_booking_created.apply(args=(borrowing.id,))
+
+        telegram_id, text = mock_send.delay.call_args.args
+        self.assertEqual(telegram_id, "42")
+        self.assertIn(self.book.title, text)
+
+
+@patch("notifications_service.tasks.send_message")
+@patch("notifications_service.tasks.rate_limiter")
+class SendTelegramMessageTests(SimpleTestCase):
+    def test_waits_for_rate_limiter(self, mock_limiter, mock_send):
+        mock_limiter.acquire.return_value = 0.4
+
+        with patch.object(send_telegram_message, "apply_async") as mock_later:
+            send_telegram_message.apply(args=("42", "hello"), retries=2)
+
+        mock_send.assert_not_called()
+        mock_later.assert_called_once()
+        self.assertEqual(mock_later.call_args.args[0], ("42", "hello"))
+        self.assertEqual(mock_later.call_args.kwargs["countdown"], 0.4)
+        # Waiting for the limiter does not use up the retries.
+        self.assertEqual(mock_later.call_args.kwargs["retries"], 2)
+
+    def test_retries_after_delay_requested_by_telegram(
+        self, mock_limiter, mock_send
+    ):
+        mock_limiter.acquire.return_value = 0
+        mock_send.side_effect = TelegramError("Too Many", retry_after=7)
+
+        with patch.object(send_telegram_message, "retry") as mock_retry:
+            mock_retry.side_effect = RuntimeError("retry")
+            send_telegram_message.apply(args=("42", "hello"))
+
+        self.assertEqual(mock_retry.call_args.kwargs["countdown"], 7)
+
+    def test_retries_network_errors_with_backoff(
+        self, mock_limiter, mock_send
+    ):
+        mock_limiter.acquire.return_value = 0
+        mock_send.side_effect = [httpx.ConnectError("down"), None]
+
+        result = send_telegram_message.apply(args=("42", "hello"))
+
+        self.assertTrue(result.successful())
+        self.assertEqual(mock_send.call_count, 2)
+
+    def test_rejected_message_is_not_retried(self, mock_limiter, mock_send):
+        mock_limiter.acquire.return_value = 0
+        mock_send.side_effect = TelegramError("Forbidden: bot was blocked")
+
+        result = send_telegram_message.apply(args=("42", "hello"))
+
+        self.assertTrue(result.successful())
+        mock_send.assert_called_once()
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+class TelegramRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        redis_client.delete(
+            "telegram:rate:global",
+            *(f"telegram:rate:chat:{chat}" for chat in range(5)),
+        )
+        self.limiter = TelegramRateLimiter(
+            redis_client, global_limit=3, chat_interval=1
+        )
+
+    def test_limits_chat_and_global_rate(self):
+        self.assertEqual(self.limiter.acquire(0), 0)
+        self.assertGreater(self.limiter.acquire(0), 0.5)
+
+        # Three messages per second are sent a third of a second apart.
+        wait = self.limiter.acquire(1)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.334)
+        time.sleep(wait)
+        self.assertEqual(self.limiter.acquire(1), 0)
+        self.assertGreater(self.limiter.acquire(2), 0)
+
+
+class DigestTests(SimpleTestCase):
+    def test_single_message_is_sent_as_is(self):
+        self.assertEqual(build_digest(["hello"]), ["hello"])
+
+    def test_messages_are_coalesced_within_length_limit(self):
+        texts = [f"message {index}" for index in range(30)]
+
+        digests = build_digest(texts, max_length=200)
+
+        self.assertGreater(len(digests), 1)
+        self.assertTrue(all(len(digest) <= 200 for digest in digests))
+        self.assertTrue(digests[0].startswith("🔔 You have 30"))
+        joined = "".join(digests)
+        self.assertTrue(all(text in joined for text in texts))
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+class AsyncTelegramSenderTests(SimpleTestCase):
+    def setUp(self):
+        redis_client.delete(
+            "telegram:rate:global",
+            *(f"telegram:rate:chat:{chat}" for chat in range(20)),
+        )
+        # The API allows a little more than the sender uses, so messages
+        # spaced exactly by the sender are not rejected on the boundary.
+        self.server = make_server(port=0, global_limit=30, chat_interval=0.15)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.sender = AsyncTelegramSender(
+            api_url=f"http://127.0.0.1:{self.server.server_port}",
+            token="test",
+            rate=30,
+            chat_interval=0.2,
+            concurrency=10,
+        )
+
+    def test_sends_within_api_limits(self):
+        digests = {str(chat): ["one"] for chat in range(20)}
+        digests["0"] = ["first part", "second part"]
+
+        report = asyncio.run(send_digests(self.sender, digests))
+
+        self.assertEqual(report.sent, 21)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(self.server.rejected, 0)
+        self.assertEqual(
+            [
+                message["text"]
+                for message in self.server.messages
+                if message["chat"]["id"] == "0"
+            ],
+            ["first part", "second part"],
+        )
+
+    def test_rate_limited_messages_are_queued_again(self):
+        self.server.global_limit = 1
+        self.sender.rate = 1000
+
+        with (
+            patch(
+                "notifications_service.engine.pop_due",
+                return_value={
+                    "1": (["a"], []),
+                    "2": (["b"], []),
+                    "3": (["c"], []),
+                },
+            ),
+            patch(
+                "notifications_service.engine.requeue_messages"
+            ) as mock_requeue,
+        ):
+            report = flush_notifications(sender=self.sender)
+
+        self.assertEqual(report.sent, 1)
+        retried = mock_requeue.call_args.args[0]
+        self.assertEqual(len(retried), 2)
+        self.assertTrue(all(retry_after == 1 for *_, retry_after in retried))
+
+    def test_sends_share_the_rate_limiter(self):
+        self.server.chat_interval = 0
+        redis_client.set("telegram:rate:chat:1", 1, px=300)
+
+        started = time.perf_counter()
+        report = asyncio.run(send_digests(self.sender, {"1": ["a"]}))
+
+        self.assertEqual(report.sent, 1)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.25)
+
+    def test_retried_digest_is_sent_as_it_was(self):
+        digest = build_digest(["a", "b"])[0]
+
+        with patch(
+            "notifications_service.engine.pop_due",
+            return_value={"1": (["c"], [digest])},
+        ):
+            report = flush_notifications(sender=self.sender)
+
+        self.assertEqual(report.sent, 2)
+        self.assertEqual(
+            [message["text"] for message in self.server.messages],
+            [digest, "c"],
+        )
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+class NotificationQueueTests(SimpleTestCase):
+    def setUp(self):
+        redis_client.delete(
+            DUE_KEY,
+            *(
+                f"{prefix}{c}"
+                for prefix in (PENDING_KEY_PREFIX, READY_KEY_PREFIX)
+                for c in "12"
+            ),
+        )
+
+    def test_messages_are_grouped_per_chat_until_due(self):
+        queue_notifications([("1", "a"), ("2", "b"), ("1", "c")], window=60)
+
+        self.assertEqual(pop_due(100), {})
+        self.assertEqual(
+            pop_due(100, now=time.time() + 61),
+            {"1": (["a", "c"], []), "2": (["b"], [])},
+        )
+        self.assertEqual(pop_due(100, now=time.time() + 61), {})
+
+    def test_failed_messages_are_queued_as_they_were(self):
+        queue_notifications([("1", "a")], window=0)
+        requeue_messages([("1", "digest", 30)])
+
+        self.assertEqual(pop_due(100), {})
+        self.assertEqual(
+            pop_due(100, now=time.time() + 31), {"1": (["a"], ["digest"])}
+        )
@@ -1,26 +1,138 @@
-from dotenv import load_dotenv
-from telegram.ext import Application
-import os
+import math
 
+from django.conf import settings
 
-load_dotenv()
+from core.async_clients import get_http_client, get_redis
+from core.clients import get_telegram_client
+from telegram_bot.redis_client import redis_client
 
-if os.getenv("DJANGO_ENV") == "local":
-    application = None
-else:
-    TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
 
-# application = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
+class TelegramError(Exception):
+    """
+    Telegram rejected the message. `retry_after` is set
+    when the message may be sent again later.
+    """
+
+    def __init__(self, description, retry_after=None):
+        super().__init__(description)
+        self.retry_after = retry_after
+
+
+def send_message(telegram_id, text):
+    """
+    Sends a message through the Telegram Bot API.
+    """
+    response = get_telegram_client().post(
+        f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_TOKEN}"
+        "/sendMessage",
+        json={"chat_id": telegram_id, "text": text},
+    )
+    if response.is_success:
+        return response.json()
+    raise telegram_error(
+        response.status_code, response.reason_phrase, response
+    )
 
 
-async def send_telegram_message(telegram_id, message):
+async def asend_message(telegram_id, text):
     """
-    Sends a message to the user via Telegram.
-    :param telegram_id: The user's Telegram ID.
-    :param message: The message text.
+    Sends a message over the shared async HTTP client.
     """
+    response = await get_http_client().post(
+        f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_TOKEN}"
+        "/sendMessage",
+        json={"chat_id": telegram_id, "text": text},
+    )
+    if response.is_success:
+        return response.json()
+    raise telegram_error(
+        response.status_code, response.reason_phrase, response
+    )
+
+
+def telegram_error(status_code, reason, response):
     try:
-        await application.bot.send_message(chat_id=telegram_id, text=message)
-    except Exception as e:
-        raise RuntimeError (f"Error sending message to user {telegram_id}: {e}")
+        data = response.json()
+    except ValueError:
+        data = {}
+    description = data.get("description", reason)
+    if status_code == 429:
+        retry_after = data.get("parameters", {}).get("retry_after", 1)
+        return TelegramError(description, retry_after=retry_after)
+    if status_code >= 500:
+        return TelegramError(description, retry_after=0)
+    return TelegramError(description)
+
+
+# Returns 0 when the message may be sent now,
+# otherwise the number of milliseconds to wait.
+# Messages are spread evenly over the second instead of in bursts,
+# which the API would reject when they arrive with uneven delays.
+RATE_LIMIT_SCRIPT = """
+local wait = math.max(
+    redis.call("PTTL", KEYS[1]), redis.call("PTTL", KEYS[2])
+)
+if wait > 0 then
+    return wait
+end
+redis.call("SET", KEYS[1], 1, "PX", ARGV[1])
+redis.call("SET", KEYS[2], 1, "PX", ARGV[2])
+return 0
+"""
+
+
+class TelegramRateLimiter:
+    """
+    Shared limiter for all notification workers: at most one message per
+    chat every `chat_interval` seconds and `global_limit` messages
+    per second, as required by Telegram.
+    """
+
+    def __init__(self, client, global_limit, chat_interval):
+        self.client = client
+        self.global_limit = global_limit
+        self.chat_interval_ms = int(chat_interval * 1000)
+        self.global_interval_ms = math.ceil(1000 / global_limit)
+        self.script = client.register_script(RATE_LIMIT_SCRIPT)
+
+    def acquire(self, telegram_id):
+        """
+        Reserves a slot for the chat and returns 0,
+        or returns the number of seconds to wait before trying again.
+        """
+        wait_ms = self.script(
+            keys=self.keys(telegram_id),
+            args=(self.chat_interval_ms, self.global_interval_ms),
+        )
+        return int(wait_ms) / 1000
+
+    def keys(self, telegram_id):
+        return f"telegram:rate:chat:{telegram_id}", "telegram:rate:global"
+
+
+class AsyncTelegramRateLimiter(TelegramRateLimiter):
+    """
+    The same limiter over a `redis.asyncio` client.
+    """
+
+    async def acquire(self, telegram_id):
+        wait_ms = await self.script(
+            keys=self.keys(telegram_id),
+            args=(self.chat_interval_ms, self.global_interval_ms),
+        )
+        return int(wait_ms) / 1000
+
+
+rate_limiter = TelegramRateLimiter(
+    redis_client,
+    global_limit=settings.TELEGRAM_GLOBAL_RATE_LIMIT,
+    chat_interval=settings.TELEGRAM_CHAT_INTERVAL,
+)
+
+
+def get_async_rate_limiter():
+    return AsyncTelegramRateLimiter(
+        get_redis(),
+        global_limit=settings.TELEGRAM_GLOBAL_RATE_LIMIT,
+        chat_interval=settings.TELEGRAM_CHAT_INTERVAL,
+    )
@@ -0,0 +1,122 @@
+import logging
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+
+from borrowing_service.holds import aconfirm_hold
+from borrowing_service.models import Borrowing
+from core.async_clients import get_http_client
+from core.async_views import async_api_view
+from core.clients import get_stripe
+from notifications_service.tasks import send_telegram_message
+from notifications_service.utils import (
+    TelegramError,
+    asend_message,
+    get_async_rate_limiter,
+)
+from notifications_service.notifications import get_success_message
+from payments_service.models import Payment, StatusChoices
+from telegram_bot.redis_client import aget_telegram_id
+
+
+logger = logging.getLogger(__name__)
+
+
+async def retrieve_checkout_session(session_id):
+    stripe = get_stripe()
+    response = await get_http_client().get(
+        f"{stripe.api_base}/v1/checkout/sessions/{session_id}",
+        headers={"Authorization": f"Bearer {stripe.api_key}"},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def notify(telegram_id, text):
+    """
+    Sends the message right away when the rate limits allow it,
+    otherwise leaves it to the notification workers.
+    """
+    if not await get_async_rate_limiter().acquire(telegram_id):
+        try:
+            await asend_message(telegram_id, text)
+            return
+        except (TelegramError, httpx.HTTPError) as error:
+            logger.warning("Sending to %s failed: %s", telegram_id, error)
+
+    await sync_to_async(send_telegram_message.delay)(telegram_id, text)
+
+
+@async_api_view(["GET"])
+async def payment_success(request, borrowing_id):
+    """
+    Checks the pending checkout session with Stripe, marks the payment
+    paid and notifies the user, without blocking on Stripe or Telegram.
+    Payments already confirmed by the Stripe webhook are not notified
+    again.
+    """
+    borrowings = Borrowing.objects.select_related("book", "user")
+    if not request.user.is_superuser:
+        borrowings = borrowings.filter(user=request.user)
+
+    try:
+        borrowing = await borrowings.aget(pk=borrowing_id)
+    except Borrowing.DoesNotExist:
+        raise exceptions.NotFound()
+
+    payment = await (
+        Payment.objects.filter(borrowing=borrowing, session_id__isnull=False)
+        .order_by("-id")
+        .afirst()
+    )
+    if payment is None or payment.status == StatusChoices.EXPIRED.value:
+        return JsonResponse(
+            {"status": "error", "message": "Payment is not completed."}
+        )
+    if payment.status == StatusChoices.PAID.value:
+        return JsonResponse(
+            {"status": "success", "message": "Booking successfully completed!"}
+        )
+    if payment.status == StatusChoices.REFUNDED.value:
+        return JsonResponse(
+            {
+                "status": "error",
+                "message": "The book was out of stock, payment refunded.",
+            }
+        )
+
+    try:
+        session = await retrieve_checkout_session(payment.session_id)
+    except httpx.HTTPError as error:
+        logger.warning(
+            "Checking session %s failed: %s", payment.session_id, error
+        )
+        return JsonResponse(
+            {"status": "error", "message": "Unable to verify payment."},
+            status=status.HTTP_502_BAD_GATEWAY,
+        )
+    if session.get("payment_status") != "paid":
+        return JsonResponse(
+            {"status": "error", "message": "Payment is not completed."}
+        )
+    confirmed = await Payment.objects.filter(
+        pk=payment.pk, status=StatusChoices.PENDING.value
+    ).aupdate(status=StatusChoices.PAID.value)
+
+    if confirmed:
+        await aconfirm_hold(borrowing.id)
+        telegram_id = await aget_telegram_id(borrowing.user.email)
+        if not telegram_id:
+            return JsonResponse(
+                {
+                    "status": "error",
+                    "message": "Unable to find Telegram ID of user.",
+                }
+            )
+        await notify(telegram_id, get_success_message(borrowing))
+
+    return JsonResponse(
+        {"status": "success", "message": "Booking successfully completed!"}
+    )
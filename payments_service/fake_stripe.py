@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """
+    Answers the subset of the Stripe API used by the payment pipeline.
+    Objects are kept in memory for the lifetime of the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+        path = urlparse(self.path).path
+
+        if path == "/v1/products":
+            return self._create("prod", "product", params)
+        if path == "/v1/prices":
+            return self._create("price", "price", params)
+        if path == "/v1/checkout/sessions":
+            session = self._build("cs_test", "checkout.session", params)
+            session["url"] = (
+                f"http://{self.headers['Host']}/checkout/{session['id']}"
+            )
+            session["status"] = "open"
+            session["payment_status"] = "unpaid"
+            self.server.objects[session["id"]] = session
+            return self._respond(200, session)
+
+        return self._respond(404, {"error": {"message": "Unknown path"}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        if path == "/v1/checkout/sessions":
+            return self._list_sessions(dict(parse_qsl(url.query)))
+
+        prefix, _, object_id = path.rpartition("/")
+        instance = self.server.objects.get(object_id)
+
+        if instance is None or prefix not in (
+            "/v1/checkout/sessions",
+            "/checkout",
+        ):
+            return self._respond(404, {"error": {"message": "No such object"}})
+
+        time.sleep(self.server.latency)
+        if prefix == "/checkout":
+            # Visiting the session url stands in for the customer paying.
+            instance["status"] = "complete"
+            instance["payment_status"] = "paid"
+        return self._respond(200, instance)
+
+    def _list_sessions(self, params):
+        """
+        Lists sessions newest first, filtered by `created[gte]`
+        and `created[lt]` and paginated by `starting_after`.
+        """
+        time.sleep(self.server.latency)
+        self.server.list_requests += 1
+        gte = int(params.get("created[gte]", 0))
+        lt = int(params.get("created[lt]", 2**63))
+        sessions = sorted(
+            (
+                instance
+                for instance in list(self.server.objects.values())
+                if instance["object"] == "checkout.session"
+                and gte <= instance["created"] < lt
+            ),
+            key=lambda instance: (instance["created"], instance["id"]),
+            reverse=True,
+        )
+        start = 0
+        if "starting_after" in params:
+            ids = [instance["id"] for instance in sessions]
+            start = ids.index(params["starting_after"]) + 1
+        limit = int(params.get("limit", 10))
+        return self._respond(
+            200,
+            {
+                "object": "list",
+                "url": "/v1/checkout/sessions",
+                "has_more": len(sessions) > start + limit,
+                "data": sessions[start : start + limit],
+            },
+        )
+
+    def _build(self, prefix, object_name, params):
+        time.sleep(self.server.latency)
+        return {
+            "id": f"{prefix}_{uuid.uuid4().hex[:24]}",
+            "object": object_name,
+            "created": int(time.time()),
+            "livemode": False,
+            "params": params,
+        }
+
+    def _create(self, prefix, object_name, params):
+        instance = self._build(prefix, object_name, params)
+        self.server.objects[instance["id"]] = instance
+        return self._respond(200, instance)
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=12111, latency=0.0, verbose=False):
+    server = ThreadingHTTPServer((host, port), FakeStripeHandler)
+    server.objects = {}
+    server.list_requests = 0
+    server.latency = latency
+    server.verbose = verbose
+    return server
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from datetime import date, timedelta
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from books_service.models import Book
+from borrowing_service.models import Borrowing
+from core.asgi import application
+from payments_service.models import Payment, StatusChoices, StripeEvent
+from payments_service.tasks import process_stripe_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends a burst of signed checkout session events to the Stripe "
+        "webhook, reports the acknowledge latency and the time to apply "
+        "them, and fails if p95 is above the threshold. Requires the "
+        "Docker setup (PostgreSQL and Redis)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.1,
+            help="Share of events delivered twice, as Stripe may do.",
+        )
+        parser.add_argument(
+            "--max-p95",
+            type=float,
+            default=10.0,
+            help="Allowed p95 acknowledge latency in milliseconds.",
+        )
+        parser.add_argument(
+            "--base-url",
+            help=(
+                "Send the events to a running server instead of the ASGI "
+                "app in this process. The server must use the same "
+                "STRIPE_WEBHOOK_SECRET."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "The benchmark needs PostgreSQL (DJANGO_ENV=docker)."
+            )
+
+        secret = settings.STRIPE_WEBHOOK_SECRET or "whsec_bench"
+        user, book, session_ids = self.seed(options["events"])
+        events = [
+            self.build_event(session_id, secret) for session_id in session_ids
+        ]
+        events += events[: int(len(events) * options["duplicates"])]
+
+        try:
+            with override_settings(STRIPE_WEBHOOK_SECRET=secret):
+                latencies, errors, elapsed = asyncio.run(
+                    self.send(events, options)
+                )
+                started = time.perf_counter()
+                applied = process_stripe_events()
+                applied_in = time.perf_counter() - started
+        finally:
+            StripeEvent.objects.filter(session_id__in=session_ids).delete()
+            user.delete()
+            book.delete()
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000
+        self.stdout.write(
+            f"{len(latencies)} events in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed * 60:.0f}/min), "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+            f"p95 {p95:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, "
+            f"{errors} errors; applied {applied} events in {applied_in:.2f}s"
+        )
+        if errors or p95 > options["max_p95"]:
+            raise CommandError(
+                f"p95 {p95:.1f}ms is above {options['max_p95']}ms "
+                f"or {errors} events were rejected."
+            )
+
+    def seed(self, count):
+        user = get_user_model().objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:8]}@example.com",
+            password=uuid.uuid4().hex,
+        )
+        book = Book.objects.create(
+            title=f"Bench {uuid.uuid4().hex[:8]}",
+            author="Bench",
+            cover="SOFT",
+            inventory=count,
+            daily_fee=1,
+        )
+        # Bulk inserts skip the signals, so nothing is sent while seeding.
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=user,
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for _ in range(count)
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(
+                borrowing=borrowing,
+                money_to_pay=7,
+                status=StatusChoices.PENDING.value,
+                session_id=f"cs_bench_{uuid.uuid4().hex}",
+            )
+            for borrowing in borrowings
+        )
+        return user, book, [payment.session_id for payment in payments]
+
+    def build_event(self, session_id, secret):
+        payload = json.dumps(
+            {
+                "id": f"evt_bench_{uuid.uuid4().hex}",
+                "type": "checkout.session.completed",
+                "data": {
+                    "object": {
+                        "id": session_id,
+                        "object": "checkout.session",
+                        "payment_status": "paid",
+                    }
+                },
+            }
+        )
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(),
+            f"{timestamp}.{payload}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return payload, f"t={timestamp},v1={signature}"
+
+    async def send(self, events, options):
+        if options["base_url"]:
+            transport, base_url = None, options["base_url"]
+        else:
+            transport = httpx.ASGITransport(app=application)
+            base_url = "http://localhost"
+
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        latencies = []
+        errors = 0
+
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url=base_url,
+            timeout=60,
+            limits=httpx.Limits(max_connections=options["concurrency"]),
+        ) as client:
+
+            async def call(payload, signature):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        "/api/payments/webhook/",
+                        content=payload,
+                        headers={
+                            "Content-Type": "application/json",
+                            "Stripe-Signature": signature,
+                        },
+                    )
+                    latencies.append(time.perf_counter() - started)
+                    if response.is_error:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(call(*event) for event in events))
+            elapsed = time.perf_counter() - started
+
+        return latencies, errors, elapsed
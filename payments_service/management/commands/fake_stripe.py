@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from payments_service.fake_stripe import make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Stripe API. "
+        "Set STRIPE_API_BASE to its address to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds to wait before answering each request.",
+        )
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        server = make_server(
+            host=options["host"],
+            port=options["port"],
+            latency=options["latency"],
+            verbose=options["verbose"],
+        )
+        self.stdout.write(
+            f"Fake Stripe API listening on "
+            f"http://{options['host']}:{options['port']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments_service', '0005_remove_payment_stripe_price_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('PENDING_SESSION', 'Pending_session'), ('PENDING', 'Pending'), ('PAID', 'Paid')], default='PENDING_SESSION', max_length=15),
+        ),
+        migrations.CreateModel(
+            name='PaymentOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='payments_service.payment')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created_at'], name='payment_outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+def mark_borrowing_payments(apps, schema_editor):
+    """
+    Payments of new borrowings used to get the FINE default,
+    while no fines were issued yet.
+    """
+    Payment = apps.get_model("payments_service", "Payment")
+    Payment.objects.filter(type="FINE").update(type="PAYMENT")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing_service', '0002_borrowing_indexes'),
+        ('payments_service', '0006_payment_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='type',
+            field=models.CharField(choices=[('PAYMENT', 'Payment'), ('FINE', 'Fine')], default='PAYMENT', max_length=7),
+        ),
+        migrations.RunPython(
+            mark_borrowing_payments, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('type', 'FINE')), fields=('borrowing',), name='payment_one_fine_per_borrowing'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments_service', '0007_payment_fine_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='session_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('PENDING_SESSION', 'Pending_session'), ('PENDING', 'Pending'), ('PAID', 'Paid'), ('EXPIRED', 'Expired')], default='PENDING_SESSION', max_length=15),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=63)),
+                ('session_id', models.CharField(max_length=255)),
+                ('payment_status', models.CharField(blank=True, max_length=31)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='stripe_event_pending_idx')],
+            },
+        ),
+    ]
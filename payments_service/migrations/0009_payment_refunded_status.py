@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments_service', '0008_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('PENDING_SESSION', 'Pending_session'), ('PENDING', 'Pending'), ('PAID', 'Paid'), ('EXPIRED', 'Expired'), ('REFUNDED', 'Refunded')], default='PENDING_SESSION', max_length=15),
+        ),
+    ]
@@ -1,12 +1,16 @@
 import enum
+from datetime import timedelta
 
-import stripe
-from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from core.clients import get_stripe
+from payments_service.stripe_catalog import get_price_id
 
 
 STRIPE_URL = "http://127.0.0.1:8000/"
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# Stripe accepts sessions expiring 30 minutes to 24 hours after creation.
+MIN_SESSION_LIFETIME = timedelta(minutes=31)
 
 
 def calculate_sum(daily_fee, expected_date, borrow_date):
@@ -15,41 +19,70 @@ def calculate_sum(daily_fee, expected_date, borrow_date):
     return book_price * days_to_pay
 
 
-def get_stripe_data(money_to_pay, title, borrowing_id):
+def session_expiry(hold_expires_at):
+    """
+    Returns when a checkout session created now for a hold expires:
+    with the hold, but not sooner than Stripe allows.
+    """
+    return max(hold_expires_at, timezone.now() + MIN_SESSION_LIFETIME)
+
+
+def get_stripe_data(
+    money_to_pay, book, borrowing_id, payment_id, expires_at=None
+):
     """
-    The function creates instances of stripe
-    and by them creates a session for payment.
+    The function creates a session for payment
+    using the cached Stripe product and price of the book.
+    Retries for the same payment and amount get the same session back.
+    The session expires at `expires_at`, if given.
     Returns session id and session url.
     """
-    product = stripe.Product.create(
-        name=title
-    )  # create stripe product with title of book
-    stripe_product_id = product.id  # assign the value
-
-    price = stripe.Price.create(  # create stripe price
-        unit_amount=int(money_to_pay * 100),
-        currency="usd",
-        product=stripe_product_id,
-    )
-    stripe_price_id = price.id  # assign the value
-    session = stripe.checkout.Session.create(  # create the session
+    unit_amount = int(money_to_pay * 100)
+    price_id = get_price_id(book, unit_amount)
+    options = {}
+    if expires_at is not None:
+        options["expires_at"] = int(expires_at.timestamp())
+    session = get_stripe().checkout.Session.create(
         payment_method_types=["card"],
         line_items=[
             {
-                "price": stripe_price_id,
+                "price": price_id,
                 "quantity": 1,
             }
         ],
         mode="payment",
         success_url=f"{STRIPE_URL}api/payments/{borrowing_id}/success/",
         cancel_url=f"{STRIPE_URL}api/payments/{borrowing_id}/cancel/",
+        idempotency_key=f"payment-{payment_id}-session-{unit_amount}",
+        **options,
     )
     return session.id, session.url
 
 
+def close_session(session_id):
+    """
+    Expires an open checkout session so it can no longer be paid.
+    Returns False if the session was completed, e.g. paid in the meantime,
+    or if Stripe could not tell.
+    """
+    stripe = get_stripe()
+    try:
+        session = stripe.checkout.Session.retrieve(session_id)
+        if session.status == "complete":
+            return False
+        if session.status == "open":
+            stripe.checkout.Session.expire(session_id)
+    except stripe.StripeError:
+        return False
+    return True
+
+
 class StatusChoices(enum.Enum):
+    PENDING_SESSION = "PENDING_SESSION"
     PENDING = "PENDING"
     PAID = "PAID"
+    EXPIRED = "EXPIRED"
+    REFUNDED = "REFUNDED"
 
 
 class TypeChoices(enum.Enum):
@@ -59,19 +92,19 @@ class TypeChoices(enum.Enum):
 
 class Payment(models.Model):
     status = models.CharField(
-        max_length=7,
+        max_length=15,
         choices=[
             (status.value, status.name.capitalize())
             for status in StatusChoices
         ],
-        default=StatusChoices.PENDING.value,
+        default=StatusChoices.PENDING_SESSION.value,
     )
     type = models.CharField(
         max_length=7,
         choices=[
             (type_.value, type_.name.capitalize()) for type_ in TypeChoices
         ],
-        default=TypeChoices.FINE.value,
+        default=TypeChoices.PAYMENT.value,
     )
     borrowing = models.ForeignKey(
         to="borrowing_service.Borrowing",
@@ -80,20 +113,95 @@ class Payment(models.Model):
     )
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
     session_url = models.URLField(max_length=511, blank=True, null=True)
-    session_id = models.CharField(max_length=255, blank=True, null=True)
+    session_id = models.CharField(
+        max_length=255, blank=True, null=True, db_index=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["borrowing"],
+                condition=models.Q(type="FINE"),
+                name="payment_one_fine_per_borrowing",
+            )
+        ]
 
     def save(self, *args, **kwargs):
-        self.money_to_pay = calculate_sum(
-            self.borrowing.book.daily_fee,
-            self.borrowing.expected_return_date,
-            self.borrowing.borrow_date,
+        """
+        A new payment is stored without a checkout session.
+        The session is created by a Celery worker from the outbox
+        entry that is committed together with the payment.
+        """
+        if not self._state.adding:
+            return super(Payment, self).save(*args, **kwargs)
+
+        if self.money_to_pay is None:
+            self.money_to_pay = calculate_sum(
+                self.borrowing.book.daily_fee,
+                self.borrowing.expected_return_date,
+                self.borrowing.borrow_date,
+            )
+        self.status = StatusChoices.PENDING_SESSION.value
+
+        with transaction.atomic():
+            super(Payment, self).save(*args, **kwargs)
+            outbox = PaymentOutbox.objects.create(payment=self)
+
+        from payments_service.tasks import create_checkout_session
+
+        transaction.on_commit(
+            lambda: create_checkout_session.delay(outbox.id)
         )
 
-        self.session_id, self.session_url = (
-            get_stripe_data(  # assign the values of url and id from the function
-                money_to_pay=self.money_to_pay,
-                title=self.borrowing.book.title,
-                borrowing_id=self.borrowing.id,
+
+class PaymentOutbox(models.Model):
+    """
+    Checkout sessions waiting to be created in Stripe.
+    """
+
+    payment = models.OneToOneField(
+        Payment, on_delete=models.CASCADE, related_name="outbox"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="payment_outbox_pending_idx",
             )
-        )
-        return super(Payment, self).save(*args, **kwargs)
+        ]
+
+    def __str__(self):
+        return f"Outbox entry for payment {self.payment_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    Checkout session events received by the Stripe webhook.
+    The unique event id drops redeliveries; pending events
+    are applied in batches by `process_stripe_events`.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=63)
+    session_id = models.CharField(max_length=255)
+    payment_status = models.CharField(max_length=31, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
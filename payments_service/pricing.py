@@ -0,0 +1,154 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import (
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Round
+
+
+CENT = Decimal("0.01")
+PRICE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def calculate_fine(daily_fee, expected_date, today):
+    days_overdue = max((today - expected_date).days, 0)
+    return to_money(daily_fee * days_overdue * settings.FINE_MULTIPLIER)
+
+
+def to_money(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# SQL path: prices computed by the database for a whole queryset.
+
+
+class DaysBetween(Func):
+    """
+    Number of days from the `start` date expression to the `end` one.
+    """
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        (end, end_params), (start, start_params) = (
+            compiler.compile(expression)
+            for expression in self.get_source_expressions()
+        )
+        return (
+            f"CAST(julianday({end}) - julianday({start}) AS INTEGER)",
+            (*end_params, *start_params),
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template="DATEDIFF(%(expressions)s)",
+            arg_joiner=", ",
+            **extra_context,
+        )
+
+
+def fee_expression(prefix=""):
+    """
+    Regular fee of a borrowing: daily fee for every day
+    from the borrow date to the expected return date.
+    `prefix` is the lookup path to the borrowing, e.g. "borrowing__".
+    """
+    return ExpressionWrapper(
+        F(f"{prefix}book__daily_fee")
+        * DaysBetween(
+            F(f"{prefix}expected_return_date"), F(f"{prefix}borrow_date")
+        ),
+        output_field=PRICE_FIELD,
+    )
+
+
+def fine_expression(today, prefix="", multiplier=None):
+    """
+    Fine of a borrowing: daily fee times the multiplier for every day
+    it was kept after the expected return date, until it was returned
+    or until `today` if it is still active.
+    """
+    multiplier = settings.FINE_MULTIPLIER if multiplier is None else multiplier
+    days_overdue = Greatest(
+        DaysBetween(
+            Coalesce(
+                F(f"{prefix}actual_return_date"),
+                Value(today, output_field=DateField()),
+            ),
+            F(f"{prefix}expected_return_date"),
+        ),
+        Value(0),
+    )
+    return Round(
+        ExpressionWrapper(
+            F(f"{prefix}book__daily_fee")
+            * days_overdue
+            * Value(multiplier, output_field=PRICE_FIELD),
+            output_field=PRICE_FIELD,
+        ),
+        2,
+        output_field=PRICE_FIELD,
+    )
+
+
+def with_prices(queryset, today, prefix=""):
+    """
+    Annotates `fee` and `fine` on a queryset of borrowings,
+    or of models related to them through `prefix`.
+    """
+    return queryset.annotate(
+        fee=fee_expression(prefix),
+        fine=fine_expression(today, prefix),
+    )
+
+
+# Batch path: prices of many borrowings already loaded in memory.
+# Fees are multiplied as integer cents and days, so the results
+# are exact and match the scalar functions.
+
+
+def to_cents(amount):
+    return int(Decimal(amount).scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+
+def calculate_fees(daily_fees, borrow_dates, expected_dates):
+    return [
+        Decimal(to_cents(fee) * (expected - borrowed).days).scaleb(-2)
+        for fee, borrowed, expected in zip(
+            daily_fees, borrow_dates, expected_dates, strict=True
+        )
+    ]
+
+
+def calculate_fines(
+    daily_fees, expected_dates, return_dates, today, multiplier=None
+):
+    """
+    `return_dates` holds None for borrowings that are still active.
+    """
+    multiplier = Decimal(
+        settings.FINE_MULTIPLIER if multiplier is None else multiplier
+    )
+    today_ordinal = today.toordinal()
+    fines = []
+    for fee, expected, returned in zip(
+        daily_fees, expected_dates, return_dates, strict=True
+    ):
+        end = returned.toordinal() if returned else today_ordinal
+        cents = to_cents(fee) * max(end - expected.toordinal(), 0)
+        fines.append(to_money((cents * multiplier).scaleb(-2)))
+    return fines
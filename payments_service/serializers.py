@@ -6,4 +6,4 @@ from payments_service.models import Payment
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ("session_url", "session_id")
+        fields = ("id", "status", "session_url", "session_id")
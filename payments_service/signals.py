@@ -1,14 +1,15 @@
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from notifications_service.notifications import notify_payment_needed
+from notifications_service.tasks import send_payment_needed
 from payments_service.models import Payment
 
 
 @receiver([post_save], sender=Payment)
-def handle_payment_created(sender, instance, **kwargs):
-    print(f"instance payment: {instance}")
-    from telegram_bot.main import send_notification
-    if instance.session_url:
-        telegram_id, message = notify_payment_needed(instance)
-        send_notification(telegram_id, message)
+def handle_payment_created(sender, instance, created, update_fields, **kwargs):
+    session_added = created or "session_url" in (update_fields or ())
+    if instance.session_url and session_added:
+        transaction.on_commit(
+            lambda: send_payment_needed.delay(instance.id)
+        )
@@ -0,0 +1,57 @@
+from django.conf import settings
+
+from books_service.models import Book
+from core.clients import get_stripe
+from core.lru import TTLCache
+
+
+price_cache = TTLCache(
+    maxsize=settings.STRIPE_PRICE_CACHE_SIZE,
+    ttl=settings.STRIPE_PRICE_CACHE_TTL,
+)
+
+
+def get_product_id(book):
+    """
+    Returns the Stripe product of the book, creating it on first use.
+    The product id is persisted on the book, so it is created only once.
+    """
+    if book.stripe_product_id:
+        return book.stripe_product_id
+
+    product = get_stripe().Product.create(
+        name=book.title,
+        metadata={"book_id": book.id},
+        idempotency_key=f"book-{book.id}-product",
+    )
+    updated = Book.objects.filter(
+        pk=book.pk, stripe_product_id__isnull=True
+    ).update(stripe_product_id=product.id)
+
+    if updated:
+        book.stripe_product_id = product.id
+    else:
+        book.refresh_from_db(fields=["stripe_product_id"])
+
+    return book.stripe_product_id
+
+
+def get_price_id(book, unit_amount):
+    """
+    Returns a Stripe price of the book for the amount in cents.
+    Prices are cached per (book, amount) in the process.
+    """
+    key = (book.id, unit_amount)
+    price_id = price_cache.get(key)
+
+    if price_id is None:
+        price = get_stripe().Price.create(
+            unit_amount=unit_amount,
+            currency="usd",
+            product=get_product_id(book),
+            idempotency_key=f"book-{book.id}-price-{unit_amount}",
+        )
+        price_id = price.id
+        price_cache.set(key, price_id)
+
+    return price_id
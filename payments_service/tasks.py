@@ -0,0 +1,359 @@
+import time
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from books_service.models import Book
+from borrowing_service.holds import confirm_holds, extend_hold
+from borrowing_service.models import Borrowing
+from core.clients import get_stripe
+from notifications_service.engine import queue_notifications
+from notifications_service.notifications import (
+    get_fine_paid_message,
+    get_success_message,
+)
+from payments_service.models import (
+    Payment,
+    PaymentOutbox,
+    StatusChoices,
+    StripeEvent,
+    TypeChoices,
+    get_stripe_data,
+    session_expiry,
+)
+from telegram_bot.redis_client import get_telegram_ids
+
+
+STRIPE_EVENTS_SCHEDULED_KEY = "payments:stripe_events:scheduled"
+RECONCILE_CHECKPOINT_KEY = "payments:reconcile:checkpoint"
+RECONCILE_LOCK_KEY = "payments:reconcile:lock"
+
+# Checkout session events that confirm the payment. A completed session
+# of a delayed payment method is paid by `async_payment_succeeded` later.
+PAID_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
+EXPIRED_EVENTS = ("checkout.session.expired",)
+STRIPE_EVENTS = PAID_EVENTS + EXPIRED_EVENTS
+
+
+@shared_task(bind=True, max_retries=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS)
+def create_checkout_session(self, outbox_id):
+    """
+    Creates the Stripe checkout session for a pending outbox entry
+    and stores the session on the payment.
+    """
+    with transaction.atomic():
+        entry = (
+            PaymentOutbox.objects.select_for_update(skip_locked=True)
+            .select_related("payment__borrowing__book")
+            .filter(pk=outbox_id, processed_at__isnull=True)
+            .first()
+        )
+        if entry is None:
+            return
+
+        payment = entry.payment
+        if payment.status != StatusChoices.PENDING_SESSION.value:
+            # The hold of the borrowing expired before the session was made.
+            entry.processed_at = timezone.now()
+            entry.save(update_fields=("processed_at",))
+            return
+        entry.attempts += 1
+        borrowing = payment.borrowing
+        expires_at = None
+        if borrowing.hold_expires_at is not None:
+            expires_at = session_expiry(borrowing.hold_expires_at)
+
+        try:
+            payment.session_id, payment.session_url = get_stripe_data(
+                money_to_pay=payment.money_to_pay,
+                book=borrowing.book,
+                borrowing_id=payment.borrowing_id,
+                payment_id=payment.id,
+                expires_at=expires_at,
+            )
+        except get_stripe().StripeError as error:
+            entry.last_error = str(error)
+            entry.save(update_fields=("attempts", "last_error"))
+            failure = error
+        else:
+            payment.status = StatusChoices.PENDING.value
+            payment.save(update_fields=("status", "session_id", "session_url"))
+            if expires_at is not None:
+                # Payments of the last moment reach us with some delay.
+                extend_hold(
+                    borrowing,
+                    expires_at + settings.BORROWING_HOLD_PAYMENT_GRACE,
+                )
+            entry.processed_at = timezone.now()
+            entry.last_error = ""
+            entry.save(
+                update_fields=("attempts", "processed_at", "last_error")
+            )
+            return
+
+    raise self.retry(exc=failure, countdown=2**self.request.retries)
+
+
+@shared_task
+def dispatch_payment_outbox(batch_size=500):
+    """
+    Re-dispatches outbox entries whose task was lost,
+    e.g. because the broker was down when the payment was committed.
+    """
+    stale_before = timezone.now() - settings.PAYMENT_OUTBOX_STALE_AFTER
+    outbox_ids = PaymentOutbox.objects.filter(
+        processed_at__isnull=True,
+        created_at__lt=stale_before,
+        attempts__lt=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS,
+    ).values_list("id", flat=True)[:batch_size]
+
+    for outbox_id in outbox_ids:
+        create_checkout_session.delay(outbox_id)
+
+    return len(outbox_ids)
+
+
+def schedule_stripe_events():
+    """
+    Enqueues one `process_stripe_events` run per burst of events
+    instead of a task per event.
+    """
+    delay = settings.STRIPE_EVENT_BATCH_DELAY
+    if cache.add(STRIPE_EVENTS_SCHEDULED_KEY, True, delay + 60):
+        process_stripe_events.apply_async(countdown=delay)
+
+
+def update_sessions(paid_sessions, expired_sessions):
+    """
+    Moves the pending payments of the checkout sessions to PAID
+    or EXPIRED with one UPDATE per status, confirms the holds of the paid
+    ones and notifies them after the commit. Returns the numbers of paid
+    and expired payments.
+    """
+    with transaction.atomic():
+        paid = list(
+            Payment.objects.select_for_update()
+            .filter(
+                session_id__in=paid_sessions,
+                status=StatusChoices.PENDING.value,
+            )
+            .values_list("id", "borrowing_id")
+        )
+        paid_ids = [payment_id for payment_id, _ in paid]
+        Payment.objects.filter(id__in=paid_ids).update(
+            status=StatusChoices.PAID.value
+        )
+        confirm_holds([borrowing_id for _, borrowing_id in paid])
+        paid_ids += reclaim_late_payments(paid_sessions)
+        expired = Payment.objects.filter(
+            session_id__in=expired_sessions,
+            status=StatusChoices.PENDING.value,
+        ).update(status=StatusChoices.EXPIRED.value)
+
+        if paid_ids:
+            transaction.on_commit(lambda: notify_paid(paid_ids))
+    return len(paid_ids), expired
+
+
+def reclaim_late_payments(paid_sessions):
+    """
+    Handles sessions paid after their hold was released: the borrowing
+    takes a copy again if the book is in stock, otherwise the payment
+    is refunded. Returns the ids of the payments that got their copy.
+    """
+    late = list(
+        Payment.objects.select_for_update()
+        .filter(
+            session_id__in=paid_sessions,
+            type=TypeChoices.PAYMENT.value,
+            status=StatusChoices.EXPIRED.value,
+        )
+        .order_by("borrowing__book_id")
+        .values_list("id", "borrowing_id", "borrowing__book_id")
+    )
+    reclaimed, refunded = [], []
+    for payment_id, borrowing_id, book_id in late:
+        if Book.objects.take_copy(book_id):
+            reclaimed.append((payment_id, borrowing_id))
+        else:
+            refunded.append(payment_id)
+
+    Payment.objects.filter(id__in=[pk for pk, _ in reclaimed]).update(
+        status=StatusChoices.PAID.value
+    )
+    Borrowing.objects.filter(pk__in=[pk for _, pk in reclaimed]).update(
+        actual_return_date=None
+    )
+    Payment.objects.filter(id__in=refunded).update(
+        status=StatusChoices.REFUNDED.value
+    )
+    for payment_id in refunded:
+        transaction.on_commit(
+            lambda payment_id=payment_id: refund_payment.delay(payment_id)
+        )
+    return [payment_id for payment_id, _ in reclaimed]
+
+
+@shared_task(bind=True, max_retries=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS)
+def refund_payment(self, payment_id):
+    """
+    Refunds a payment whose copy was gone when its late payment arrived.
+    Retries are safe: Stripe refunds a payment once per idempotency key.
+    """
+    payment = Payment.objects.get(pk=payment_id)
+    stripe = get_stripe()
+    try:
+        session = stripe.checkout.Session.retrieve(payment.session_id)
+        stripe.Refund.create(
+            payment_intent=session.payment_intent,
+            idempotency_key=f"payment-{payment_id}-refund",
+        )
+    except stripe.StripeError as error:
+        raise self.retry(exc=error, countdown=2**self.request.retries)
+
+
+def apply_stripe_events(batch_size):
+    """
+    Applies the next batch of pending events with one UPDATE per status.
+    Returns the number of events applied.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")
+            .values("id", "type", "session_id", "payment_status")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        paid_sessions = {
+            event["session_id"]
+            for event in events
+            if event["type"] in PAID_EVENTS
+            and event["payment_status"] == "paid"
+        }
+        expired_sessions = {
+            event["session_id"]
+            for event in events
+            if event["type"] in EXPIRED_EVENTS
+        }
+
+        update_sessions(paid_sessions, expired_sessions)
+        StripeEvent.objects.filter(
+            id__in=[event["id"] for event in events]
+        ).update(processed_at=timezone.now())
+    return len(events)
+
+
+def notify_paid(payment_ids):
+    payments = list(
+        Payment.objects.select_related(
+            "borrowing__book", "borrowing__user"
+        ).filter(id__in=payment_ids)
+    )
+    telegram_ids = get_telegram_ids(
+        {payment.borrowing.user.email for payment in payments}
+    )
+    queue_notifications(
+        (
+            telegram_ids[payment.borrowing.user.email],
+            get_fine_paid_message(payment.borrowing)
+            if payment.type == TypeChoices.FINE.value
+            else get_success_message(payment.borrowing),
+        )
+        for payment in payments
+        if payment.borrowing.user.email in telegram_ids
+    )
+
+
+@shared_task
+def process_stripe_events(batch_size=None):
+    """
+    Applies the pending Stripe events in batches until none are left.
+    Several workers may run it at once; locked batches are skipped.
+    """
+    # Events received from now on schedule another run.
+    cache.delete(STRIPE_EVENTS_SCHEDULED_KEY)
+    batch_size = batch_size or settings.STRIPE_EVENT_BATCH_SIZE
+    processed = 0
+    while applied := apply_stripe_events(batch_size):
+        processed += applied
+    return processed
+
+
+@shared_task
+def purge_stripe_events():
+    """
+    Deletes applied events after Stripe has stopped redelivering them.
+    """
+    deleted, _ = StripeEvent.objects.filter(
+        processed_at__lt=timezone.now() - settings.STRIPE_EVENT_TTL
+    ).delete()
+    return deleted
+
+
+def reconcile_page(sessions, report):
+    paid, expired = update_sessions(
+        {
+            session.id
+            for session in sessions
+            if session.payment_status == "paid"
+        },
+        {session.id for session in sessions if session.status == "expired"},
+    )
+    report["sessions"] += len(sessions)
+    report["paid"] += paid
+    report["expired"] += expired
+
+
+@shared_task
+def reconcile_payments(page_size=None):
+    """
+    Catches up with checkout sessions whose webhook events were lost.
+    Lists the sessions created since the checkpoint, 100 per Stripe
+    request, and updates their pending payments in bulk. The next run
+    starts from the oldest session that was still open, or from the end
+    of this run's range.
+    """
+    if not cache.add(
+        RECONCILE_LOCK_KEY, True, settings.PAYMENT_RECONCILE_LOCK_TIMEOUT
+    ):
+        return None
+
+    try:
+        page_size = page_size or settings.PAYMENT_RECONCILE_PAGE_SIZE
+        until = int(time.time())
+        since = cache.get(RECONCILE_CHECKPOINT_KEY)
+        if since is None:
+            since = until - int(
+                settings.PAYMENT_RECONCILE_LOOKBACK.total_seconds()
+            )
+
+        report = {"since": since, "sessions": 0, "paid": 0, "expired": 0}
+        checkpoint = until
+        page = []
+        sessions = get_stripe().checkout.Session.list(
+            created={"gte": since, "lt": until}, limit=page_size
+        )
+        for session in sessions.auto_paging_iter():
+            if session.status == "open":
+                checkpoint = min(checkpoint, session.created)
+            page.append(session)
+            if len(page) == page_size:
+                reconcile_page(page, report)
+                page = []
+        if page:
+            reconcile_page(page, report)
+
+        cache.set(RECONCILE_CHECKPOINT_KEY, checkpoint, None)
+        report["checkpoint"] = checkpoint
+        return report
+    finally:
+        cache.delete(RECONCILE_LOCK_KEY)
@@ -1,11 +1,57 @@
-from unittest import TestCase
-from unittest.mock import patch
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import stripe
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from books_service.models import Book
+from core.clients import get_stripe
+from notifications_service.utils import TelegramError
+from payments_service import fake_stripe
+from payments_service.async_views import notify
 from borrowing_service.models import Borrowing
-from payments_service.models import Payment
+from payments_service.models import (
+    Payment,
+    PaymentOutbox,
+    StatusChoices,
+    StripeEvent,
+    TypeChoices,
+    calculate_sum,
+    close_session,
+    get_stripe_data,
+    session_expiry,
+)
+from payments_service.pricing import (
+    calculate_fees,
+    calculate_fine,
+    calculate_fines,
+    with_prices,
+)
+from payments_service.stripe_catalog import price_cache
+from payments_service.tasks import (
+    create_checkout_session,
+    RECONCILE_CHECKPOINT_KEY,
+    RECONCILE_LOCK_KEY,
+    process_stripe_events,
+    purge_stripe_events,
+    reconcile_payments,
+    refund_payment,
+)
 
 
 class PaymentModelTests(TestCase):
@@ -23,35 +69,907 @@ class PaymentModelTests(TestCase):
         self.borrowing = Borrowing.objects.create(
             book=self.book,
             user=self.user,
-            borrow_date="2025-01-10",
-            expected_return_date="2025-01-20",
+            expected_return_date=date.today() + timedelta(days=10),
         )
 
     @patch("payments_service.models.get_stripe_data")
-    def test_payment_session_creation(self, mock_get_stripe_data):
+    def test_payment_is_created_without_session(self, mock_get_stripe_data):
+        with self.captureOnCommitCallbacks() as callbacks:
+            payment = Payment.objects.create(borrowing=self.borrowing)
+
+        mock_get_stripe_data.assert_not_called()
+        self.assertEqual(payment.status, StatusChoices.PENDING_SESSION.value)
+        self.assertEqual(payment.money_to_pay, 15)
+        self.assertIsNone(payment.session_id)
+        self.assertTrue(PaymentOutbox.objects.filter(payment=payment).exists())
+        self.assertEqual(len(callbacks), 1)
+
+    @patch("payments_service.signals.send_payment_needed")
+    @patch("payments_service.tasks.get_stripe_data")
+    def test_outbox_task_creates_session(
+        self, mock_get_stripe_data, mock_send_payment_needed
+    ):
         mock_get_stripe_data.return_value = (
             "session_id_example",
             "http://example.com/checkout/session_url",
         )
+        payment = Payment.objects.create(borrowing=self.borrowing)
 
-        payment = Payment.objects.create(
-            borrowing=self.borrowing,
-            money_to_pay=13.5,
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            create_checkout_session.apply(args=(payment.outbox.id,))
+
+        mock_send_payment_needed.delay.assert_called_once_with(payment.id)
 
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, StatusChoices.PENDING.value)
         self.assertEqual(payment.session_id, "session_id_example")
         self.assertEqual(
             payment.session_url,
             "http://example.com/checkout/session_url",
         )
-
+        self.assertIsNotNone(PaymentOutbox.objects.get().processed_at)
         mock_get_stripe_data.assert_called_once_with(
-            money_to_pay=13.5,
-            title="Test_Book",
+            money_to_pay=payment.money_to_pay,
+            book=self.book,
             borrowing_id=self.borrowing.id,
+            payment_id=payment.id,
+            expires_at=None,
+        )
+
+        create_checkout_session.apply(args=(payment.outbox.id,))
+
+        mock_get_stripe_data.assert_called_once()
+
+    @patch("borrowing_service.holds.add_hold")
+    @patch("payments_service.signals.send_payment_needed")
+    @patch("payments_service.tasks.get_stripe_data")
+    def test_outbox_task_extends_the_hold_past_the_session(
+        self, mock_get_stripe_data, mock_send_payment_needed, mock_add_hold
+    ):
+        mock_get_stripe_data.return_value = ("cs_hold", "http://example.com")
+        hold_expires_at = timezone.now() + timedelta(hours=1)
+        Borrowing.objects.filter(pk=self.borrowing.pk).update(
+            hold_expires_at=hold_expires_at
+        )
+        payment = Payment.objects.create(borrowing=self.borrowing)
+
+        create_checkout_session.apply(args=(payment.outbox.id,))
+
+        self.assertEqual(
+            mock_get_stripe_data.call_args.kwargs["expires_at"],
+            hold_expires_at,
+        )
+        self.borrowing.refresh_from_db()
+        self.assertEqual(
+            self.borrowing.hold_expires_at,
+            hold_expires_at + settings.BORROWING_HOLD_PAYMENT_GRACE,
+        )
+        mock_add_hold.assert_called_once()
+
+    @patch("payments_service.tasks.get_stripe_data")
+    def test_outbox_task_records_stripe_errors(self, mock_get_stripe_data):
+        mock_get_stripe_data.side_effect = stripe.APIConnectionError("down")
+        payment = Payment.objects.create(borrowing=self.borrowing)
+
+        with patch.object(create_checkout_session, "max_retries", 0):
+            create_checkout_session.apply(args=(payment.outbox.id,))
+
+        entry = PaymentOutbox.objects.get()
+        self.assertIsNone(entry.processed_at)
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn("down", entry.last_error)
+
+    def test_payment_status_can_be_polled_by_owner(self):
+        payment = Payment.objects.create(borrowing=self.borrowing)
+        client = APIClient()
+        url = reverse("payment:payment-detail", args=[payment.id])
+
+        client.force_authenticate(self.user)
+        response = client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["status"], StatusChoices.PENDING_SESSION.value
+        )
+
+        client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="other@test.com", password="testpassword"
+            )
+        )
+        response = client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StripeCatalogTests(TestCase):
+    def setUp(self):
+        price_cache.clear()
+        self.book = Book.objects.create(
+            title="Catalog_Book",
+            author="Test Author",
+            inventory=10,
+            daily_fee=1.5,
+        )
+
+    @patch("stripe.checkout.Session.create")
+    @patch("stripe.Price.create")
+    @patch("stripe.Product.create")
+    def test_product_and_price_are_reused(
+        self, mock_product, mock_price, mock_session
+    ):
+        mock_product.return_value.id = "prod_1"
+        mock_price.return_value.id = "price_1"
+        mock_session.return_value.id = "cs_1"
+        mock_session.return_value.url = "http://example.com/cs_1"
+
+        for borrowing_id in (1, 2, 3):
+            self.assertEqual(
+                get_stripe_data(15, self.book, borrowing_id, borrowing_id),
+                ("cs_1", "http://example.com/cs_1"),
+            )
+
+        mock_product.assert_called_once()
+        mock_price.assert_called_once()
+        self.assertEqual(mock_session.call_count, 3)
+        self.assertEqual(
+            mock_session.call_args.kwargs["line_items"],
+            [{"price": "price_1", "quantity": 1}],
+        )
+        self.assertEqual(
+            mock_session.call_args.kwargs["idempotency_key"],
+            "payment-3-session-1500",
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stripe_product_id, "prod_1")
+
+        get_stripe_data(30, self.book, 4, 4)
+
+        mock_product.assert_called_once()
+        self.assertEqual(mock_price.call_count, 2)
+        self.assertEqual(mock_price.call_args.kwargs["unit_amount"], 3000)
+
+    @patch("stripe.checkout.Session.create")
+    @patch("payments_service.models.get_price_id", return_value="price_1")
+    def test_session_expires_with_the_hold(self, mock_price, mock_session):
+        hold_expires_at = timezone.now() + timedelta(hours=1)
+        expires_at = session_expiry(hold_expires_at)
+
+        get_stripe_data(15, self.book, 1, 1, expires_at=expires_at)
+        self.assertEqual(expires_at, hold_expires_at)
+        self.assertEqual(
+            mock_session.call_args.kwargs["expires_at"],
+            int(hold_expires_at.timestamp()),
+        )
+
+        # Stripe rejects sessions expiring in less than 30 minutes.
+        get_stripe_data(
+            15, self.book, 2, 2, expires_at=session_expiry(timezone.now())
+        )
+        self.assertGreater(
+            mock_session.call_args.kwargs["expires_at"],
+            time.time() + 30 * 60,
+        )
+
+
+class CloseSessionTests(SimpleTestCase):
+    @patch("payments_service.models.get_stripe")
+    def test_open_session_is_expired(self, mock_get_stripe):
+        sessions = mock_get_stripe.return_value.checkout.Session
+        sessions.retrieve.return_value.status = "open"
+
+        self.assertTrue(close_session("cs_open"))
+        sessions.expire.assert_called_once_with("cs_open")
+
+    @patch("payments_service.models.get_stripe")
+    def test_completed_session_is_kept(self, mock_get_stripe):
+        sessions = mock_get_stripe.return_value.checkout.Session
+        sessions.retrieve.return_value.status = "complete"
+
+        self.assertFalse(close_session("cs_paid"))
+        sessions.expire.assert_not_called()
+
+    @patch("payments_service.models.get_stripe")
+    def test_session_paid_while_expiring_is_kept(self, mock_get_stripe):
+        mock_get_stripe.return_value.StripeError = stripe.StripeError
+        sessions = mock_get_stripe.return_value.checkout.Session
+        sessions.retrieve.return_value.status = "open"
+        sessions.expire.side_effect = stripe.InvalidRequestError(
+            "Only open sessions can be expired.", None
+        )
+
+        self.assertFalse(close_session("cs_paid"))
+
+
+PRICING_CASES = (
+    # daily fee, borrowed days ago, expected in days, returned days ago
+    ("1.50", 20, -5, None),
+    ("0.99", 10, 3, None),
+    ("2.35", 30, -12, 4),
+    ("0.01", 40, -30, 35),
+    ("12.45", 7, -1, 7),
+    ("3.33", 3, 0, None),
+)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        user = get_user_model().objects.create_user(
+            email="pricing@test.com", password="testpassword"
+        )
+        for index, (fee, borrowed, expected, returned) in enumerate(
+            PRICING_CASES
+        ):
+            book = Book.objects.create(
+                title=f"Pricing book {index}",
+                author="Author",
+                inventory=1,
+                daily_fee=Decimal(fee),
+            )
+            Borrowing.objects.bulk_create(
+                [
+                    Borrowing(
+                        book=book,
+                        user=user,
+                        expected_return_date=(
+                            self.today + timedelta(days=expected)
+                        ),
+                        actual_return_date=(
+                            None
+                            if returned is None
+                            else self.today - timedelta(days=returned)
+                        ),
+                    )
+                ]
+            )
+            Borrowing.objects.filter(book=book).update(
+                borrow_date=self.today - timedelta(days=borrowed)
+            )
+        self.borrowings = list(
+            Borrowing.objects.select_related("book").order_by("id")
+        )
+
+    def expected_fines(self):
+        return [
+            calculate_fine(
+                borrowing.book.daily_fee,
+                borrowing.expected_return_date,
+                borrowing.actual_return_date or self.today,
+            )
+            for borrowing in self.borrowings
+        ]
+
+    def test_sql_prices_match_scalar_functions(self):
+        annotated = with_prices(Borrowing.objects.order_by("id"), self.today)
+
+        self.assertEqual(
+            [borrowing.fee for borrowing in annotated],
+            [
+                calculate_sum(
+                    borrowing.book.daily_fee,
+                    borrowing.expected_return_date,
+                    borrowing.borrow_date,
+                )
+                for borrowing in self.borrowings
+            ],
+        )
+        self.assertEqual(
+            [borrowing.fine for borrowing in annotated],
+            self.expected_fines(),
+        )
+
+    def test_sql_prices_through_payments(self):
+        for borrowing in self.borrowings:
+            Payment.objects.create(borrowing=borrowing)
+
+        payments = with_prices(
+            Payment.objects.order_by("borrowing_id"),
+            self.today,
+            prefix="borrowing__",
+        )
+
+        self.assertEqual(
+            [payment.fee for payment in payments],
+            [payment.money_to_pay for payment in payments],
+        )
+
+    @override_settings(FINE_MULTIPLIER=Decimal("1.5"))
+    def test_batch_prices_match_scalar_functions(self):
+        fees = calculate_fees(
+            [borrowing.book.daily_fee for borrowing in self.borrowings],
+            [borrowing.borrow_date for borrowing in self.borrowings],
+            [borrowing.expected_return_date for borrowing in self.borrowings],
+        )
+        fines = calculate_fines(
+            [borrowing.book.daily_fee for borrowing in self.borrowings],
+            [borrowing.expected_return_date for borrowing in self.borrowings],
+            [borrowing.actual_return_date for borrowing in self.borrowings],
+            self.today,
+        )
+
+        self.assertEqual(
+            fees,
+            [
+                calculate_sum(
+                    borrowing.book.daily_fee,
+                    borrowing.expected_return_date,
+                    borrowing.borrow_date,
+                )
+                for borrowing in self.borrowings
+            ],
+        )
+        self.assertEqual(fines, self.expected_fines())
+        annotated = with_prices(Borrowing.objects.order_by("id"), self.today)
+        self.assertEqual([borrowing.fine for borrowing in annotated], fines)
+
+
+class BatchPricingTests(SimpleTestCase):
+    def test_fines_are_rounded_half_up_to_cents(self):
+        today = date(2025, 1, 10)
+
+        fines = calculate_fines(
+            ["1.25", "0.01", Decimal("3")],
+            [date(2025, 1, 9), date(2025, 1, 9), date(2025, 1, 20)],
+            [None, None, None],
+            today,
+            multiplier="1.5",
+        )
+
+        self.assertEqual(fines, [Decimal("1.88"), Decimal("0.02"), 0])
+
+
+def create_paid_borrowing(email, title=None):
+    user = get_user_model().objects.create_user(
+        email=email, password="testpassword"
+    )
+    book = Book.objects.create(
+        title=title or f"Book of {email}",
+        author="Author",
+        inventory=10,
+        daily_fee=2,
+    )
+    return Borrowing.objects.create(
+        book=book,
+        user=user,
+        expected_return_date=date.today() + timedelta(days=5),
+    )
+
+
+def create_pending_payment(borrowing, session_id, **kwargs):
+    payment = Payment.objects.create(
+        borrowing=borrowing, money_to_pay=10, **kwargs
+    )
+    Payment.objects.filter(pk=payment.pk).update(
+        status=StatusChoices.PENDING.value, session_id=session_id
+    )
+    return payment
+
+
+def stripe_event(event_id, event_type, session_id, payment_status="paid"):
+    return {
+        "id": event_id,
+        "type": event_type,
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": payment_status,
+            }
+        },
+    }
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+@patch("payments_service.tasks.process_stripe_events")
+class StripeWebhookTests(TestCase):
+    url = reverse("payment:stripe-webhook")
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, event, secret="whsec_test", timestamp=None):
+        payload = json.dumps(event)
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signature = hmac.new(
+            secret.encode(),
+            f"{timestamp}.{payload}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            headers={"Stripe-Signature": f"t={timestamp},v1={signature}"},
+        )
+
+    def test_events_are_stored_and_scheduled_once(self, mock_task):
+        for number in range(3):
+            response = self.post(
+                stripe_event(
+                    f"evt_{number}",
+                    "checkout.session.completed",
+                    f"cs_{number}",
+                )
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(
+            list(
+                StripeEvent.objects.order_by("id").values_list(
+                    "event_id", "session_id", "payment_status"
+                )
+            ),
+            [(f"evt_{n}", f"cs_{n}", "paid") for n in range(3)],
+        )
+        mock_task.apply_async.assert_called_once_with(countdown=1)
+
+    def test_redelivered_event_is_stored_once(self, mock_task):
+        event = stripe_event("evt_1", "checkout.session.expired", "cs_1")
+
+        self.post(event)
+        response = self.post(event)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_invalid_signature_is_rejected(self, mock_task):
+        event = stripe_event("evt_1", "checkout.session.completed", "cs_1")
+
+        responses = (
+            self.post(event, secret="whsec_other"),
+            self.post(event, timestamp=int(time.time()) - 3600),
+            self.client.post(
+                self.url, json.dumps(event), content_type="application/json"
+            ),
+        )
+
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+        mock_task.apply_async.assert_not_called()
+
+    def test_other_events_are_acknowledged(self, mock_task):
+        response = self.post(
+            stripe_event("evt_1", "payment_intent.created", "pi_1")
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_webhook_is_disabled_without_secret(self, mock_task):
+        response = self.post(
+            stripe_event("evt_1", "checkout.session.completed", "cs_1")
         )
 
-    def tearDown(self):
-        get_user_model().objects.all().delete()
-        Book.objects.all().delete()
-        Borrowing.objects.all().delete()
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@patch("payments_service.tasks.queue_notifications")
+@patch("payments_service.tasks.get_telegram_ids")
+class StripeEventProcessingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.borrowing = create_paid_borrowing("paid@test.com")
+        self.paid = create_pending_payment(self.borrowing, "cs_paid")
+        self.delayed = create_pending_payment(
+            create_paid_borrowing("delayed@test.com", "Delayed book"),
+            "cs_delayed",
+        )
+        self.expired = create_pending_payment(
+            create_paid_borrowing("expired@test.com"), "cs_expired"
+        )
+        self.fine = create_pending_payment(
+            self.borrowing, "cs_fine", type=TypeChoices.FINE.value
+        )
+
+    def receive(self, *events):
+        StripeEvent.objects.bulk_create(
+            StripeEvent(
+                event_id=event["id"],
+                type=event["type"],
+                session_id=event["data"]["object"]["id"],
+                payment_status=event["data"]["object"]["payment_status"],
+            )
+            for event in events
+        )
+
+    def process(self, batch_size=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return process_stripe_events(batch_size=batch_size)
+
+    def status_of(self, payment):
+        payment.refresh_from_db()
+        return payment.status
+
+    def test_events_are_applied_in_batches(self, mock_ids, mock_queue):
+        mock_ids.return_value = {"paid@test.com": "42"}
+        self.receive(
+            stripe_event("evt_1", "checkout.session.completed", "cs_paid"),
+            stripe_event(
+                "evt_2",
+                "checkout.session.completed",
+                "cs_delayed",
+                payment_status="unpaid",
+            ),
+            stripe_event("evt_3", "checkout.session.expired", "cs_expired"),
+            stripe_event("evt_4", "checkout.session.completed", "cs_fine"),
+            stripe_event("evt_5", "checkout.session.completed", "cs_other"),
+        )
+
+        self.assertEqual(self.process(), 5)
+
+        self.assertEqual(self.status_of(self.paid), StatusChoices.PAID.value)
+        self.assertEqual(
+            self.status_of(self.delayed), StatusChoices.PENDING.value
+        )
+        self.assertEqual(
+            self.status_of(self.expired), StatusChoices.EXPIRED.value
+        )
+        self.assertEqual(self.status_of(self.fine), StatusChoices.PAID.value)
+        self.assertFalse(
+            StripeEvent.objects.filter(processed_at__isnull=True).exists()
+        )
+        messages = [
+            message
+            for call in mock_queue.call_args_list
+            for message in call.args[0]
+        ]
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(all(chat == "42" for chat, _ in messages))
+        self.assertTrue(
+            any("successfully booked" in text for _, text in messages)
+        )
+        self.assertTrue(any("fine" in text for _, text in messages))
+
+    def test_delayed_payment_is_paid_later(self, mock_ids, mock_queue):
+        mock_ids.return_value = {}
+        self.receive(
+            stripe_event(
+                "evt_1",
+                "checkout.session.completed",
+                "cs_delayed",
+                payment_status="unpaid",
+            ),
+            stripe_event(
+                "evt_2",
+                "checkout.session.async_payment_succeeded",
+                "cs_delayed",
+            ),
+        )
+
+        self.process()
+
+        self.assertEqual(
+            self.status_of(self.delayed), StatusChoices.PAID.value
+        )
+
+    def test_paid_payment_is_notified_once(self, mock_ids, mock_queue):
+        mock_ids.return_value = {"paid@test.com": "42"}
+        self.receive(
+            stripe_event("evt_1", "checkout.session.completed", "cs_paid")
+        )
+        self.process()
+        self.receive(
+            stripe_event("evt_2", "checkout.session.completed", "cs_paid")
+        )
+
+        self.assertEqual(self.process(), 1)
+
+        mock_queue.assert_called_once()
+
+    def test_applied_events_are_purged(self, mock_ids, mock_queue):
+        self.receive(
+            stripe_event("evt_1", "checkout.session.expired", "cs_expired"),
+            stripe_event("evt_2", "checkout.session.expired", "cs_other"),
+        )
+        StripeEvent.objects.filter(event_id="evt_1").update(
+            processed_at=timezone.now() - timedelta(days=8)
+        )
+
+        self.assertEqual(purge_stripe_events(), 1)
+        self.assertEqual(StripeEvent.objects.get().event_id, "evt_2")
+
+    def release_hold(self, payment):
+        Payment.objects.filter(pk=payment.pk).update(
+            status=StatusChoices.EXPIRED.value
+        )
+        Borrowing.objects.filter(pk=payment.borrowing_id).update(
+            actual_return_date=date.today()
+        )
+
+    @patch("payments_service.tasks.refund_payment.delay")
+    def test_late_payment_takes_the_copy_again(
+        self, mock_refund, mock_ids, mock_queue
+    ):
+        mock_ids.return_value = {"paid@test.com": "42"}
+        self.release_hold(self.paid)
+        self.receive(
+            stripe_event("evt_1", "checkout.session.completed", "cs_paid")
+        )
+
+        self.process()
+
+        self.assertEqual(self.status_of(self.paid), StatusChoices.PAID.value)
+        self.borrowing.refresh_from_db()
+        self.assertIsNone(self.borrowing.actual_return_date)
+        self.borrowing.book.refresh_from_db()
+        self.assertEqual(self.borrowing.book.inventory, 9)
+        mock_queue.assert_called_once()
+        mock_refund.assert_not_called()
+
+    @patch("payments_service.tasks.refund_payment.delay")
+    def test_late_payment_is_refunded_when_out_of_stock(
+        self, mock_refund, mock_ids, mock_queue
+    ):
+        self.release_hold(self.paid)
+        Book.objects.filter(pk=self.borrowing.book_id).update(inventory=0)
+        self.receive(
+            stripe_event("evt_1", "checkout.session.completed", "cs_paid")
+        )
+        self.process()
+        self.receive(
+            stripe_event("evt_2", "checkout.session.completed", "cs_paid")
+        )
+        self.process()
+
+        self.assertEqual(
+            self.status_of(self.paid), StatusChoices.REFUNDED.value
+        )
+        self.borrowing.refresh_from_db()
+        self.assertIsNotNone(self.borrowing.actual_return_date)
+        mock_refund.assert_called_once_with(self.paid.id)
+        mock_queue.assert_not_called()
+
+    @patch("payments_service.tasks.get_stripe")
+    def test_refund_is_idempotent(self, mock_get_stripe, mock_ids, mock_queue):
+        stripe_module = mock_get_stripe.return_value
+        stripe_module.checkout.Session.retrieve.return_value.payment_intent = (
+            "pi_paid"
+        )
+
+        refund_payment.apply(args=(self.paid.id,))
+
+        stripe_module.checkout.Session.retrieve.assert_called_once_with(
+            "cs_paid"
+        )
+        stripe_module.Refund.create.assert_called_once_with(
+            payment_intent="pi_paid",
+            idempotency_key=f"payment-{self.paid.id}-refund",
+        )
+
+
+class ReconcilePaymentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = fake_stripe.make_server(port=0)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        stripe_module = get_stripe()
+        for name, value in (
+            ("api_base", f"http://127.0.0.1:{self.server.server_port}"),
+            ("api_key", "sk_test"),
+        ):
+            patcher = patch.object(stripe_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.now = int(time.time())
+        self.payments = {
+            session_id: create_pending_payment(
+                create_paid_borrowing(f"{session_id}@test.com"), session_id
+            )
+            for session_id in ("cs_paid", "cs_expired", "cs_open", "cs_old")
+        }
+        self.add_session("cs_paid", 300, "complete", "paid")
+        self.add_session("cs_expired", 200, "expired", "unpaid")
+        self.add_session("cs_open", 100, "open", "unpaid")
+        self.add_session("cs_unknown", 50, "complete", "paid")
+        self.add_session("cs_old", 3 * 24 * 3600, "complete", "paid")
+
+    def add_session(self, session_id, age, session_status, payment_status):
+        self.server.objects[session_id] = {
+            "id": session_id,
+            "object": "checkout.session",
+            "created": self.now - age,
+            "status": session_status,
+            "payment_status": payment_status,
+        }
+
+    def status_of(self, session_id):
+        self.payments[session_id].refresh_from_db()
+        return self.payments[session_id].status
+
+    def test_sessions_are_listed_in_pages_and_applied(self):
+        report = reconcile_payments(page_size=2)
+
+        self.assertEqual(report["sessions"], 4)
+        self.assertEqual(report["paid"], 1)
+        self.assertEqual(report["expired"], 1)
+        self.assertEqual(self.server.list_requests, 2)
+        self.assertEqual(self.status_of("cs_paid"), StatusChoices.PAID.value)
+        self.assertEqual(
+            self.status_of("cs_expired"), StatusChoices.EXPIRED.value
+        )
+        self.assertEqual(
+            self.status_of("cs_open"), StatusChoices.PENDING.value
+        )
+        self.assertEqual(self.status_of("cs_old"), StatusChoices.PENDING.value)
+
+    def test_next_run_starts_from_the_oldest_open_session(self):
+        reconcile_payments()
+        self.assertEqual(cache.get(RECONCILE_CHECKPOINT_KEY), self.now - 100)
+        self.server.objects["cs_open"].update(
+            status="complete", payment_status="paid"
+        )
+
+        report = reconcile_payments()
+
+        self.assertEqual(report["since"], self.now - 100)
+        self.assertEqual(report["sessions"], 2)
+        self.assertEqual(report["paid"], 1)
+        self.assertEqual(self.status_of("cs_open"), StatusChoices.PAID.value)
+        self.assertGreaterEqual(cache.get(RECONCILE_CHECKPOINT_KEY), self.now)
+
+    def test_concurrent_run_is_skipped(self):
+        cache.add(RECONCILE_LOCK_KEY, True)
+
+        self.assertIsNone(reconcile_payments())
+        self.assertEqual(self.server.list_requests, 0)
+
+
+class PaymentSuccessTests(TestCase):
+    def setUp(self):
+        self.borrowing = create_paid_borrowing("redirect@test.com")
+        self.payment = create_pending_payment(self.borrowing, "cs_test")
+        self.client = APIClient()
+        self.client.force_authenticate(self.borrowing.user)
+        self.url = reverse("payment:success-booking", args=[self.borrowing.id])
+
+    def test_reports_the_payment_status(self):
+        for payment_status, expected in (
+            (StatusChoices.PENDING.value, "pending"),
+            (StatusChoices.PAID.value, "success"),
+            (StatusChoices.EXPIRED.value, "error"),
+        ):
+            Payment.objects.filter(pk=self.payment.pk).update(
+                status=payment_status
+            )
+
+            response = self.client.get(self.url)
+
+            self.assertEqual(response.json()["status"], expected)
+
+    def test_other_users_borrowing_is_not_found(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="other@test.com", password="testpassword"
+            )
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@patch("payments_service.async_views.notify", new_callable=AsyncMock)
+@patch("payments_service.async_views.aget_telegram_id")
+@patch("payments_service.async_views.retrieve_checkout_session")
+class AsyncPaymentSuccessTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="async@test.com", password="testpassword"
+        )
+        book = Book.objects.create(
+            title="Async book", author="Author", inventory=10, daily_fee=2
+        )
+        self.borrowing = Borrowing.objects.create(
+            book=book,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=5),
+        )
+        self.payment = Payment.objects.create(
+            borrowing=self.borrowing, money_to_pay=10
+        )
+        Payment.objects.filter(pk=self.payment.pk).update(
+            status=StatusChoices.PENDING.value, session_id="cs_test"
+        )
+        self.url = reverse(
+            "payment:success-booking-async", args=[self.borrowing.id]
+        )
+        self.headers = {
+            "HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+
+    def test_paid_session_marks_payment_paid(
+        self, mock_session, mock_telegram_id, mock_notify
+    ):
+        mock_session.return_value = {"payment_status": "paid"}
+        mock_telegram_id.return_value = "42"
+
+        response = self.client.get(self.url, **self.headers)
+
+        self.assertEqual(response.json()["status"], "success")
+        mock_session.assert_awaited_once_with("cs_test")
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, StatusChoices.PAID.value)
+        telegram_id, message = mock_notify.await_args.args
+        self.assertEqual(telegram_id, "42")
+        self.assertIn("Async book", message)
+
+    def test_unpaid_session_is_not_confirmed(
+        self, mock_session, mock_telegram_id, mock_notify
+    ):
+        mock_session.return_value = {"payment_status": "unpaid"}
+
+        response = self.client.get(self.url, **self.headers)
+
+        self.assertEqual(response.json()["status"], "error")
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, StatusChoices.PENDING.value)
+        mock_notify.assert_not_awaited()
+
+    def test_other_users_borrowing_is_not_found(
+        self, mock_session, mock_telegram_id, mock_notify
+    ):
+        other = get_user_model().objects.create_user(
+            email="other@test.com", password="testpassword"
+        )
+
+        response = self.client.get(
+            self.url,
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        mock_session.assert_not_awaited()
+
+    def test_payment_confirmed_by_webhook_is_not_notified_again(
+        self, mock_session, mock_telegram_id, mock_notify
+    ):
+        Payment.objects.filter(pk=self.payment.pk).update(
+            status=StatusChoices.PAID.value
+        )
+
+        response = self.client.get(self.url, **self.headers)
+
+        self.assertEqual(response.json()["status"], "success")
+        mock_session.assert_not_awaited()
+        mock_notify.assert_not_awaited()
+
+
+@patch("payments_service.async_views.send_telegram_message")
+@patch("payments_service.async_views.asend_message")
+@patch("payments_service.async_views.get_async_rate_limiter")
+class AsyncNotifyTests(SimpleTestCase):
+    def test_sends_right_away_within_limits(
+        self, mock_limiter, mock_send, mock_task
+    ):
+        mock_limiter.return_value.acquire = AsyncMock(return_value=0)
+
+        asyncio.run(notify("42", "Hello"))
+
+        mock_send.assert_awaited_once_with("42", "Hello")
+        mock_task.delay.assert_not_called()
+
+    def test_queues_when_rate_limited(
+        self, mock_limiter, mock_send, mock_task
+    ):
+        mock_limiter.return_value.acquire = AsyncMock(return_value=0.5)
+
+        asyncio.run(notify("42", "Hello"))
+
+        mock_send.assert_not_awaited()
+        mock_task.delay.assert_called_once_with("42", "Hello")
+
+    def test_queues_when_sending_fails(
+        self, mock_limiter, mock_send, mock_task
+    ):
+        mock_limiter.return_value.acquire = AsyncMock(return_value=0)
+        mock_send.side_effect = TelegramError("Bad Gateway", retry_after=0)
+
+        asyncio.run(notify("42", "Hello"))
+
+        mock_task.delay.assert_called_once_with("42", "Hello")
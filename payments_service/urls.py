@@ -1,11 +1,23 @@
 from django.urls import path
-from payments_service.views import payment_success
+from payments_service import async_views
+from payments_service.views import (
+    PaymentDetailView,
+    payment_success,
+    stripe_webhook,
+)
 
 
 app_name = "payment"
 
 urlpatterns = [
+    path("<int:pk>/", PaymentDetailView.as_view(), name="payment-detail"),
+    path("webhook/", stripe_webhook, name="stripe-webhook"),
     path(
         "<int:borrowing_id>/success/", payment_success, name="success-booking"
     ),
+    path(
+        "<int:borrowing_id>/success/async/",
+        async_views.payment_success,
+        name="success-booking-async",
+    ),
 ]
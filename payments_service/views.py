@@ -1,43 +1,118 @@
-import os
+import json
 
-import stripe
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions, generics
 from rest_framework.decorators import api_view
+from rest_framework.permissions import IsAuthenticated
 
-from telegram_bot.main import send_notification
-from telegram_bot.redis_client import get_telegram_id
-from borrowing_service.models import Borrowing
+from core.clients import get_stripe
+from payments_service.models import Payment, StatusChoices, StripeEvent
+from payments_service.serializers import PaymentSerializer
+from payments_service.tasks import STRIPE_EVENTS, schedule_stripe_events
 
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+SIGNATURE_HEADER = "Stripe-Signature"
 
 
 @api_view(["GET"])
 def payment_success(request, borrowing_id):
-    borrowing = get_object_or_404(Borrowing, id=borrowing_id)
-    book = borrowing.book
-    email = borrowing.user.email
+    """
+    The page Stripe redirects to after the checkout. Payments are
+    confirmed by the Stripe webhook, so it only reports their status.
+    """
+    payments = Payment.objects.filter(borrowing_id=borrowing_id)
+    if not request.user.is_superuser:
+        payments = payments.filter(borrowing__user=request.user)
 
-    telegram_id = get_telegram_id(email)
+    payment_status = (
+        payments.order_by("-id").values_list("status", flat=True).first()
+    )
+    if payment_status is None:
+        raise exceptions.NotFound()
 
-    if not telegram_id:
+    if payment_status == StatusChoices.PAID.value:
+        return JsonResponse(
+            {"status": "success", "message": "Booking successfully completed!"}
+        )
+    if payment_status == StatusChoices.EXPIRED.value:
+        return JsonResponse(
+            {"status": "error", "message": "The payment session expired."}
+        )
+    if payment_status == StatusChoices.REFUNDED.value:
         return JsonResponse(
             {
                 "status": "error",
-                "message": "Unable to find Telegram ID of user.",
+                "message": "The book was out of stock, payment refunded.",
             }
         )
-
-    message = (
-        f"📚 You have successfully booked the book: {book.title}\n"
-        f"Booking date: {borrowing.borrow_date}\n"
-        f"Expected return date: {borrowing.expected_return_date}.\n"
-        f"Thank you for your payment! Enjoy reading! 😊"
+    return JsonResponse(
+        {"status": "pending", "message": "The payment is being confirmed."}
     )
 
-    send_notification(telegram_id, message)
 
-    return JsonResponse(
-        {"status": "success", "message": "Booking successfully completed!"}
-    )
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """
+    Receives checkout session events from Stripe. Events are verified,
+    stored once per event id and acknowledged; the status changes and
+    notifications are left to `process_stripe_events`.
+    """
+    secret = settings.STRIPE_WEBHOOK_SECRET
+    if not secret:
+        return HttpResponseForbidden()
+
+    stripe = get_stripe()
+    try:
+        payload = request.body.decode()
+        stripe.WebhookSignature.verify_header(
+            payload,
+            request.headers.get(SIGNATURE_HEADER, ""),
+            secret,
+            settings.STRIPE_WEBHOOK_TOLERANCE,
+        )
+        event = json.loads(payload)
+        if event["type"] not in STRIPE_EVENTS:
+            return HttpResponse()
+        session = event["data"]["object"]
+        event = StripeEvent(
+            event_id=event["id"],
+            type=event["type"],
+            session_id=session["id"],
+            payment_status=session.get("payment_status") or "",
+        )
+    except (
+        stripe.SignatureVerificationError,
+        ValueError,
+        KeyError,
+        TypeError,
+    ):
+        return HttpResponseBadRequest()
+
+    # Redeliveries of stored events are acknowledged without a change.
+    StripeEvent.objects.bulk_create([event], ignore_conflicts=True)
+    schedule_stripe_events()
+    return HttpResponse()
+
+
+class PaymentDetailView(generics.RetrieveAPIView):
+    """
+    Lets clients poll a payment until its checkout session is ready.
+    """
+
+    serializer_class = PaymentSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        queryset = Payment.objects.all()
+        if self.request.user.is_superuser:
+            return queryset
+        return queryset.filter(borrowing__user=self.request.user)
@@ -0,0 +1,79 @@
+from django.conf import settings
+
+from core.async_clients import get_http_client
+from notifications_service.utils import telegram_error
+
+
+async def call(method, params, http_timeout=None):
+    """
+    Calls a Telegram Bot API method over the shared async HTTP client
+    and returns its result.
+    """
+    response = await get_http_client().post(
+        f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_TOKEN}/{method}",
+        json=params,
+        timeout=http_timeout or settings.ASYNC_HTTP_TIMEOUT,
+    )
+    if response.is_success:
+        return response.json()["result"]
+    raise telegram_error(
+        response.status_code, response.reason_phrase, response
+    )
+
+
+def keyboard(*rows):
+    """
+    Inline keyboard of rows of (text, callback_data) buttons.
+    """
+    return {
+        "inline_keyboard": [
+            [{"text": text, "callback_data": data} for text, data in row]
+            for row in rows
+        ]
+    }
+
+
+async def send_message(chat_id, text, reply_markup=None):
+    params = {"chat_id": chat_id, "text": text}
+    if reply_markup:
+        params["reply_markup"] = reply_markup
+    return await call("sendMessage", params)
+
+
+async def answer_callback_query(callback_query_id):
+    return await call(
+        "answerCallbackQuery", {"callback_query_id": callback_query_id}
+    )
+
+
+async def get_updates(offset=None):
+    """
+    Long polls for updates after `offset`, confirming the earlier ones.
+    """
+    return await call(
+        "getUpdates",
+        {
+            "offset": offset,
+            "timeout": settings.TELEGRAM_POLL_TIMEOUT,
+            "allowed_updates": ["message", "callback_query"],
+        },
+        http_timeout=(
+            settings.TELEGRAM_POLL_TIMEOUT + settings.ASYNC_HTTP_TIMEOUT
+        ),
+    )
+
+
+async def set_webhook(url, secret_token):
+    return await call(
+        "setWebhook",
+        {
+            "url": url,
+            "secret_token": secret_token,
+            "max_connections": settings.TELEGRAM_BOT_CONCURRENCY,
+            "allowed_updates": ["message", "callback_query"],
+        },
+    )
+
+
+async def delete_webhook():
+    return await call("deleteWebhook", {})
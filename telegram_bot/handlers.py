@@ -0,0 +1,231 @@
+import uuid
+
+import httpx
+
+from telegram_bot import api, library
+from telegram_bot.redis_client import (
+    aclear_state,
+    aget_session,
+    aget_state,
+    asave_session,
+    aset_state,
+)
+
+
+MENU = api.keyboard(
+    [("🔍 Search for a book", "get_book_info"), ("📚 My books", "my_books")]
+)
+BACK_TO_MENU = api.keyboard([("🏠 Back to menu", "menu")])
+LIBRARY_UNAVAILABLE = "The library is not available, try again later."
+
+
+async def handle_update(update):
+    """
+    Handles one Telegram update. The conversation step of the chat
+    is kept in Redis, so consecutive messages may reach any replica.
+    """
+    if "callback_query" in update:
+        await handle_callback(update["callback_query"])
+        return
+
+    message = update.get("message")
+    if not message or "text" not in message:
+        return
+
+    telegram_id = message["chat"]["id"]
+    text = message["text"].strip()
+    if text == "/start":
+        await start(telegram_id)
+        return
+
+    state = await aget_state(telegram_id)
+    step = STEPS.get(state.pop("step", None))
+    if step is None:
+        return
+    try:
+        await step(telegram_id, text, **state)
+    except httpx.HTTPError:
+        await api.send_message(telegram_id, LIBRARY_UNAVAILABLE)
+
+
+async def handle_callback(callback):
+    await api.answer_callback_query(callback["id"])
+    telegram_id = callback["message"]["chat"]["id"]
+    data = callback.get("data", "")
+
+    if data == "menu":
+        await aclear_state(telegram_id)
+        await show_menu(telegram_id)
+    elif data == "get_book_info":
+        await aset_state(telegram_id, "search")
+        await api.send_message(
+            telegram_id, "Enter the title of the book to search:"
+        )
+    elif data == "my_books":
+        try:
+            await show_my_books(telegram_id)
+        except httpx.HTTPError:
+            await api.send_message(telegram_id, LIBRARY_UNAVAILABLE)
+    elif data.startswith("book_"):
+        # A redelivered or resent date reuses the key of the booking.
+        await aset_state(
+            telegram_id,
+            "return_date",
+            book_id=data[5:],
+            booking_key=uuid.uuid4().hex,
+        )
+        await api.send_message(
+            telegram_id, "Please enter the book return date (YYYY-MM-DD):"
+        )
+
+
+# ======= Authorization =======
+
+
+async def start(telegram_id):
+    """
+    The /start command checks user authorization.
+    """
+    if await aget_session(telegram_id):
+        await aclear_state(telegram_id)
+        await api.send_message(telegram_id, "✅ You are already logged in!")
+        await show_menu(telegram_id)
+    else:
+        await aset_state(telegram_id, "email")
+        await api.send_message(
+            telegram_id, "👋 Welcome! Please log in. Enter your email:"
+        )
+
+
+async def process_email(telegram_id, text):
+    await aset_state(telegram_id, "password", email=text)
+    await api.send_message(telegram_id, "Enter your password:")
+
+
+async def process_password(telegram_id, text, email):
+    tokens = await library.obtain_tokens(email, text)
+    if tokens is None:
+        await aset_state(telegram_id, "email")
+        await api.send_message(
+            telegram_id,
+            "Authorization error. Check your details and try again.\n"
+            "Enter your email:",
+        )
+        return
+
+    await asave_session(
+        telegram_id, email, tokens["access"], tokens["refresh"]
+    )
+    await aclear_state(telegram_id)
+    await api.send_message(telegram_id, "Authorization successful! Welcome!")
+    await show_menu(telegram_id)
+
+
+# ======= Menu =======
+
+
+async def show_menu(telegram_id):
+    await api.send_message(
+        telegram_id, "Here's what I can do for you:", reply_markup=MENU
+    )
+
+
+async def process_book_search(telegram_id, text):
+    book = await library.search_book(text)
+    if book is None:
+        await api.send_message(
+            telegram_id,
+            "Book not found. Try again:",
+            reply_markup=BACK_TO_MENU,
+        )
+        return
+
+    await aclear_state(telegram_id)
+    await api.send_message(
+        telegram_id,
+        f"Title: {book['title']}\nAuthor: {book['author']}\n"
+        f"In stock: {book['inventory']}\n"
+        f"Daily price: {book['daily_fee']}",
+        reply_markup=api.keyboard([("📖 Book now", f"book_{book['id']}")]),
+    )
+
+
+async def show_my_books(telegram_id):
+    try:
+        borrowings = await library.active_borrowings(telegram_id)
+    except library.NotLoggedIn:
+        await ask_to_log_in(telegram_id)
+        return
+
+    if not borrowings:
+        await api.send_message(telegram_id, "You have no active bookings.")
+        return
+
+    await api.send_message(
+        telegram_id,
+        "\n\n".join(
+            f"Book: {borrowing['book']}\n"
+            f"Booking Date: {borrowing['borrow_date']}\n"
+            f"Expected Return Date: {borrowing['expected_return_date']}"
+            for borrowing in borrowings
+        ),
+    )
+
+
+# ======= Booking a book =======
+
+
+async def process_booking_date(telegram_id, text, book_id, booking_key=None):
+    """
+    Processes the return date and reserves the book.
+    """
+    try:
+        response = await library.create_borrowing(
+            telegram_id, int(book_id), text, booking_key or uuid.uuid4().hex
+        )
+    except library.NotLoggedIn:
+        await ask_to_log_in(telegram_id)
+        return
+    except httpx.HTTPError as error:
+        await api.send_message(telegram_id, f"Error during booking: {error}")
+        return
+
+    if not response.is_success:
+        await api.send_message(
+            telegram_id,
+            f"Booking Error: {describe_error(response)}\nTry again:",
+        )
+        return
+
+    await aclear_state(telegram_id)
+    await api.send_message(
+        telegram_id, "📖 The book is booked! Check the payment link."
+    )
+
+
+def describe_error(response):
+    try:
+        errors = response.json()
+    except ValueError:
+        return response.reason_phrase
+    if isinstance(errors, dict):
+        errors = errors.values()
+    return " ".join(
+        " ".join(map(str, error)) if isinstance(error, list) else str(error)
+        for error in errors
+    )
+
+
+async def ask_to_log_in(telegram_id):
+    await aclear_state(telegram_id)
+    await api.send_message(
+        telegram_id, "Your session has expired. Send /start to log in."
+    )
+
+
+STEPS = {
+    "email": process_email,
+    "password": process_password,
+    "search": process_book_search,
+    "return_date": process_booking_date,
+}
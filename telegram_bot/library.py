@@ -0,0 +1,115 @@
+from django.conf import settings
+
+from core.async_clients import get_http_client
+from telegram_bot.redis_client import aget_session, asave_session
+
+
+class NotLoggedIn(Exception):
+    pass
+
+
+def url(path):
+    return f"{settings.LIBRARY_API_URL}{path}"
+
+
+async def obtain_tokens(email, password):
+    """
+    Returns {"access", "refresh"} or None when the credentials are wrong.
+    """
+    response = await get_http_client().post(
+        url("/users/token/"), json={"email": email, "password": password}
+    )
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+
+async def refresh_session(telegram_id, session):
+    """
+    Returns the session with a new access token or None.
+    """
+    response = await get_http_client().post(
+        url("/users/token/refresh/"), json={"refresh": session["refresh"]}
+    )
+    if response.status_code != 200:
+        return None
+    access = response.json()["access"]
+    await asave_session(
+        telegram_id, session["email"], access, session["refresh"]
+    )
+    return {**session, "access": access}
+
+
+async def request(telegram_id, method, path, headers=None, **kwargs):
+    """
+    Calls the library API as the user logged in to the chat,
+    refreshing the access token once when it has expired.
+    """
+    session = await aget_session(telegram_id)
+    if session is None:
+        raise NotLoggedIn()
+
+    async def send(access):
+        return await get_http_client().request(
+            method,
+            url(path),
+            headers={"Authorization": f"Bearer {access}", **(headers or {})},
+            **kwargs,
+        )
+
+    response = await send(session["access"])
+    if response.status_code != 401:
+        return response
+
+    # Another replica may have refreshed the token already.
+    latest = await aget_session(telegram_id)
+    if latest is not None and latest["access"] == session["access"]:
+        latest = await refresh_session(telegram_id, latest)
+    if latest is None:
+        raise NotLoggedIn()
+    return await send(latest["access"])
+
+
+async def search_book(title):
+    """
+    Returns the details of the best match of the book search or None.
+    """
+    client = get_http_client()
+    response = await client.get(
+        url("/books/search/"), params={"q": title, "limit": 1}
+    )
+    response.raise_for_status()
+    results = response.json()["results"]
+    if not results:
+        return None
+
+    response = await client.get(url(f"/books/{results[0]['id']}/"))
+    response.raise_for_status()
+    return response.json()
+
+
+async def active_borrowings(telegram_id):
+    response = await request(
+        telegram_id,
+        "GET",
+        "/borrowings/",
+        params={"is_active": "true", "pagination": "cursor"},
+    )
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+async def create_borrowing(
+    telegram_id, book_id, expected_return_date, idempotency_key
+):
+    """
+    Returns the response so the caller can show validation errors.
+    Repeating the key never books the book twice.
+    """
+    return await request(
+        telegram_id,
+        "POST",
+        "/borrowings/",
+        headers={"Idempotency-Key": idempotency_key},
+        json={"book": book_id, "expected_return_date": expected_return_date},
+    )
@@ -0,0 +1,103 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from telegram_bot import redis_client as store
+from telegram_bot.redis_client import redis_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares reads of the bot session store with the previous "
+        "one-key-per-value layout against the local Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=200,
+            help="Users per lookup of the batch notifications.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            redis_client.ping()
+        except Exception as error:
+            raise CommandError(f"Redis is not available: {error}")
+
+        users = [
+            (f"bench-store-{index}@example.com", str(9_000_000 + index))
+            for index in range(options["users"])
+        ]
+        emails = [email for email, _ in users]
+        telegram_ids = [telegram_id for _, telegram_id in users]
+        batches = [
+            emails[start : start + options["batch"]]
+            for start in range(0, len(emails), options["batch"])
+        ]
+
+        pipeline = redis_client.pipeline(transaction=False)
+        for email, telegram_id in users:
+            pipeline.set(f"telegram_id:{email}", telegram_id)
+            pipeline.set(f"jwt:{telegram_id}", "token", ex=3600)
+        pipeline.execute()
+        for email, telegram_id in users:
+            store.save_session(telegram_id, email, "token", "refresh")
+
+        try:
+            self.compare(
+                "token by chat",
+                len(users),
+                legacy=lambda: [
+                    self.legacy_token(telegram_id)
+                    for telegram_id in telegram_ids
+                ],
+                current=lambda: [
+                    store.get_jwt_token(telegram_id)
+                    for telegram_id in telegram_ids
+                ],
+            )
+            self.compare(
+                "telegram ids in batches",
+                len(users),
+                legacy=lambda: [self.legacy_ids(batch) for batch in batches],
+                current=lambda: [
+                    store.get_telegram_ids(batch) for batch in batches
+                ],
+            )
+        finally:
+            pipeline = redis_client.pipeline(transaction=False)
+            for email, telegram_id in users:
+                pipeline.delete(
+                    f"telegram_id:{email}",
+                    f"jwt:{telegram_id}",
+                    store.user_key(email),
+                    store.session_key(telegram_id),
+                )
+            pipeline.execute()
+
+    def legacy_token(self, telegram_id):
+        key = f"jwt:{telegram_id}"
+        if redis_client.exists(key):
+            return redis_client.get(key).decode()
+        return None
+
+    def legacy_ids(self, emails):
+        result = {}
+        for email in emails:
+            value = redis_client.get(f"telegram_id:{email}")
+            if value:
+                result[email] = value.decode()
+        return result
+
+    def compare(self, name, count, legacy, current):
+        for label, run in (("previous", legacy), ("redis", current)):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{name}, {label}: {count / elapsed:.0f} users/s, "
+                f"{elapsed / count * 1_000_000:.1f}us per user"
+            )
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from telegram_bot.redis_client import (
+    redis_client,
+    session_key,
+    user_key,
+)
+
+
+OLD_USER_PREFIX = "telegram_id:"
+OLD_TOKEN_PREFIX = "jwt:"
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the telegram_id:{email} and jwt:{telegram_id} keys "
+        "to the tg_user and tg_session keys and deletes them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch = []
+        migrated = 0
+        for key in redis_client.scan_iter(
+            match=f"{OLD_USER_PREFIX}*", count=options["batch_size"]
+        ):
+            batch.append(key)
+            if len(batch) >= options["batch_size"]:
+                migrated += self.migrate(batch)
+                batch = []
+        if batch:
+            migrated += self.migrate(batch)
+
+        self.stdout.write(f"Migrated {migrated} users.")
+
+    def migrate(self, keys):
+        emails = [key.decode()[len(OLD_USER_PREFIX) :] for key in keys]
+        telegram_ids = [
+            value.decode() if value else None
+            for value in redis_client.mget(keys)
+        ]
+
+        pipeline = redis_client.pipeline(transaction=False)
+        for telegram_id in telegram_ids:
+            pipeline.get(f"{OLD_TOKEN_PREFIX}{telegram_id}")
+            pipeline.ttl(f"{OLD_TOKEN_PREFIX}{telegram_id}")
+        results = pipeline.execute()
+
+        pipeline = redis_client.pipeline(transaction=False)
+        for email, telegram_id, token, ttl in zip(
+            emails, telegram_ids, results[::2], results[1::2]
+        ):
+            if telegram_id is None:
+                continue
+            pipeline.set(user_key(email), telegram_id)
+            if token and ttl > 0:
+                pipeline.hset(
+                    session_key(telegram_id),
+                    mapping={"email": email, "access": token, "refresh": ""},
+                )
+                pipeline.expire(session_key(telegram_id), ttl)
+            pipeline.delete(f"{OLD_TOKEN_PREFIX}{telegram_id}")
+        pipeline.delete(*keys)
+        pipeline.execute()
+        return sum(1 for telegram_id in telegram_ids if telegram_id)
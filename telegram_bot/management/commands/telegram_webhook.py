@@ -0,0 +1,47 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.async_clients import close_clients
+from notifications_service.utils import TelegramError
+from telegram_bot import api
+
+
+class Command(BaseCommand):
+    help = (
+        "Points the bot's updates at the webhook, e.g. "
+        "https://<host>/api/telegram/webhook/, or back to polling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", nargs="?")
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Remove the webhook so telegram_bot/main.py can poll.",
+        )
+
+    def handle(self, *args, **options):
+        if options["delete"]:
+            call = api.delete_webhook()
+        elif not options["url"]:
+            raise CommandError("Pass the webhook URL or --delete.")
+        elif not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise CommandError("Set TELEGRAM_WEBHOOK_SECRET first.")
+        else:
+            call = api.set_webhook(
+                options["url"], settings.TELEGRAM_WEBHOOK_SECRET
+            )
+
+        try:
+            asyncio.run(self.run(call))
+        except TelegramError as error:
+            raise CommandError(f"Telegram refused: {error}")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    async def run(self, call):
+        try:
+            await call
+        finally:
+            await close_clients()
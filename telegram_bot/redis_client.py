@@ -1,38 +1,170 @@
 import redis
-import os
+from django.conf import settings
+
+from core.async_clients import get_redis
+from core.pools import redis_pool
+
+
+redis_client = redis.StrictRedis(connection_pool=redis_pool)
+
+# tg_session:{telegram_id} is a hash with the email and the tokens of the
+# user logged in to the bot in that chat, and tg_user:{email} points back
+# to the chat so notifications can find it.
+SESSION_KEY_PREFIX = "tg_session:"
+USER_KEY_PREFIX = "tg_user:"
+# tg_state:{telegram_id} is a hash with the conversation step of the chat
+# and its data, so any bot replica can handle the next message.
+STATE_KEY_PREFIX = "tg_state:"
+
+# Links the chat to the user in one round trip and drops the links
+# of a previous user of the chat and of a previous chat of the user.
+SAVE_SESSION_SCRIPT = """
+local old_email = redis.call("HGET", KEYS[1], "email")
+if old_email and old_email ~= ARGV[2] then
+    local old_user_key = ARGV[7] .. old_email
+    if redis.call("GET", old_user_key) == ARGV[1] then
+        redis.call("DEL", old_user_key)
+    end
+end
+local old_chat = redis.call("GET", KEYS[2])
+if old_chat and old_chat ~= ARGV[1] then
+    redis.call("DEL", ARGV[6] .. old_chat)
+end
+redis.call("DEL", KEYS[1])
+redis.call(
+    "HSET", KEYS[1], "email", ARGV[2], "access", ARGV[3], "refresh", ARGV[4]
+)
+redis.call("EXPIRE", KEYS[1], ARGV[5])
+redis.call("SET", KEYS[2], ARGV[1])
+"""
 
+save_session_script = redis_client.register_script(SAVE_SESSION_SCRIPT)
 
-redis_client = redis.StrictRedis.from_url(
-    os.getenv("REDIS_URL")
-)
+
+def session_key(telegram_id):
+    return f"{SESSION_KEY_PREFIX}{telegram_id}"
+
+
+def user_key(email):
+    return f"{USER_KEY_PREFIX}{email}"
+
+
+def state_key(telegram_id):
+    return f"{STATE_KEY_PREFIX}{telegram_id}"
+
+
+def decode_hash(data):
+    return {key.decode(): value.decode() for key, value in data.items()}
+
+
+def session_script_args(telegram_id, email, access, refresh):
+    lifetime = settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"]
+    return {
+        "keys": (session_key(telegram_id), user_key(email)),
+        "args": (
+            telegram_id,
+            email,
+            access,
+            refresh,
+            int(lifetime.total_seconds()),
+            SESSION_KEY_PREFIX,
+            USER_KEY_PREFIX,
+        ),
+    }
+
+
+def save_session(telegram_id, email, access, refresh=""):
+    telegram_id = str(telegram_id)
+    save_session_script(
+        **session_script_args(telegram_id, email, access, refresh)
+    )
+
+
+async def asave_session(telegram_id, email, access, refresh=""):
+    telegram_id = str(telegram_id)
+    script = get_redis().register_script(SAVE_SESSION_SCRIPT)
+    await script(**session_script_args(telegram_id, email, access, refresh))
+
+
+def get_session(telegram_id):
+    """
+    Returns {"email", "access", "refresh"} of the chat or None.
+    Sessions are not cached in the process: a chat can be linked
+    to another user by any bot replica at any time.
+    """
+    return decode_hash(redis_client.hgetall(session_key(telegram_id))) or None
+
+
+async def aget_session(telegram_id):
+    data = await get_redis().hgetall(session_key(telegram_id))
+    return decode_hash(data) or None
+
+
+def delete_session(telegram_id):
+    """
+    Logs the chat out. The user stays linked to the chat for notifications.
+    """
+    redis_client.delete(session_key(telegram_id))
+
+
+async def adelete_session(telegram_id):
+    await get_redis().delete(session_key(telegram_id))
+
+
+def get_jwt_token(telegram_id):
+    session = get_session(telegram_id)
+    return session["access"] if session else None
 
 
 def save_telegram_id(email, telegram_id):
-    redis_client.set(f"telegram_id:{email}", telegram_id)
+    redis_client.set(user_key(email), telegram_id)
 
 
 def get_telegram_id(email):
-    telegram_id = redis_client.get(f"telegram_id:{email}")
+    return get_telegram_ids([email]).get(email)
 
-    return telegram_id.decode("utf-8") if telegram_id else None
 
+async def aget_telegram_id(email):
+    value = await get_redis().get(user_key(email))
+    return value.decode() if value else None
 
-def delete_telegram_id(user_id):
-    redis_client.delete(f"telegram_id:{user_id}")
 
+def delete_telegram_id(email):
+    redis_client.delete(user_key(email))
 
-def save_jwt_token(telegram_id, jwt_token):
-    key = f"jwt:{telegram_id}"
-    redis_client.set(key, jwt_token, ex=3600 * 24 * 7)
 
+def get_telegram_ids(emails):
+    """
+    Returns {email: telegram_id} for the users that linked Telegram,
+    reading the ids in a single round trip. They are not cached in the
+    process, so a chat linked to another user is never notified for
+    the previous one.
+    """
+    emails = list(emails)
+    if not emails:
+        return {}
+    values = redis_client.mget([user_key(email) for email in emails])
+    return {
+        email: value.decode() for email, value in zip(emails, values) if value
+    }
 
 
-def get_jwt_token(telegram_id):
-    key = f"jwt:{telegram_id}"
+async def aget_state(telegram_id):
+    """
+    Returns the conversation step of the chat and its data, e.g.
+    {"step": "password", "email": "..."}, or {} outside a conversation.
+    """
+    return decode_hash(await get_redis().hgetall(state_key(telegram_id)))
+
+
+async def aset_state(telegram_id, step, **data):
+    key = state_key(telegram_id)
+    async with get_redis().pipeline(transaction=True) as pipeline:
+        pipeline.delete(key)
+        pipeline.hset(key, mapping={"step": step, **data})
+        pipeline.expire(key, settings.TELEGRAM_STATE_TTL)
+        await pipeline.execute()
 
-    return (
-        redis_client.get(key).decode("utf-8")
-        if redis_client.exists(key)
-        else None
-    )
 
+async def aclear_state(telegram_id):
+    await get_redis().delete(state_key(telegram_id))
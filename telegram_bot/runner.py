@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import weakref
+
+import httpx
+from django.conf import settings
+
+from core.async_clients import close_clients
+from notifications_service.utils import TelegramError
+from telegram_bot import api
+from telegram_bot.handlers import handle_update
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_id(update):
+    if "callback_query" in update:
+        return update["callback_query"]["message"]["chat"]["id"]
+    return update.get("message", {}).get("chat", {}).get("id")
+
+
+class UpdateRunner:
+    """
+    Handles up to `concurrency` updates at once, one at a time per chat
+    so the steps of a conversation stay in order.
+    """
+
+    def __init__(self, handler=handle_update, concurrency=None):
+        self.handler = handler
+        self.concurrency = concurrency or settings.TELEGRAM_BOT_CONCURRENCY
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.chat_locks = weakref.WeakValueDictionary()
+        self.tasks = set()
+
+    async def submit(self, update):
+        # Stop reading updates while too many of them are waiting.
+        while len(self.tasks) >= self.concurrency * 4:
+            await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        lock = self.chat_locks.setdefault(get_chat_id(update), asyncio.Lock())
+        task = asyncio.create_task(self.run(update, lock))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, update, lock):
+        async with lock, self.semaphore:
+            try:
+                await self.handler(update)
+            except Exception:
+                logger.exception("Update %s failed", update.get("update_id"))
+
+    async def join(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
+
+
+async def poll(runner):
+    """
+    Long polls Telegram for updates and hands them to the runner.
+    Only one process may poll a bot token; use the webhook to scale out.
+    """
+    offset = None
+    while True:
+        try:
+            updates = await api.get_updates(offset)
+        except TelegramError as error:
+            if error.retry_after is None:
+                raise
+            await asyncio.sleep(error.retry_after or 1)
+            continue
+        except httpx.HTTPError as error:
+            logger.warning("Polling failed: %s", error)
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            offset = update["update_id"] + 1
+            await runner.submit(update)
+
+
+async def run_polling():
+    runner = UpdateRunner()
+    try:
+        await poll(runner)
+    finally:
+        await runner.join()
+        await close_clients()
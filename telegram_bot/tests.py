@@ -0,0 +1,296 @@
+import asyncio
+import json
+from unittest import skipUnless
+from unittest.mock import ANY, AsyncMock, patch
+
+import httpx
+import redis
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core.async_clients import close_clients
+from telegram_bot import library
+from telegram_bot import redis_client as store
+from telegram_bot.handlers import MENU, handle_update
+from telegram_bot.redis_client import redis_client
+from telegram_bot.runner import UpdateRunner
+
+
+def redis_available():
+    try:
+        return redis_client.ping()
+    except (redis.RedisError, ValueError):
+        return False
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_clients()
+
+    return asyncio.run(main())
+
+
+def message(telegram_id, text):
+    return {"message": {"chat": {"id": telegram_id}, "text": text}}
+
+
+def callback(telegram_id, data):
+    return {
+        "callback_query": {
+            "id": "1",
+            "data": data,
+            "message": {"chat": {"id": telegram_id}},
+        }
+    }
+
+
+class TelegramIdLookupTests(SimpleTestCase):
+    @patch.object(redis_client, "mget", return_value=[b"2", None])
+    def test_reads_ids_in_one_round_trip(self, mock_mget):
+        result = store.get_telegram_ids(
+            ["linked@test.com", "unlinked@test.com"]
+        )
+
+        self.assertEqual(result, {"linked@test.com": "2"})
+        mock_mget.assert_called_once_with(
+            ["tg_user:linked@test.com", "tg_user:unlinked@test.com"]
+        )
+
+    @patch.object(redis_client, "mget")
+    def test_no_emails_skip_redis(self, mock_mget):
+        self.assertEqual(store.get_telegram_ids([]), {})
+        mock_mget.assert_not_called()
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+class SessionStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = [
+            store.session_key(telegram_id) for telegram_id in ("10", "20")
+        ] + [store.user_key(email) for email in ("a@test.com", "b@test.com")]
+        redis_client.delete(*self.keys)
+
+    def tearDown(self):
+        redis_client.delete(*self.keys)
+
+    def test_session_round_trip(self):
+        store.save_session(10, "a@test.com", "access", "refresh")
+
+        self.assertEqual(
+            store.get_session(10),
+            {"email": "a@test.com", "access": "access", "refresh": "refresh"},
+        )
+        self.assertEqual(store.get_jwt_token("10"), "access")
+        self.assertEqual(store.get_telegram_id("a@test.com"), "10")
+        self.assertGreater(redis_client.ttl(store.session_key(10)), 0)
+
+    def test_new_chat_replaces_previous_chat_of_user(self):
+        store.save_session(10, "a@test.com", "old")
+        store.save_session(20, "a@test.com", "new")
+
+        self.assertIsNone(store.get_session(10))
+        self.assertEqual(store.get_jwt_token(20), "new")
+        self.assertEqual(store.get_telegram_id("a@test.com"), "20")
+
+    def test_new_user_in_chat_unlinks_previous_user(self):
+        store.save_session(10, "a@test.com", "first")
+        store.save_session(10, "b@test.com", "second")
+
+        self.assertEqual(store.get_telegram_ids(["a@test.com"]), {})
+        self.assertEqual(store.get_telegram_id("b@test.com"), "10")
+        self.assertEqual(store.get_session(10)["email"], "b@test.com")
+
+    def test_relink_in_another_process_is_seen_at_once(self):
+        store.save_session(10, "a@test.com", "first")
+        self.assertEqual(store.get_telegram_id("a@test.com"), "10")
+        self.assertEqual(store.get_session(10)["email"], "a@test.com")
+
+        # Another bot replica links the chat to another user.
+        store.save_session_script(
+            **store.session_script_args("10", "b@test.com", "second", "")
+        )
+
+        self.assertIsNone(store.get_telegram_id("a@test.com"))
+        self.assertEqual(store.get_telegram_id("b@test.com"), "10")
+        self.assertEqual(store.get_session(10)["email"], "b@test.com")
+
+    def test_logout_keeps_notifications(self):
+        store.save_session(10, "a@test.com", "access")
+
+        store.delete_session(10)
+
+        self.assertIsNone(store.get_jwt_token(10))
+        self.assertEqual(store.get_telegram_id("a@test.com"), "10")
+
+
+class UpdateRunnerTests(SimpleTestCase):
+    def test_chats_are_handled_concurrently_and_in_order(self):
+        events = []
+
+        async def handler(update):
+            chat = update["message"]["chat"]["id"]
+            events.append(("start", chat, update["message"]["text"]))
+            await asyncio.sleep(0.01)
+            events.append(("end", chat, update["message"]["text"]))
+
+        async def main():
+            runner = UpdateRunner(handler, concurrency=4)
+            for update in (message(1, "a"), message(1, "b"), message(2, "c")):
+                await runner.submit(update)
+            await runner.join()
+
+        asyncio.run(main())
+
+        self.assertEqual(events[:2], [("start", 1, "a"), ("start", 2, "c")])
+        self.assertLess(
+            events.index(("end", 1, "a")), events.index(("start", 1, "b"))
+        )
+
+    def test_failed_update_does_not_stop_the_runner(self):
+        handled = []
+
+        async def handler(update):
+            if update["message"]["text"] == "boom":
+                raise ValueError("boom")
+            handled.append(update["message"]["text"])
+
+        async def main():
+            runner = UpdateRunner(handler, concurrency=2)
+            await runner.submit(message(1, "boom"))
+            await runner.submit(message(1, "ok"))
+            await runner.join()
+
+        with self.assertLogs("telegram_bot.runner", "ERROR"):
+            asyncio.run(main())
+
+        self.assertEqual(handled, ["ok"])
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET="secret")
+@patch("telegram_bot.views.handle_update", new_callable=AsyncMock)
+class WebhookTests(SimpleTestCase):
+    def test_handles_update_with_secret(self, mock_handle):
+        response = self.client.post(
+            reverse("telegram:webhook"),
+            data=json.dumps(message(1, "/start")),
+            content_type="application/json",
+            headers={"X-Telegram-Bot-Api-Secret-Token": "secret"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        mock_handle.assert_awaited_once_with(message(1, "/start"))
+
+    def test_rejects_wrong_secret(self, mock_handle):
+        response = self.client.post(
+            reverse("telegram:webhook"),
+            data=json.dumps(message(1, "/start")),
+            content_type="application/json",
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+        )
+
+        self.assertEqual(response.status_code, 403)
+        mock_handle.assert_not_awaited()
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+@patch("telegram_bot.api.answer_callback_query", new_callable=AsyncMock)
+@patch("telegram_bot.api.send_message", new_callable=AsyncMock)
+class ConversationTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = [
+            store.session_key(10),
+            store.state_key(10),
+            store.user_key("a@test.com"),
+        ]
+        redis_client.delete(*self.keys)
+
+    def tearDown(self):
+        redis_client.delete(*self.keys)
+
+    @patch("telegram_bot.handlers.library.obtain_tokens")
+    def test_login_steps_are_kept_in_redis(
+        self, mock_tokens, mock_send, mock_answer
+    ):
+        mock_tokens.return_value = {"access": "access", "refresh": "refresh"}
+
+        run(handle_update(message(10, "/start")))
+        self.assertEqual(
+            redis_client.hget(store.state_key(10), "step"), b"email"
+        )
+        run(handle_update(message(10, "a@test.com")))
+        run(handle_update(message(10, "password")))
+
+        mock_tokens.assert_awaited_once_with("a@test.com", "password")
+        self.assertEqual(store.get_jwt_token(10), "access")
+        self.assertFalse(redis_client.exists(store.state_key(10)))
+        self.assertEqual(mock_send.await_args.kwargs["reply_markup"], MENU)
+
+    @patch("telegram_bot.handlers.library.create_borrowing")
+    def test_booking_uses_the_book_of_the_button(
+        self, mock_create, mock_send, mock_answer
+    ):
+        mock_create.return_value = httpx.Response(201, json={"id": 1})
+
+        run(handle_update(callback(10, "book_5")))
+        run(handle_update(message(10, "2025-01-20")))
+
+        mock_answer.assert_awaited_once_with("1")
+        mock_create.assert_awaited_once_with(10, 5, "2025-01-20", ANY)
+        self.assertIn("booked", mock_send.await_args.args[1])
+        self.assertFalse(redis_client.exists(store.state_key(10)))
+
+    @patch("telegram_bot.handlers.library.create_borrowing")
+    def test_booking_errors_keep_the_step(
+        self, mock_create, mock_send, mock_answer
+    ):
+        mock_create.return_value = httpx.Response(
+            400, json={"non_field_errors": ["Return date is in the past."]}
+        )
+
+        run(handle_update(callback(10, "book_5")))
+        run(handle_update(message(10, "2020-01-01")))
+
+        self.assertIn(
+            "Return date is in the past.", mock_send.await_args.args[1]
+        )
+        self.assertEqual(
+            redis_client.hget(store.state_key(10), "step"), b"return_date"
+        )
+
+
+@skipUnless(redis_available(), "Requires Redis.")
+class LibraryClientTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = [store.session_key(10), store.user_key("a@test.com")]
+        redis_client.delete(*self.keys)
+        store.save_session(10, "a@test.com", "expired", "refresh")
+        self.requests = []
+
+    def tearDown(self):
+        redis_client.delete(*self.keys)
+
+    def respond(self, request):
+        self.requests.append(request)
+        if request.url.path.endswith("/token/refresh/"):
+            return httpx.Response(200, json={"access": "fresh"})
+        if request.headers["Authorization"] == "Bearer fresh":
+            return httpx.Response(200, json={"results": []})
+        return httpx.Response(401)
+
+    def test_refreshes_expired_access_token_once(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.respond))
+
+        with patch(
+            "telegram_bot.library.get_http_client", return_value=client
+        ):
+            borrowings = run(library.active_borrowings(10))
+
+        self.assertEqual(borrowings, [])
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(
+            json.loads(self.requests[1].content), {"refresh": "refresh"}
+        )
+        self.assertEqual(store.get_session(10)["access"], "fresh")
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from telegram_bot.views import webhook
+
+
+app_name = "telegram"
+
+urlpatterns = [
+    path("webhook/", webhook, name="webhook"),
+]
@@ -0,0 +1,46 @@
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from telegram_bot.handlers import handle_update
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+@csrf_exempt
+@require_POST
+async def webhook(request):
+    """
+    Receives updates from Telegram. Every ASGI worker and replica
+    handles them concurrently, with the conversation state in Redis.
+    """
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    if not secret or not hmac.compare_digest(
+        request.headers.get(SECRET_HEADER, ""), secret
+    ):
+        return HttpResponseForbidden()
+
+    try:
+        update = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    # Telegram retries failed deliveries, which would repeat the
+    # messages already sent, so errors are only logged.
+    try:
+        await handle_update(update)
+    except Exception:
+        logger.exception("Update %s failed", update.get("update_id"))
+    return HttpResponse()